@@ -1,7 +1,7 @@
 import logging
 import os
 
-from goblet_gcp_client.client import get_default_project
+from goblet.client import get_default_project
 
 from googleapiclient.errors import HttpError
 
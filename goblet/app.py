@@ -2,16 +2,17 @@ import json
 import logging
 import os
 import sys
+from functools import partial
 from typing import List
 
-from goblet_gcp_client.client import get_default_project
-from google.cloud.logging.handlers import StructuredLogHandler
-from google.cloud.logging_v2.handlers import setup_logging
+from goblet.client import get_default_project
 
 import goblet.globals as g
+from goblet.asgi import serve
 from goblet.config import GConfig
 from goblet.decorators import Goblet_Decorators
-from goblet.resource_manager import Resource_Manager
+from goblet.deploy_graph import DeployGraph
+from goblet.resource_manager import Resource_Manager, request_state
 from goblet.alerts import AlertType
 
 logging.basicConfig()
@@ -55,7 +56,7 @@ class Goblet(Goblet_Decorators, Resource_Manager):
         )
         self.log = logging.getLogger(__name__)
         self.headers = {}
-        self.g = G()
+        self._g = G()
 
         # Setup Local
         module_name = GConfig(config).main_file or "main"
@@ -72,6 +73,9 @@ class Goblet(Goblet_Decorators, Resource_Manager):
             logging.basicConfig()
             self.log = logging.getLogger("werkzeug")
         elif not os.environ.get("X-GOBLET-DEPLOY"):
+            from google.cloud.logging.handlers import StructuredLogHandler
+            from google.cloud.logging_v2.handlers import setup_logging
+
             self.log.handlers.clear()
             handler = StructuredLogHandler(project_id=get_default_project())
             setup_logging(
@@ -82,6 +86,20 @@ class Goblet(Goblet_Decorators, Resource_Manager):
             )
             self.log = logging.getLogger(__name__)
 
+    async def asgi(self, scope, receive, send):
+        """ASGI entrypoint, for example `uvicorn main:app.asgi`"""
+        await serve(self, scope, receive, send)
+
+    @property
+    def g(self):
+        """G object local to the request being handled. Outside of a request the app level G object is returned"""
+        state = request_state.get()
+        if state is None:
+            return self._g
+        if state.g is None:
+            state.g = G()
+        return state.g
+
     def deploy(
         self,
         skip_handlers=False,
@@ -95,25 +113,9 @@ class Goblet(Goblet_Decorators, Resource_Manager):
         infras=None,
     ):
         g.config.update_g_config(values={"labels": self.labels})
-        source = None
         backend = self.backend
-
-        if infras or not skip_infra:
-            log.info("deploying infrastructure")
-            self.deploy_infrastructure(infras)
-
-        if not skip_alerts:
-            self.deploy_alerts(alert_type=AlertType.INFRA)
-
-        infra_config = self.get_infrastructure_config()
-        backend.update_config(infra_config, write_config, stage)
-
-        if not skip_backend:
-            log.info(f"preparing to deploy with backend {self.backend.resource_type}")
-            source = backend.deploy(force=force)
-
-        if not skip_alerts:
-            self.deploy_alerts(alert_type=AlertType.BACKEND)
+        deploy_handlers = handlers or not skip_handlers
+        source = {}
 
         registered_handlers = self.get_registered_handler_resource_types()
 
@@ -121,20 +123,83 @@ class Goblet(Goblet_Decorators, Resource_Manager):
         if (
             registered_handlers
             and skip_backend
-            and (handlers or not skip_handlers)
+            and deploy_handlers
             and not backend.skip_deployment()
             and not backend.get()
         ):
             log.error("backend is not deployed, handlers cannot be deployed. exiting.")
             sys.exit(1)
 
-        if handlers or not skip_handlers:
+        graph = DeployGraph(concurrency=self.get_deploy_concurrency())
+        alert_steps = []
+
+        def deploy_infrastructure(infra):
+            log.info(f"deploying {infra}")
+            self.infrastructure.get(infra).deploy()
+
+        def deploy_backend():
+            infra_config = self.get_infrastructure_config()
+            backend.update_config(infra_config, write_config, stage)
+            if not skip_backend:
+                log.info(f"preparing to deploy with backend {backend.resource_type}")
+                source["source"] = backend.deploy(force=force)
+
+        def deploy_handler(handler):
+            log.info(f"deploying {handler}")
+            self.handlers.get(handler).deploy(
+                source.get("source"), entrypoint="goblet_entrypoint"
+            )
+
+        def add_alerts_step(alert_type, depends_on):
+            # alerts share deployed alert state, so each alert step waits on the previous one
+            alert_steps.append(
+                graph.add(
+                    f"alerts:{alert_type.value}",
+                    partial(self.deploy_alerts, alert_type=alert_type),
+                    depends_on=[*depends_on, *alert_steps],
+                )
+            )
+
+        infra_steps = []
+        if infras or not skip_infra:
+            log.info("deploying infrastructure")
+            for infra in infras or self.infrastructure:
+                infra_steps.append(
+                    graph.add(
+                        f"infrastructure:{infra}", partial(deploy_infrastructure, infra)
+                    )
+                )
+
+        if not skip_alerts:
+            add_alerts_step(AlertType.INFRA, infra_steps)
+
+        # backend config depends on deployed infrastructure such as redis or vpc connectors
+        graph.add("backend", deploy_backend, depends_on=infra_steps)
+
+        if not skip_alerts:
+            add_alerts_step(AlertType.BACKEND, ["backend"])
+
+        handler_steps = []
+        if deploy_handlers:
             log.info("deploying handlers")
-            self.deploy_handlers(source, handlers)
+            for handler in handlers or self.handlers:
+                handler_steps.append(
+                    graph.add(
+                        f"handler:{handler}",
+                        partial(deploy_handler, handler),
+                        depends_on=["backend"],
+                    )
+                )
 
         if not skip_alerts:
-            self.deploy_alerts(alert_type=AlertType.HANDLER)
-            self.deploy_alerts(alert_type=AlertType.DEFAULT)
+            add_alerts_step(AlertType.HANDLER, handler_steps)
+            add_alerts_step(AlertType.DEFAULT, handler_steps)
+
+        self.deploy_report = graph.run()
+
+    def get_deploy_concurrency(self):
+        """Number of resources deployed at the same time, set with deploy.concurrency in config.json"""
+        return (self.config.deploy or {}).get("concurrency", 1)
 
     def destroy(
         self,
@@ -0,0 +1,137 @@
+import io
+import json
+import types
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Request
+from werkzeug.wrappers import Response as WerkzeugResponse
+
+from goblet.response import Response
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope and request body, so handlers get the same request object as under WSGI"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # the body is fully read, which also covers chunked requests without a content length
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+def to_asgi_response(response):
+    """Converts a handler response to (status, headers, body) following the same rules as Flask. The body is bytes,
+    or an iterator of chunks for streamed responses"""
+    status, headers = None, {}
+    if isinstance(response, tuple):
+        if len(response) == 3:
+            response, status, headers = response
+        elif len(response) == 2:
+            if isinstance(response[1], (dict, list)):
+                response, headers = response
+            else:
+                response, status = response
+        else:
+            raise TypeError("response tuple must be (body, status, headers)")
+        headers = dict(headers or {})
+    if isinstance(response, Response):
+        body = response.body
+        if not isinstance(body, (str, bytes, types.GeneratorType)):
+            body = json.dumps(body, separators=(",", ":"))
+        status = status or response.status_code
+        headers = {**response.headers, **headers}
+    elif isinstance(response, WerkzeugResponse):
+        body = response.response if response.is_streamed else response.get_data()
+        status = status or response.status_code
+        headers = {**dict(response.headers.items()), **headers}
+    elif isinstance(response, (str, bytes)):
+        body = response
+        headers.setdefault("Content-Type", "text/html; charset=utf-8")
+    elif isinstance(response, (dict, list)):
+        body = json.dumps(response)
+        headers.setdefault("Content-Type", "application/json")
+    else:
+        raise TypeError(
+            f"handler returned {type(response).__name__}, which is not a valid response"
+        )
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return (
+        int(status or 200),
+        [
+            (str(k).encode("latin-1"), str(v).encode("latin-1"))
+            for k, v in headers.items()
+        ],
+        body,
+    )
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def serve(app, scope, receive, send):
+    """ASGI application serving a Goblet app"""
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        raise ValueError(f"unsupported ASGI scope type {scope['type']}")
+
+    request = Request(build_environ(scope, await _read_body(receive)))
+    try:
+        response = await app.call_async(request)
+    except HTTPException as e:
+        response = e.get_response()
+    status, headers, body = to_asgi_response(response)
+
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    if isinstance(body, bytes):
+        await send({"type": "http.response.body", "body": body})
+        return
+    for chunk in body:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
@@ -1,17 +1,22 @@
 import base64
 import hashlib
+import json
 import logging
 import os
-import warnings
-import zipfile
-from pathlib import Path
 
-import requests
 from googleapiclient.errors import HttpError
 
 import goblet.globals as g
-from goblet.utils import get_g_dir, checksum, build_stage_config
+from goblet.utils import get_g_dir, checksum, build_stage_config, get_python_runtime
+from goblet.client import get_default_location, get_default_project
 from goblet.common_cloud_actions import check_or_enable_service
+from goblet.backends.packaging import (
+    IgnoreRules,
+    PackageCache,
+    compile_entries,
+    walk_files,
+    write_zip,
+)
 
 
 class Backend:
@@ -25,6 +30,7 @@ class Backend:
     monitoring_label_key = ""
     required_apis = []
     permissions = []
+    _client = None
 
     def __init__(self, app, client, func_path):
         self.app = app
@@ -32,7 +38,11 @@ class Backend:
         self.log = logging.getLogger("goblet.backend")
         self.log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
         self.zip_path = get_g_dir() + f"/{self.name}.zip"
-        self._zipf = None
+        self.package_cache_path = get_g_dir() + f"/{self.name}.package.json"
+        self.fingerprint_path = get_g_dir() + f"/{self.name}.deployed.json"
+        # arcname -> file path or bytes, written to zip_path by zip()
+        self.zip_entries = {}
+        self.zip_skipped = False
         self.config = g.config
 
         # specifies which files to be zipped
@@ -50,6 +60,21 @@ class Backend:
         self.client = client
         self.validation_config()
 
+    @property
+    def client(self):
+        """Client of the backend service, created on first use. Building a client loads credentials, which serving
+        requests does not need"""
+        if self._client is None:
+            self._client = self.create_client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def create_client(self):
+        return None
+
     def validation_config(self):
         pass
 
@@ -65,31 +90,55 @@ class Backend:
     def update_config(self, infra_config={}, write_config=False, stage=None):
         raise NotImplementedError("update_config")
 
-    @property
-    def zipf(self):
-        if not self._zipf:
-            self._zipf = self._create_zip()
-        return self._zipf
-
-    def _create_zip(self):
-        """Creates initial goblet zipfile"""
-        if not os.path.isdir(get_g_dir()):
-            os.mkdir(get_g_dir())
-        return zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED)
-
     def delta(self, zip_path=None):
         """Compares md5 hash between local zipfile and cloudfunction already deployed"""
+        deployed_checksum = self._checksum()
+        modified = deployed_checksum != self._local_checksum(zip_path)
+        return modified
+
+    def _local_checksum(self, zip_path=None):
         if zip_path is None:
             zip_path = self.zip_path
-        self.zipf.close()
-        with open(zip_path, "rb") as fh:
-            local_checksum = base64.b64encode(checksum(fh, hashlib.md5())).decode(
-                "ascii"
-            )
+        local_checksum = None
+        if zip_path == self.zip_path:
+            local_checksum = PackageCache(self.package_cache_path).zip_md5
+        if not local_checksum:
+            with open(zip_path, "rb") as fh:
+                local_checksum = base64.b64encode(checksum(fh, hashlib.md5())).decode(
+                    "ascii"
+                )
+        return local_checksum
 
-        deployed_checksum = self._checksum()
-        modified = deployed_checksum != local_checksum
-        return modified
+    def _fingerprint_key(self):
+        return (
+            f"{get_default_project()}/{get_default_location()}/{self.resource_type}/"
+            f"{self.config.stage or 'default'}"
+        )
+
+    def _load_deployed_fingerprints(self):
+        try:
+            with open(self.fingerprint_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    def _deployed_fingerprint(self):
+        """md5 of the source last deployed from this directory to the current project, location, backend and stage,
+        if recorded"""
+        return self._load_deployed_fingerprints().get(self._fingerprint_key())
+
+    def _save_deployed_fingerprint(self):
+        fingerprints = self._load_deployed_fingerprints()
+        fingerprints[self._fingerprint_key()] = self._local_checksum()
+        with open(self.fingerprint_path, "w") as f:
+            json.dump(fingerprints, f)
+
+    def _clear_deployed_fingerprint(self):
+        fingerprints = self._load_deployed_fingerprints()
+        if fingerprints.pop(self._fingerprint_key(), None) is None:
+            return
+        with open(self.fingerprint_path, "w") as f:
+            json.dump(fingerprints, f)
 
     def _checksum(self):
         raise NotImplementedError("_checksum")
@@ -97,9 +146,14 @@ class Backend:
     def _gcs_upload(self, client, headers, upload_client=None, force=False, tag=None):
         self.log.info("zipping source code")
         self.zip()
-        if not force and self.get() and not self.delta():
-            self.log.info("No changes detected....")
-            return None, False
+        if not force and self.get():
+            # the recorded fingerprint is only trusted while the deployed resource exists
+            if self._local_checksum() == self._deployed_fingerprint():
+                self.log.info("No changes detected since the last deploy....")
+                return None, False
+            if not self.delta():
+                self.log.info("No changes detected....")
+                return None, False
         self.log.info("uploading source zip to gs......")
 
         if tag:
@@ -108,7 +162,8 @@ class Backend:
         return self._upload_zip(upload_client or client, headers), True
 
     def _upload_tagged_zip(self, client, tag, headers=None) -> dict:
-        self.zipf.close()
+        import requests
+
         bucket_name = (
             self.config.deploy.artifact_bucket or os.environ["GOBLET_ARTIFACT_BUCKET"]
         )
@@ -136,7 +191,8 @@ class Backend:
 
     def _upload_zip(self, client, headers=None) -> dict:
         """Uploads zipped cloudfunction using generateUploadUrl endpoint"""
-        self.zipf.close()
+        import requests
+
         with open(f".goblet/{self.name}.zip", "rb") as f:
             resp = client.execute("generateUploadUrl", params={"body": {}})
             try:
@@ -178,47 +234,87 @@ class Backend:
             self._zip_file(self.config.main_file, "main.py")
 
     def zip(self):
-        """Zips python files and any additional files based on config.custom_files"""
+        """Zips python files and any additional files based on config.custom_files. The zip is only rebuilt
+        when the packaged files changed since the last build"""
         self.zip_required_files()
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            self._zip_directory()
+        self._zip_directory()
+
+        if not os.path.isdir(get_g_dir()):
+            os.mkdir(get_g_dir())
+        package_config = self.config.package or {}
+        compression_level = package_config.get("compression_level")
+        precompile_runtime = self._precompile_runtime()
+        strip_sources = bool(precompile_runtime and package_config.get("strip_sources"))
+        cache = PackageCache(self.package_cache_path)
+        manifest = cache.manifest(self.zip_entries)
+        digest = cache.source_digest(
+            manifest,
+            precompile_runtime
+            and {"precompile": precompile_runtime, "strip_sources": strip_sources},
+        )
+        self.zip_skipped = package_config.get("cache", True) and cache.is_current(
+            digest, self.zip_path, compression_level
+        )
+        if self.zip_skipped:
+            self.log.info("source code unchanged, reusing existing zip")
+            return
+        entries = self.zip_entries
+        if precompile_runtime:
+            entries = compile_entries(entries, strip_sources, keep=["main.py"])
+        write_zip(self.zip_path, entries, compression_level)
+        cache.update(manifest, digest, self.zip_path, compression_level)
+
+    def target_runtime(self):
+        """Python runtime the packaged source runs on, or None when it is chosen by the build, such as a Dockerfile"""
+        return None
+
+    def _precompile_runtime(self):
+        """Runtime to precompile the zip for when package.precompile is set. Bytecode is only valid for the python
+        version that compiled it, so nothing is precompiled unless the target runtime matches the local one
+        """
+        if not (self.config.package or {}).get("precompile"):
+            return None
+        runtime = self.target_runtime()
+        if not runtime:
+            self.log.debug("runtime is chosen at build time, skipping precompile")
+            return None
+        if runtime != get_python_runtime():
+            self.log.warning(
+                f"skipping precompile, the target runtime {runtime} does not match the local {get_python_runtime()}"
+            )
+            return None
+        return runtime
 
     def _zip_file(self, filename, arcname=None):
         """skip files if not required and do not exist"""
         if not os.path.exists(filename) and filename not in self.required_files:
             return
         self.log.debug(f"Zipping file: {filename}...")
-        self.zipf.write(filename, arcname)
+        self.zip_entries[arcname or filename] = filename
 
     def _zip_config(self):
         config_path = ".goblet/config.json"
-        stage_config_file = None
-        if os.path.exists(config_path):
-            if self.config.stage:
-                stage_config_file = build_stage_config(
-                    config_path=config_path, stage=self.config.stage
-                )
-                config_path = stage_config_file.name
-            self.zipf.write(
-                config_path, ".goblet/config.json", compress_type=zipfile.ZIP_DEFLATED
+        if not os.path.exists(config_path):
+            return
+        if self.config.stage:
+            stage_config_file = build_stage_config(
+                config_path=config_path, stage=self.config.stage
             )
-
-        if stage_config_file:
+            with open(stage_config_file.name, "rb") as f:
+                self.zip_entries[".goblet/config.json"] = f.read()
             stage_config_file.close()
+        else:
+            self.zip_entries[".goblet/config.json"] = config_path
 
     def _zip_directory(self):
-        exclusion_set = set(self.zip_config.get("exclude", []))
-        globbed_files = []
-        for pattern in self.zip_config.get("include", []):
-            globbed_files.extend(Path("").rglob(pattern))
-        for path in globbed_files:
-            if (
-                not set(path.parts).intersection(exclusion_set)
-                and str(path) != ".goblet/config.json"
-            ):
+        for path in walk_files(
+            self.zip_config.get("include", []),
+            self.zip_config.get("exclude", []),
+            IgnoreRules.from_file(".gcloudignore"),
+        ):
+            if path != ".goblet/config.json":
                 self.log.debug(f"Zipping file: {path}...")
-                self.zipf.write(str(path))
+                self.zip_entries[path] = path
 
     def get_environment_vars(self):
         raise NotImplementedError("get_environment_vars")
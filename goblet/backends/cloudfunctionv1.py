@@ -1,11 +1,10 @@
 import os
 
-from requests import request
 import base64
 
 from goblet.backends.backend import Backend
 from goblet.client import VersionedClients
-from goblet_gcp_client.client import get_default_location, get_default_project
+from goblet.client import get_default_location, get_default_project
 from goblet.common_cloud_actions import (
     get_function_runtime,
     create_cloudfunctionv1,
@@ -39,10 +38,15 @@ class CloudFunctionV1(Backend):
     ]
 
     def __init__(self, app):
-        self.client = VersionedClients().cloudfunctions
-        self.storage_client = VersionedClients().storage_objects
         self.func_path = f"projects/{get_default_project()}/locations/{get_default_location()}/functions/{app.function_name}"
-        super().__init__(app, self.client, self.func_path)
+        super().__init__(app, None, self.func_path)
+
+    def create_client(self):
+        return VersionedClients().cloudfunctions
+
+    @property
+    def storage_client(self):
+        return VersionedClients().storage_objects
 
     def deploy(self, force=False):
         put_headers = {
@@ -102,7 +106,7 @@ class CloudFunctionV1(Backend):
                 "description": self.config.description or "created by goblet",
                 "entryPoint": "goblet_entrypoint",
                 "httpsTrigger": {},
-                "runtime": get_function_runtime(self.client, self.config),
+                "runtime": self.target_runtime(),
                 "labels": {**self.config.labels},
                 **user_configs,
             }
@@ -113,7 +117,12 @@ class CloudFunctionV1(Backend):
 
         return self.client, params
 
+    def target_runtime(self):
+        return get_function_runtime(self.client, self.config)
+
     def _checksum(self):
+        from requests import request
+
         source_info = self.client.execute(
             "generateDownloadUrl", parent_key="name", parent_schema=self.func_path
         )
@@ -1,9 +1,8 @@
-from requests import request
 import re
 
 from goblet.backends.backend import Backend
 from goblet.client import VersionedClients
-from goblet_gcp_client.client import get_default_location, get_default_project
+from goblet.client import get_default_location, get_default_project
 from goblet.common_cloud_actions import (
     get_function_runtime,
     create_cloudfunctionv2,
@@ -35,9 +34,12 @@ class CloudFunctionV2(Backend):
     ]
 
     def __init__(self, app):
-        self.client = VersionedClients({"cloudfunctions": "v2"}).cloudfunctions
+        self.versioned_clients = VersionedClients({"cloudfunctions": "v2"})
         self.func_path = f"projects/{get_default_project()}/locations/{get_default_location()}/functions/{app.function_name}"
-        super().__init__(app, self.client, self.func_path)
+        super().__init__(app, None, self.func_path)
+
+    def create_client(self):
+        return self.versioned_clients.cloudfunctions
 
     def validation_config(self):
         name_pattern = r"^[a-z0-9-]+$"
@@ -77,7 +79,7 @@ class CloudFunctionV2(Backend):
                 "environment": "GEN_2",
                 "description": self.config.description or "created by goblet",
                 "buildConfig": {
-                    "runtime": get_function_runtime(self.client, self.config),
+                    "runtime": self.target_runtime(),
                     "entryPoint": "goblet_entrypoint",
                     "source": {"storageSource": source["storageSource"]},
                     **build_configs,
@@ -89,7 +91,12 @@ class CloudFunctionV2(Backend):
         }
         return self.client, params
 
+    def target_runtime(self):
+        return get_function_runtime(self.client, self.config)
+
     def _checksum(self):
+        from requests import request
+
         source_info = self.client.execute(
             "generateDownloadUrl", parent_key="name", parent_schema=self.func_path
         )
@@ -2,18 +2,14 @@ import os
 import re
 import base64
 from functools import lru_cache
-from urllib.parse import quote_plus
 
-import google_auth_httplib2
 from googleapiclient.errors import HttpError
 
 from goblet.backends.backend import Backend
-from goblet.client import VersionedClients
-from goblet_gcp_client.client import (
+from goblet.client import (
+    VersionedClients,
     get_default_project,
     get_default_location,
-    Client,
-    get_credentials,
 )
 from goblet.common_cloud_actions import (
     create_cloudbuild,
@@ -29,6 +25,10 @@ from goblet.write_files import write_dockerfile
 from goblet.errors import GobletValidationError
 from goblet.permissions import gcp_generic_resource_permissions, add_binding
 
+# Stage of the default Dockerfile that builds dependencies, cached in the registry under BUILDER_CACHE_TAG
+BUILDER_STAGE = "builder"
+BUILDER_CACHE_TAG = "builder-cache"
+
 
 class CloudRun(Backend):
     resource_type = "cloudrun"
@@ -54,9 +54,11 @@ class CloudRun(Backend):
     ]
 
     def __init__(self, app):
-        self.client = VersionedClients().run
         self.run_name = f"projects/{get_default_project()}/locations/{get_default_location()}/services/{app.function_name}"
-        super().__init__(app, self.client, self.run_name)
+        super().__init__(app, None, self.run_name)
+
+    def create_client(self):
+        return VersionedClients().run
 
     def validation_config(self):
         name_pattern = r"^[a-z]([-a-z0-9]*[a-z0-9])?"
@@ -78,7 +80,15 @@ class CloudRun(Backend):
             self.log.info(
                 "No Dockerfile or Procfile found for cloudrun backend. Writing default Dockerfile"
             )
-            write_dockerfile()
+            dockerfile_config = self.config.default_dockerfile or {}
+            write_dockerfile(
+                python_version=dockerfile_config.get("python_version")
+                or self._python_version(),
+                build_packages=dockerfile_config.get("build_packages", []),
+                system_packages=dockerfile_config.get("system_packages", []),
+                cache_mounts=self.config.deploy.get("cloudbuild_cache") != "KANIKO",
+                precompile=(self.config.package or {}).get("precompile", False),
+            )
 
         try:
             artifact_tag = os.environ["GOBLET_ARTIFACT_TAG"]
@@ -121,10 +131,13 @@ class CloudRun(Backend):
                 params={"body": policy_bindings},
             )
 
+        if source:
+            self._save_deployed_fingerprint()
         return source
 
     def destroy(self, all=False):
         destroy_cloudrun(self.client, self.name)
+        self._clear_deployed_fingerprint()
         if all:
             destroy_cloudfunction_artifacts(self.name)
 
@@ -228,15 +241,52 @@ class CloudRun(Backend):
             return 0
         bucket = latest_build_source["storageSource"]["bucket"]
         obj = latest_build_source["storageSource"]["object"]
-        client = Client("cloudresourcemanager", "v1", calls="projects")
-        http = client.http or google_auth_httplib2.AuthorizedHttp(get_credentials())
-        resp = http.request(
-            f"https://storage.googleapis.com/storage/v1/b/{bucket}/o/{quote_plus(obj)}?alt=media",
+        # object metadata only, the md5Hash is the same as the x-goog-hash of the object media
+        metadata = versioned_clients.storage_objects.execute(
+            "get", params={"bucket": bucket, "object": obj, "fields": "md5Hash"}
         )
+        return metadata.get("md5Hash", 0)
+
+    def _python_version(self):
+        """Python version of the configured runtime, such as 3.10 for python310, or None for the local version"""
+        if not self.config.runtime:
+            return None
+        version = self.config.runtime.split("python")[-1]
+        return f"{version[0]}.{version[1:]}"
+
+    def _has_builder_stage(self):
+        """The Dockerfile has a stage named builder, as the default Dockerfile does"""
         try:
-            return resp[0]["x-goog-hash"].split(",")[-1].split("=", 1)[-1]
-        except KeyError:
-            return 0
+            with open(f"{get_dir()}/{self.config.dockerfile or 'Dockerfile'}") as f:
+                dockerfile = f.read()
+        except FileNotFoundError:
+            return False
+        return bool(
+            re.search(
+                rf"^\s*FROM\s+\S+\s+AS\s+{BUILDER_STAGE}\s*$",
+                dockerfile,
+                re.IGNORECASE | re.MULTILINE,
+            )
+        )
+
+    @staticmethod
+    def _docker_build_step(images, build_args, cache_from, target=None):
+        return {
+            "name": "gcr.io/cloud-builders/docker",
+            # BuildKit is required for the cache mounts of the default Dockerfile. The inline cache
+            # keeps the pushed image usable as --cache-from for the next build
+            "env": ["DOCKER_BUILDKIT=1"],
+            "args": [
+                "build",
+                "--network=cloudbuild",
+                ["--build-arg", "BUILDKIT_INLINE_CACHE=1"],
+            ]
+            + (["--target", target] if target else [])
+            + list(map(lambda image: ["-t", image], images))
+            + list(map(lambda build_arg: ["--build-arg", build_arg], build_args))
+            + [arg for image in cache_from for arg in ["--cache-from", image]]
+            + ["."],
+        }
 
     def _get_cloudbuild_steps(self, images):
         cloudbuild_cache = self.config.deploy.get("cloudbuild_cache", "DOCKER_LATEST")
@@ -246,29 +296,42 @@ class CloudRun(Backend):
             build_args = build_args.split(",")
 
         if cloudbuild_cache == "DOCKER_LATEST":
+            # The inline cache of an image only covers its final stage, so the builder stage of a multi-stage
+            # Dockerfile is built and pushed as its own cache image. Dependencies are then only rebuilt when
+            # requirements.txt changes
+            builder_image = None
+            if self._has_builder_stage():
+                builder_image = f"{images[0].rsplit(':', 1)[0]}:{BUILDER_CACHE_TAG}"
             steps = [
                 {
                     "name": "gcr.io/cloud-builders/docker",
                     "entrypoint": "bash",
                     "args": ["-c", f"docker pull {images[0]} || exit 0"],
                 },
-                {
-                    "name": "gcr.io/cloud-builders/docker",
-                    "args": [
-                        "build",
-                        "--network=cloudbuild",
-                    ]
-                    + list(map(lambda image: ["-t", image], images))
-                    + list(
-                        map(lambda build_arg: ["--build-arg", build_arg], build_args)
-                    )
-                    + [
-                        "--cache-from",
-                        images[0],
-                        ".",
-                    ],
-                },
             ]
+            if builder_image:
+                steps.append(
+                    self._docker_build_step(
+                        [builder_image],
+                        build_args,
+                        [builder_image],
+                        target=BUILDER_STAGE,
+                    )
+                )
+            steps.append(
+                self._docker_build_step(
+                    images,
+                    build_args,
+                    ([builder_image] if builder_image else []) + [images[0]],
+                )
+            )
+            if builder_image:
+                steps.append(
+                    {
+                        "name": "gcr.io/cloud-builders/docker",
+                        "args": ["push", builder_image],
+                    }
+                )
         elif cloudbuild_cache == "KANIKO":
             steps = [
                 {
@@ -0,0 +1,274 @@
+import base64
+import fnmatch
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import py_compile
+import re
+import tempfile
+import zipfile
+
+from goblet.utils import checksum
+
+log = logging.getLogger("goblet.backend")
+log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
+
+# Fixed timestamp for entries generated in memory, so unchanged content produces an identical zip
+GENERATED_ENTRY_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+class PackageCache:
+    """Per file mtime, size and sha256 of the last packaged source, stored next to the zip in .goblet. Unchanged
+    files are not re-hashed, and if the source digest and zip are unchanged the zip is not rebuilt
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.files = {}
+        self.digest = None
+        self.zip_md5 = None
+        self.zip_stat = None
+        self.compression_level = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return
+        self.files = cache.get("files", {})
+        self.digest = cache.get("digest")
+        self.zip_md5 = cache.get("zip_md5")
+        self.zip_stat = cache.get("zip_stat")
+        self.compression_level = cache.get("compression_level")
+
+    def write(self):
+        with open(self.cache_path, "w") as f:
+            json.dump(
+                {
+                    "files": self.files,
+                    "digest": self.digest,
+                    "zip_md5": self.zip_md5,
+                    "zip_stat": self.zip_stat,
+                    "compression_level": self.compression_level,
+                },
+                f,
+            )
+
+    def manifest(self, entries):
+        """Returns {arcname: file info} for zip entries, reusing cached hashes of files whose path, mtime and size
+        have not changed. Entries map arcnames to a file path or to in memory bytes"""
+        manifest = {}
+        for arcname, source in entries.items():
+            if isinstance(source, bytes):
+                manifest[arcname] = {"sha256": hashlib.sha256(source).hexdigest()}
+                continue
+            stat = os.stat(source)
+            info = {"path": source, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            cached = self.files.get(arcname, {})
+            if all(cached.get(k) == v for k, v in info.items()):
+                info["sha256"] = cached["sha256"]
+            else:
+                with open(source, "rb") as fh:
+                    info["sha256"] = checksum(fh, hashlib.sha256()).hex()
+            manifest[arcname] = info
+        return manifest
+
+    @staticmethod
+    def source_digest(manifest, options=None):
+        """Digest of the manifest and of any packaging options that change the zip content"""
+        hasher = hashlib.sha256()
+        for arcname in sorted(manifest):
+            hasher.update(f"{arcname}\0{manifest[arcname]['sha256']}\0".encode())
+        if options:
+            hasher.update(json.dumps(options, sort_keys=True).encode())
+        return hasher.hexdigest()
+
+    def is_current(self, digest, zip_path, compression_level):
+        """The zip at zip_path was built by this cache from the same source digest"""
+        return (
+            self.digest == digest
+            and self.compression_level == compression_level
+            and self.zip_stat == _zip_stat(zip_path)
+        )
+
+    def update(self, manifest, digest, zip_path, compression_level):
+        with open(zip_path, "rb") as fh:
+            self.zip_md5 = base64.b64encode(checksum(fh, hashlib.md5())).decode("ascii")
+        self.files = manifest
+        self.digest = digest
+        self.zip_stat = _zip_stat(zip_path)
+        self.compression_level = compression_level
+        self.write()
+
+
+def _zip_stat(zip_path):
+    try:
+        stat = os.stat(zip_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def write_zip(zip_path, entries, compression_level=None):
+    """Writes entries ({arcname: path or bytes}) to a deflated zip"""
+    with zipfile.ZipFile(
+        zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=compression_level
+    ) as zipf:
+        for arcname, source in entries.items():
+            if isinstance(source, bytes):
+                info = zipfile.ZipInfo(arcname, date_time=GENERATED_ENTRY_DATE)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                zipf.writestr(info, source)
+            else:
+                zipf.write(source, arcname)
+
+
+def compile_entries(entries, strip_sources=False, keep=()):
+    """Returns entries with the bytecode of each .py entry added next to it, compiled by the running interpreter.
+    Bytecode is written to __pycache__, or replaces the source as a legacy .pyc when strip_sources is set. Arcnames
+    in keep, such as main.py which the runtime loads by file name, keep their source. The pyc files use unchecked
+    hash invalidation, so they are reproducible and are not checked against the source at import
+    """
+    compiled = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for arcname, source in entries.items():
+            if not arcname.endswith(".py"):
+                compiled[arcname] = source
+                continue
+            if isinstance(source, bytes):
+                path = os.path.join(tmp, "source.py")
+                with open(path, "wb") as f:
+                    f.write(source)
+                source_path = path
+            else:
+                source_path = source
+            try:
+                py_compile.compile(
+                    source_path,
+                    cfile=os.path.join(tmp, "compiled.pyc"),
+                    dfile=arcname,
+                    doraise=True,
+                    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+                )
+            except py_compile.PyCompileError as e:
+                log.warning(f"unable to precompile {arcname}, keeping source: {e.msg}")
+                compiled[arcname] = source
+                continue
+            with open(os.path.join(tmp, "compiled.pyc"), "rb") as f:
+                bytecode = f.read()
+            if strip_sources and arcname not in keep:
+                compiled[arcname + "c"] = bytecode
+            else:
+                compiled[arcname] = source
+                pyc_name = importlib.util.cache_from_source(arcname)
+                compiled[pyc_name.replace(os.sep, "/")] = bytecode
+    return compiled
+
+
+def _match_parts(parts, pattern):
+    """Glob match of path parts against pattern parts, where ** matches any number of parts"""
+    if not pattern:
+        return not parts
+    if pattern[0] == "**":
+        return any(_match_parts(parts[i:], pattern[1:]) for i in range(len(parts) + 1))
+    return (
+        bool(parts)
+        and fnmatch.fnmatchcase(parts[0], pattern[0])
+        and _match_parts(parts[1:], pattern[1:])
+    )
+
+
+def _compile_names(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns))
+
+
+class IgnoreRules:
+    """.gitignore style rules, as used by .gcloudignore. Supports comments, negation with !, directory only
+    patterns with a trailing /, patterns anchored to the root when they contain a /, ** and the
+    #!include:<file> directive of .gcloudignore"""
+
+    def __init__(self, lines=None):
+        self.rules = []
+        for line in lines or []:
+            self.add(line)
+
+    @classmethod
+    def from_file(cls, path, root="."):
+        rules = cls()
+        try:
+            with open(os.path.join(root, path)) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return rules
+        for line in lines:
+            if line.startswith("#!include:"):
+                rules.rules.extend(
+                    cls.from_file(line[len("#!include:") :].strip(), root).rules
+                )
+            else:
+                rules.add(line)
+        return rules
+
+    def add(self, line):
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            return
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        self.rules.append((negate, dir_only, anchored, line.lstrip("/").split("/")))
+
+    def ignored(self, parts, is_dir):
+        ignored = False
+        for negate, dir_only, anchored, pattern in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                matched = _match_parts(parts, pattern)
+            else:
+                matched = _match_parts(parts[-1:], pattern)
+            if matched:
+                ignored = not negate
+        return ignored
+
+
+def walk_files(include, exclude=None, ignore_rules=None, root="."):
+    """Yields relative paths of files under root matching any include pattern, in a single sorted walk.
+    Include patterns match at any depth like Path.rglob. Directories or files with a name matching an exclude
+    pattern, or ignored by ignore_rules, are pruned before they are walked"""
+    basename_re = _compile_names([p for p in include if "/" not in p])
+    nested = [["**", *p.split("/")] for p in include if "/" in p]
+    exclude_re = _compile_names(exclude)
+    visited = set()
+
+    def walk(path, parts):
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        for entry in entries:
+            if exclude_re and exclude_re.match(entry.name):
+                continue
+            entry_parts = (*parts, entry.name)
+            is_dir = entry.is_dir()
+            if ignore_rules and ignore_rules.ignored(entry_parts, is_dir):
+                continue
+            if is_dir:
+                stat = entry.stat()
+                if (stat.st_dev, stat.st_ino) in visited:
+                    continue
+                visited.add((stat.st_dev, stat.st_ino))
+                yield from walk(entry.path, entry_parts)
+            elif (basename_re and basename_re.match(entry.name)) or any(
+                _match_parts(entry_parts, pattern) for pattern in nested
+            ):
+                yield "/".join(entry_parts)
+
+    yield from walk(root, ())
@@ -10,7 +10,7 @@ import yaml as yml
 
 from goblet.utils import get_g_dir, get_goblet_app
 from goblet.write_files import create_goblet_dir
-from goblet_gcp_client.client import get_default_project
+from goblet.client import get_default_project
 from goblet.__version__ import __version__
 import goblet.globals as g
 from goblet.permissions import create_custom_role_policy
@@ -376,7 +376,6 @@ def package(stage):
             os.environ["STAGE"] = stage
         app = get_goblet_app(GConfig().main_file or "main.py")
         app.package()
-        app.backend.zipf.close()
 
     except FileNotFoundError as not_found:
         click.echo(
@@ -475,6 +474,67 @@ def run_job(name, task_id, set_env, stage):
         sys.exit(1)
 
 
+@main.group()
+def bqremotefunction():
+    """tune bigquery remote functions"""
+    pass
+
+
+@bqremotefunction.command(name="tune")
+@click.option("-p", "--project", "project", envvar="GOOGLE_PROJECT")
+@click.option("-l", "--location", "location", envvar="GOOGLE_LOCATION", required=True)
+@click.option("-s", "--stage", "stage", envvar="STAGE")
+@click.option("-d", "--days", "days", default=7, show_default=True)
+@click.option("--apply", "apply", is_flag=True)
+@click.option("--write-config", "write_config", is_flag=True)
+def tune_bqremotefunction(project, location, stage, days, apply, write_config):
+    """
+    Recommend max_batching_rows for each bigquery remote function from the batch latency logged in the last days.
+
+    --apply updates the deployed routines whose max_batching_rows changed and --write-config saves the values to
+    config.json, so later deploys keep them
+    """
+    os.environ["X-GOBLET-DEPLOY"] = "true"
+    try:
+        _project = project or get_default_project()
+        if not _project:
+            click.echo(
+                "Project not found. Set --project flag or add to gcloud by using gcloud config set project PROJECT"
+            )
+        os.environ["GOOGLE_PROJECT"] = _project
+        os.environ["GOOGLE_LOCATION"] = location
+        if stage:
+            os.environ["STAGE"] = stage
+        app = get_goblet_app(GConfig().main_file or "main.py")
+        results = app.handlers["bqremotefunction"].tune(days=days, apply=apply)
+
+        click.echo(
+            f"{'routine':<50} {'batches':>8} {'rows/s':>10} {'current':>8} {'recommended':>12}"
+        )
+        for routine_name, batches, rows_per_second, current, recommended in results:
+            click.echo(
+                f"{routine_name:<50} {batches:>8} "
+                f"{rows_per_second or 0:>10.1f} {current:>8} {recommended or '-':>12}"
+            )
+        if write_config:
+            tuned = {
+                routine_name: recommended
+                for routine_name, _, _, _, recommended in results
+                if recommended is not None
+            }
+            g.config.update_g_config(
+                values={"bqremotefunction": {"max_batching_rows": tuned}},
+                write_config=True,
+                stage=stage,
+            )
+
+    except FileNotFoundError as not_found:
+        click.echo(
+            f"Missing {not_found.filename}. Make sure you are in the correct directory and this file exists"
+        )
+        sys.exit(1)
+
+
 @main.group()
 def services():
     """check and enable gcp service apis for your gcp project"""
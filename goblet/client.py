@@ -1,7 +1,6 @@
 import logging
 import os
-from goblet_gcp_client import Client
-from goblet_gcp_client.client import get_default_project
+import threading
 import goblet.globals as g
 
 log = logging.getLogger("goblet.client")
@@ -28,8 +27,56 @@ DEFAULT_CLIENT_VERSIONS = {
     "storage": "v1",
 }
 
+PROJECT_ENV_VARS = (
+    "GOOGLE_PROJECT",
+    "GCLOUD_PROJECT",
+    "GOOGLE_CLOUD_PROJECT",
+    "CLOUDSDK_CORE_PROJECT",
+)
+LOCATION_ENV_VARS = (
+    "GOOGLE_ZONE",
+    "GCLOUD_ZONE",
+    "CLOUDSDK_COMPUTE_ZONE",
+    "GOOGLE_REGION",
+    "GCLOUD_REGION",
+    "CLOUDSDK_COMPUTE_REGION",
+    "GOOGLE_LOCATION",
+    "GCLOUD_LOCATION",
+)
+
+# project and location resolved from credentials or the metadata server
+_defaults = {}
+_defaults_lock = threading.Lock()
+
+
+def _default(key, env_vars, lookup):
+    for k in env_vars:
+        if k in os.environ:
+            return os.environ[k]
+    if key not in _defaults:
+        with _defaults_lock:
+            if key not in _defaults:
+                from goblet_gcp_client import client as gcp_client
+
+                _defaults[key] = getattr(gcp_client, lookup)()
+    return _defaults[key]
+
+
+def get_default_project():
+    """Project from the environment, otherwise from the default credentials. The credentials lookup is done once per
+    process"""
+    return _default("project", PROJECT_ENV_VARS, "get_default_project")
+
+
+def get_default_location():
+    """Location from the environment, otherwise from the metadata server. The metadata server is queried once per
+    process"""
+    return _default("location", LOCATION_ENV_VARS, "get_default_location")
+
 
 def get_default_project_number():
+    from goblet_gcp_client import Client
+
     client = Client("cloudresourcemanager", "v1", calls="projects")
     resp = client.execute(
         "get", parent_key="projectId", parent_schema=get_default_project()
@@ -37,6 +84,111 @@ def get_default_project_number():
     return resp["projectNumber"]
 
 
+class ClientCache:
+    """Process-wide cache of goblet_gcp_client Clients keyed by service, version, calls and emulator host.
+
+    Credentials are resolved once and shared by every cached client. Clients are additionally keyed by thread,
+    since the httplib2 transports built for each client are not thread safe. Caching is bypassed when recording or
+    replaying http responses (G_HTTP_TEST) or when G_DISABLE_CLIENT_CACHE is set.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._credentials = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def enabled():
+        return not (
+            os.environ.get("G_HTTP_TEST") or os.environ.get("G_DISABLE_CLIENT_CACHE")
+        )
+
+    def get(
+        self,
+        resource,
+        version,
+        calls=None,
+        parent_schema=None,
+        regional=False,
+        emulator_host=None,
+    ):
+        # imported on first use, since googleapiclient and google.auth are only needed to call apis
+        from goblet_gcp_client.client import Client, get_credentials
+
+        if not self.enabled():
+            return Client(
+                resource,
+                version,
+                calls=calls,
+                parent_schema=parent_schema,
+                regional=regional,
+                emulator_host=emulator_host,
+            )
+        emulator_host = emulator_host or os.environ.get("G_EMULATOR_HOST")
+        # clients capture the project and location when they are built, and regional clients their endpoint
+        key = (
+            resource,
+            version,
+            calls,
+            parent_schema,
+            regional,
+            emulator_host,
+            get_default_project(),
+            get_default_location(),
+            threading.get_ident(),
+        )
+        # the counters are updated with the lock held, since += is not atomic across threads
+        with self._lock:
+            client = self._clients.get(key)
+            if client:
+                self.hits += 1
+                return client
+            self.misses += 1
+            if not self._credentials:
+                self._credentials = get_credentials()
+            self._prune_dead_threads()
+            client = Client(
+                resource,
+                version,
+                credentials=self._credentials,
+                calls=calls,
+                parent_schema=parent_schema,
+                regional=regional,
+                emulator_host=emulator_host,
+            )
+            self._clients[key] = client
+        return client
+
+    def _prune_dead_threads(self):
+        alive = {t.ident for t in threading.enumerate()}
+        for key in [k for k in self._clients if k[-1] not in alive]:
+            del self._clients[key]
+
+    def invalidate(self, resource=None):
+        """Drop cached clients. If resource is supplied only clients for that service are dropped, otherwise all
+        clients and the shared credentials are dropped"""
+        with self._lock:
+            if resource:
+                for key in [k for k in self._clients if k[0] == resource]:
+                    del self._clients[key]
+                return
+            self._clients = {}
+            self._credentials = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._clients),
+            }
+
+
+client_cache = ClientCache()
+
+
 # Clients
 class VersionedClients:
     def __init__(self, client_versions=None):
@@ -50,9 +202,13 @@ class VersionedClients:
         if client_versions:
             self.client_versions.update(client_versions)
 
+    @staticmethod
+    def _client(resource, version, **kwargs):
+        return client_cache.get(resource, version, **kwargs)
+
     @property
     def cloudfunctions(self):
-        return Client(
+        return self._client(
             "cloudfunctions",
             self.client_versions.get("cloudfunctions", "v1"),
             calls="projects.locations.functions",
@@ -61,7 +217,7 @@ class VersionedClients:
 
     @property
     def cloudbuild(self):
-        return Client(
+        return self._client(
             "cloudbuild",
             self.client_versions.get("cloudbuild", "v1"),
             calls="projects.builds",
@@ -70,7 +226,7 @@ class VersionedClients:
 
     @property
     def run(self):
-        return Client(
+        return self._client(
             "run",
             self.client_versions.get("run", "v2"),
             calls="projects.locations.services",
@@ -79,7 +235,7 @@ class VersionedClients:
 
     @property
     def run_job(self):
-        return Client(
+        return self._client(
             "run",
             self.client_versions.get("run", "v2"),
             calls="projects.locations.jobs",
@@ -89,7 +245,7 @@ class VersionedClients:
 
     @property
     def pubsub(self):
-        return Client(
+        return self._client(
             "pubsub",
             self.client_versions.get("pubsub", "v1"),
             calls="projects.subscriptions",
@@ -99,7 +255,7 @@ class VersionedClients:
 
     @property
     def pubsub_topic(self):
-        return Client(
+        return self._client(
             "pubsub",
             self.client_versions.get("pubsub", "v1"),
             calls="projects.topics",
@@ -109,7 +265,7 @@ class VersionedClients:
 
     @property
     def apigateway(self):
-        return Client(
+        return self._client(
             "apigateway",
             self.client_versions.get("apigateway", "v1"),
             calls="projects.locations.gateways",
@@ -118,7 +274,7 @@ class VersionedClients:
 
     @property
     def apigateway_configs(self):
-        return Client(
+        return self._client(
             "apigateway",
             self.client_versions.get("apigateway", "v1"),
             calls="projects.locations.apis.configs",
@@ -127,7 +283,7 @@ class VersionedClients:
 
     @property
     def apigateway_api(self):
-        return Client(
+        return self._client(
             "apigateway",
             self.client_versions.get("apigateway", "v1"),
             calls="projects.locations.apis",
@@ -136,7 +292,7 @@ class VersionedClients:
 
     @property
     def cloudscheduler(self):
-        return Client(
+        return self._client(
             "cloudscheduler",
             self.client_versions.get("cloudscheduler", "v1"),
             calls="projects.locations.jobs",
@@ -145,7 +301,7 @@ class VersionedClients:
 
     @property
     def cloudtask(self):
-        return Client(
+        return self._client(
             "cloudtasks",
             self.client_versions.get("cloudtasks", "v2"),
             calls="projects.locations.queues.tasks",
@@ -154,7 +310,7 @@ class VersionedClients:
 
     @property
     def cloudtask_queue(self):
-        return Client(
+        return self._client(
             "cloudtasks",
             self.client_versions.get("cloudtasks", "v2"),
             calls="projects.locations.queues",
@@ -163,7 +319,7 @@ class VersionedClients:
 
     @property
     def eventarc(self):
-        return Client(
+        return self._client(
             "eventarc",
             self.client_versions.get("eventarc", "v1"),
             calls="projects.locations.triggers",
@@ -172,7 +328,7 @@ class VersionedClients:
 
     @property
     def redis(self):
-        return Client(
+        return self._client(
             "redis",
             self.client_versions.get("redis", "v1"),
             calls="projects.locations.instances",
@@ -181,7 +337,7 @@ class VersionedClients:
 
     @property
     def vpcconnector(self):
-        return Client(
+        return self._client(
             "vpcaccess",
             self.client_versions.get("vpcaccess", "v1"),
             calls="projects.locations.connectors",
@@ -190,7 +346,7 @@ class VersionedClients:
 
     @property
     def bigquery_connections(self):
-        return Client(
+        return self._client(
             "bigqueryconnection",
             self.client_versions.get("bigqueryconnection", "v1"),
             calls="projects.locations.connections",
@@ -199,7 +355,7 @@ class VersionedClients:
 
     @property
     def run_uploader(self):
-        return Client(
+        return self._client(
             "cloudfunctions",
             "v2beta",
             calls="projects.locations.functions",
@@ -208,7 +364,7 @@ class VersionedClients:
 
     @property
     def bigquery_routines(self):
-        return Client(
+        return self._client(
             "bigquery",
             self.client_versions.get("bigquery", "v2"),
             calls="routines",
@@ -217,7 +373,7 @@ class VersionedClients:
 
     @property
     def monitoring_alert(self):
-        return Client(
+        return self._client(
             "monitoring",
             self.client_versions.get("monitoring", "v3"),
             calls="projects.alertPolicies",
@@ -226,7 +382,7 @@ class VersionedClients:
 
     @property
     def monitoring_uptime(self):
-        return Client(
+        return self._client(
             "monitoring",
             self.client_versions.get("monitoring", "v3"),
             calls="projects.uptimeCheckConfigs",
@@ -235,16 +391,25 @@ class VersionedClients:
 
     @property
     def logging_metric(self):
-        return Client(
+        return self._client(
             "logging",
             self.client_versions.get("logging", "v2"),
             calls="projects.metrics",
             parent_schema="projects/{project_id}",
         )
 
+    @property
+    def logging_entries(self):
+        return self._client(
+            "logging",
+            self.client_versions.get("logging", "v2"),
+            calls="entries",
+            parent_schema="projects/{project_id}",
+        )
+
     @property
     def secretmanager(self):
-        return Client(
+        return self._client(
             "secretmanager",
             self.client_versions.get("secretmanager", "v1"),
             calls="projects.secrets.versions",
@@ -253,7 +418,7 @@ class VersionedClients:
 
     @property
     def service_usage(self):
-        return Client(
+        return self._client(
             "serviceusage",
             self.client_versions.get("serviceusage", "v1"),
             calls="services",
@@ -262,7 +427,7 @@ class VersionedClients:
 
     @property
     def iam_roles(self):
-        return Client(
+        return self._client(
             "iam",
             self.client_versions.get("iam", "v1"),
             calls="projects.roles",
@@ -271,7 +436,7 @@ class VersionedClients:
 
     @property
     def service_account(self):
-        return Client(
+        return self._client(
             "iam",
             self.client_versions.get("iam", "v1"),
             calls="projects.serviceAccounts",
@@ -280,7 +445,7 @@ class VersionedClients:
 
     @property
     def project_resource_manager(self):
-        return Client(
+        return self._client(
             "cloudresourcemanager",
             self.client_versions.get("cloudresourcemanager", "v3"),
             calls="projects",
@@ -289,7 +454,7 @@ class VersionedClients:
 
     @property
     def artifactregistry_repositories(self):
-        return Client(
+        return self._client(
             "artifactregistry",
             self.client_versions.get("artifactregistry", "v1"),
             calls="projects.locations.repositories",
@@ -298,7 +463,7 @@ class VersionedClients:
 
     @property
     def storage_buckets(self):
-        return Client(
+        return self._client(
             "storage",
             self.client_versions.get("storage", "v1"),
             calls="buckets",
@@ -306,7 +471,7 @@ class VersionedClients:
 
     @property
     def storage_objects(self):
-        return Client(
+        return self._client(
             "storage",
             self.client_versions.get("storage", "v1"),
             calls="objects",
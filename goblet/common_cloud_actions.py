@@ -1,4 +1,4 @@
-import google_auth_httplib2
+from __future__ import annotations
 import logging
 import json
 from urllib.parse import quote_plus
@@ -10,17 +10,16 @@ import os
 from goblet.client import (
     VersionedClients,
     get_default_project_number,
-)
-from goblet_gcp_client.client import (
-    Client,
     get_default_location,
-    get_credentials,
     get_default_project,
 )
 from goblet.errors import GobletError
 from goblet.utils import get_python_runtime
 from goblet.permissions import add_binding
-from typing import List
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from goblet_gcp_client import Client
 
 log = logging.getLogger("goblet.deployer")
 log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
@@ -136,6 +135,9 @@ def destroy_cloudfunction(client, name):
 
 def destroy_cloudfunction_artifacts(name):
     """Destroys all images stored in cloud storage that are related to the function."""
+    import google_auth_httplib2
+    from goblet_gcp_client.client import Client, get_credentials
+
     client = Client("cloudresourcemanager", "v1", calls="projects")
     resp = client.execute(
         "get", parent_key="projectId", parent_schema=get_default_project()
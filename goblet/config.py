@@ -10,9 +10,15 @@ log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
 class GConfig(dict):
     """Config class used to get variables from config.json or from the environment. If stage is set as an environment level
     if will parse the corresponding section in config.json and return those config values
+
+    Attribute lookups, including the environment overlay and the GConfig wrappers of nested sections, are resolved
+    once and stored as instance attributes, so repeated access is a plain attribute lookup. Resolved attributes are
+    invalidated by every write through GConfig and by update_g_config. Call invalidate after changing environment
+    variables or the underlying dicts directly
     """
 
     def __init__(self, config=None, stage=None, init=True):
+        object.__setattr__(self, "_resolved", set())
         if config:
             dict.__init__(self, **config)
 
@@ -27,7 +33,14 @@ class GConfig(dict):
         self.update_stage_config()
         self.validate()
 
+    def invalidate(self):
+        """Drops resolved attributes, which are looked up again on next access"""
+        for name in list(self._resolved):
+            self.__dict__.pop(name, None)
+        self._resolved.clear()
+
     def update_g_config(self, stage=None, values={}, write_config=False):
+        self.invalidate()
         self.stage = self.stage or stage
         if write_config:
             if self.stage:
@@ -39,6 +52,7 @@ class GConfig(dict):
             self.write()
         self.update_stage_config()
         self.config = nested_update(self.config, values)
+        self.invalidate()
 
     def update_stage_config(self):
         if self.stage:
@@ -64,8 +78,22 @@ class GConfig(dict):
 
     def __setitem__(self, key, value):
         self.config[key] = value
+        self.invalidate()
 
     def __getattr__(self, name):
+        # only called for names that are not instance attributes, so dict methods are never shadowed
+        if name == "_resolved":
+            raise AttributeError(name)
+        value = self._lookup(name)
+        if self.config.get(name) is None and not os.environ.get(name):
+            # the empty wrapper of a missing section is detached from self.config, so writes to it are lost.
+            # It is rebuilt on every access rather than cached, so such writes are never read back
+            return value
+        self.__dict__[name] = value
+        self._resolved.add(name)
+        return value
+
+    def _lookup(self, name):
         if os.environ.get(name):
             return os.environ.get(name)
         attr = self.config.get(name)
@@ -82,6 +110,7 @@ class GConfig(dict):
             self.config[name] = value
         else:
             super(GConfig, self).__setattr__(name, value)
+        self.invalidate()
 
     def write(self):
         with open(f"{get_g_dir()}/config.json", "w") as f:
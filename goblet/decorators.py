@@ -1,10 +1,9 @@
 from __future__ import annotations
 import os
-import yaml
 from warnings import warn
 import logging
 
-from goblet_gcp_client.client import get_default_location, get_default_project
+from goblet.client import get_default_location, get_default_project
 
 from goblet.backends.cloudfunctionv1 import CloudFunctionV1
 from goblet.backends.cloudfunctionv2 import CloudFunctionV2
@@ -119,19 +118,35 @@ class Goblet_Decorators:
         )
 
     def bqremotefunction(
-        self, dataset_id, vectorize_func=False, max_batching_rows=0, **kwargs
+        self,
+        dataset_id,
+        vectorize_func=False,
+        max_batching_rows=0,
+        columnar=False,
+        concurrency=1,
+        timeout=None,
+        cache=None,
+        **kwargs,
     ):
         """
         BigQuery remote function trigger
         dataset_id: Where the function will be registered
         vectorize_func: If True, ensure every argument of your function is a list, and returns a list
         max_batching_rows: Max number of rows in each batch sent to the remote service. 0 for dynamic
+        columnar: If True, every argument of your function is a NumPy array and it returns an array. Requires numpy
+        concurrency: Number of rows of a batch called in parallel, on threads or with asyncio for async functions
+        timeout: Seconds a single row may run before the batch fails
+        cache: True or a dict of maxsize, ttl and redis to cache replies keyed on the arguments of each call
         """
         return self._create_registration_function(
             handler_type="bqremotefunction",
             registration_kwargs={
                 "dataset_id": dataset_id,
                 "vectorize_func": vectorize_func,
+                "columnar": columnar,
+                "concurrency": concurrency,
+                "timeout": timeout,
+                "cache": cache,
                 "max_batching_rows": max_batching_rows,
                 "kwargs": kwargs,
             },
@@ -310,6 +325,8 @@ class Goblet_Decorators:
             )
         if filename:
             with open(filename) as f:
+                import yaml
+
                 openapi_dict = yaml.safe_load(f.read())
         return self._register_infrastructure(
             handler_type="apigateway",
@@ -443,6 +460,7 @@ class Goblet_Decorators:
     def _register_handler(self, handler_type, name, func, kwargs, options=None):
         name = kwargs.get("kwargs", {}).get("name") or name
         self.handlers[handler_type].register(name=name, func=func, kwargs=kwargs)
+        self._active_event_types = None
 
     def _register_infrastructure(self, handler_type, kwargs, options=None):
         return self.infrastructure[handler_type].register(
@@ -453,3 +471,4 @@ class Goblet_Decorators:
         middleware_list = self.middleware_handlers[before_or_after].get(event_type, [])
         middleware_list.append(func)
         self.middleware_handlers[before_or_after][event_type] = middleware_list
+        self._middleware_chains = None
@@ -0,0 +1,101 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from goblet.errors import GobletDeployError
+
+log = logging.getLogger("goblet.deployer")
+log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
+
+
+class DeployNode:
+    def __init__(self, name, func, depends_on=None):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on or [])
+        self.status = "pending"
+        self.duration = None
+        self.error = None
+
+
+class DeployGraph:
+    """Runs deploy steps once their dependencies have completed, with at most `concurrency` steps running at a time.
+    Steps whose dependencies fail are skipped while independent steps keep running. A single failure is re-raised
+    as is, multiple failures are aggregated into a GobletDeployError"""
+
+    def __init__(self, concurrency=1):
+        self.concurrency = max(int(concurrency or 1), 1)
+        self.nodes = {}
+
+    def add(self, name, func, depends_on=None):
+        for dependency in depends_on or []:
+            if dependency not in self.nodes:
+                raise ValueError(f"{name} depends on unknown deploy step {dependency}")
+        self.nodes[name] = DeployNode(name, func, depends_on)
+        return name
+
+    def run(self):
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                for node in self._ready():
+                    node.status = "running"
+                    running[executor.submit(self._run_node, node)] = node
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        future.result()
+                        node.status = "success"
+                    except Exception as e:
+                        node.status = "failed"
+                        node.error = e
+                        log.error(f"deploying {node.name} failed: {e}")
+                    except BaseException:
+                        # SystemExit and KeyboardInterrupt stop the deployment
+                        for pending in running:
+                            pending.cancel()
+                        raise
+        self.log_report()
+        errors = {n.name: n.error for n in self.nodes.values() if n.error}
+        if len(errors) == 1:
+            raise list(errors.values())[0]
+        if errors:
+            raise GobletDeployError(errors)
+        return self.report()
+
+    def _ready(self):
+        ready = []
+        for node in self.nodes.values():
+            if node.status != "pending":
+                continue
+            dependencies = [self.nodes[d] for d in node.depends_on]
+            if any(d.status in ("failed", "skipped") for d in dependencies):
+                node.status = "skipped"
+                log.info(f"skipping {node.name}, a dependency failed")
+            elif all(d.status == "success" for d in dependencies):
+                ready.append(node)
+        return ready
+
+    @staticmethod
+    def _run_node(node):
+        start = time.monotonic()
+        try:
+            return node.func()
+        finally:
+            node.duration = time.monotonic() - start
+
+    def report(self):
+        """List of (name, status, seconds) for each deploy step in the order they were added"""
+        return [(n.name, n.status, n.duration) for n in self.nodes.values()]
+
+    def log_report(self):
+        lines = [
+            f"  {name:<40} {status:<8} "
+            + (f"{duration:.1f}s" if duration is not None else "-")
+            for name, status, duration in self.report()
+        ]
+        log.info("deploy timings:\n" + "\n".join(lines))
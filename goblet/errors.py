@@ -8,3 +8,21 @@ class GobletValidationError(Exception):
 
 class GobletRouteNotFoundError(Exception):
     pass
+
+
+class GobletDeployError(GobletError):
+    def __init__(self, errors):
+        self.errors = errors
+        super(GobletDeployError, self).__init__(
+            "deploy failed for "
+            + ", ".join(f"{name} ({error})" for name, error in errors.items())
+        )
+
+
+class GobletHandlerError(GobletError):
+    def __init__(self, errors):
+        self.errors = errors
+        super(GobletHandlerError, self).__init__(
+            "handlers failed: "
+            + ", ".join(f"{name} ({error})" for name, error in errors.items())
+        )
@@ -1,12 +1,25 @@
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import inspect
 import json
 import logging
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import get_type_hints
 
 from googleapiclient.errors import HttpError
 
+from goblet import serialization
 from goblet.handlers.handler import Handler
-from goblet_gcp_client.client import get_default_project, get_default_location
+from goblet.response import Response
+from goblet.client import get_default_project, get_default_location
 from goblet.permissions import gcp_generic_resource_permissions
 
 
@@ -22,6 +35,173 @@ BIGQUERY_DATATYPES = {
     dict: "JSON",
 }
 
+# Batches with at least this many calls encode and stream their replies in chunks instead of building the whole
+# response body in memory
+STREAM_REPLIES_ROWS = 10000
+
+# max_batching_rows tuning: batches should finish within this fraction of the function timeout and request size
+# limit, and only grow while they still add throughput
+TUNE_TIMEOUT_HEADROOM = 0.5
+TUNE_REQUEST_BYTES = 10 * 1024 * 1024 * 0.8
+TUNE_THROUGHPUT_TARGET = 0.95
+TUNE_MIN_BATCHES = 10
+TUNE_MAX_BATCHES = 5000
+# Fraction of batches logged at INFO for tuning, the others are logged at DEBUG
+BATCH_LOG_SAMPLE_RATE = 0.05
+
+# NumPy dtypes of columns passed to columnar functions, other data types are passed as object arrays
+COLUMNAR_DTYPES = {"INT64": "int64", "FLOAT64": "float64", "BOOL": "bool"}
+
+
+class ResultCache:
+    """In process LRU cache of the replies of a bqremotefunction keyed on its arguments, with an optional time to live
+    in seconds. With redis=True a shared Redis tier is used as well, at the REDIS_HOST and REDIS_PORT of the instance
+    deployed with app.redis. Calls with the same arguments in a batch are looked up and computed once
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=None, redis=False):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.use_redis = redis
+        self._redis = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counts = {"rows": 0, "hits": 0, "redis_hits": 0, "computed": 0}
+
+    @classmethod
+    def from_option(cls, name, cache):
+        """ResultCache for the cache option of the decorator, either True or a dict of keyword arguments"""
+        if not cache:
+            return None
+        if cache is True:
+            return cls(name)
+        if not isinstance(cache, dict):
+            raise ValueError("cache must be True or a dict of cache options")
+        return cls(name, **cache)
+
+    @property
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats["hit_ratio"] = (
+            1 - stats["computed"] / stats["rows"] if stats["rows"] else 0.0
+        )
+        return stats
+
+    @property
+    def redis(self):
+        if self.use_redis and self._redis is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("the redis cache tier requires the redis package")
+            if not os.environ.get("REDIS_HOST"):
+                log.warning(
+                    f"REDIS_HOST is not set, {self.name} caches in process only"
+                )
+                self.use_redis = False
+                return None
+            self._redis = redis.Redis(
+                host=os.environ["REDIS_HOST"],
+                port=int(os.environ.get("REDIS_PORT", 6379)),
+            )
+        return self._redis
+
+    def _redis_key(self, key):
+        return f"goblet:{self.name}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+    def replies(self, bq_tuples, compute):
+        """Replies for the calls of a batch, calling compute with the list of calls that are not cached"""
+        keys = [json.dumps(row, separators=(",", ":")) for row in bq_tuples]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        local_hits = len(found)
+        missing = {}
+        for key, row in zip(keys, bq_tuples):
+            if key not in found and key not in missing:
+                missing[key] = row
+        redis_hits = 0
+        if missing and self.redis is not None:
+            remote = self._redis_get_many(list(missing))
+            redis_hits = len(remote)
+            self.set_many(remote, shared=False)
+            found.update(remote)
+            for key in remote:
+                del missing[key]
+        if missing:
+            computed = dict(zip(missing, compute(list(missing.values()))))
+            self.set_many(computed)
+            found.update(computed)
+        with self.lock:
+            self.counts["rows"] += len(keys)
+            self.counts["hits"] += local_hits
+            self.counts["redis_hits"] += redis_hits
+            self.counts["computed"] += len(missing)
+        # totals are kept in counts and returned by stats, so batches are only logged at DEBUG
+        log.debug(
+            "%s cache served %s of %s rows",
+            self.name,
+            len(keys) - len(missing),
+            len(keys),
+        )
+        return [found[key] for key in keys]
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires is not None and expires <= now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, values, shared=True):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (value, expires)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        if shared and values and self.redis is not None:
+            self._redis_set_many(values)
+
+    def _redis_get_many(self, keys):
+        import redis
+
+        try:
+            values = self.redis.mget([self._redis_key(key) for key in keys])
+        except redis.RedisError as e:
+            log.warning(f"{self.name} redis cache lookup failed: {e}")
+            return {}
+        return {
+            key: json.loads(value)
+            for key, value in zip(keys, values)
+            if value is not None
+        }
+
+    def _redis_set_many(self, values):
+        import redis
+
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, value in values.items():
+            pipeline.set(
+                self._redis_key(key),
+                json.dumps(value),
+                px=None if self.ttl is None else int(self.ttl * 1000),
+            )
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            log.warning(f"{self.name} redis cache update failed: {e}")
+
 
 class BigQueryRemoteFunction(Handler):
     """
@@ -70,12 +250,23 @@ class BigQueryRemoteFunction(Handler):
         """
         dataset_id = kwargs["dataset_id"]
         vectorize_func = kwargs["vectorize_func"]
+        columnar = kwargs.get("columnar", False)
+        if columnar:
+            try:
+                import numpy  # noqa: F401
+            except ImportError:
+                raise ImportError("columnar bqremotefunctions require numpy")
         max_batching_rows = kwargs["max_batching_rows"]
+        concurrency = kwargs.get("concurrency", 1)
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        timeout = kwargs.get("timeout")
+        cache = kwargs.get("cache")
         kwargs = kwargs.pop("kwargs")
         location = kwargs.get("location", get_default_location())
         if location:
             self.connection_locations.add(location)
-        _input, _output = self._get_hints(func, vectorize_func)
+        _input, _output = self._get_hints(func, vectorize_func or columnar)
         # Routine names must contain only letters, numbers, and underscores, and be at most 256 characters long.
         routine_name = self.name + "_" + name
         routine_name = routine_name.replace("-", "_")
@@ -83,11 +274,18 @@ class BigQueryRemoteFunction(Handler):
             "routine_name": routine_name,
             "dataset_id": dataset_id,
             "vectorize_func": vectorize_func,
+            "columnar": columnar,
             "max_batching_rows": max_batching_rows,
             "inputs": _input,
             "output": _output,
             "func": func,
             "location": location,
+            "concurrency": concurrency,
+            "timeout": timeout,
+            # created on the first batch, and replaced after a row times out
+            "executor": None,
+            "executor_lock": threading.Lock(),
+            "cache": ResultCache.from_option(routine_name, cache),
         }
         return True
 
@@ -99,7 +297,7 @@ class BigQueryRemoteFunction(Handler):
                         name for cloudfunction as key on userDefinedContext
 
         :param context:
-        :return: str Json repr
+        :return: str Json repr, or a Response streaming it in chunks for large batches
         """
         user_defined_context = request.json["userDefinedContext"]
         func_name = user_defined_context["X-Goblet-Name"]
@@ -110,15 +308,167 @@ class BigQueryRemoteFunction(Handler):
         if not cloud_method:
             raise ValueError(f"Method {func_name} not found")
         bq_tuples = request.json["calls"]
-        if self.resources[func_name]["vectorize_func"]:
-            unzipped_list = list(map(list, zip(*bq_tuples)))
-            tuples_replies = cloud_method["func"](*unzipped_list)
+        start = time.monotonic()
+        if cloud_method.get("cache") is not None:
+            replies = cloud_method["cache"].replies(
+                bq_tuples, lambda rows: self._replies(cloud_method, rows)
+            )
         else:
-            tuples_replies = []
-            for _tuple in bq_tuples:
-                tuples_replies.append(cloud_method["func"](*_tuple))
-        reply = {"replies": tuples_replies}
-        return json.dumps(reply)
+            replies = self._replies(cloud_method, bq_tuples)
+        self._log_batch(
+            func_name,
+            len(bq_tuples),
+            int(request.headers.get("Content-Length") or 0),
+            time.monotonic() - start,
+            (self.config.bqremotefunction or {}).get(
+                "batch_log_sample_rate", BATCH_LOG_SAMPLE_RATE
+            ),
+        )
+        if len(replies) >= STREAM_REPLIES_ROWS:
+            return Response(
+                serialization.iter_object_array("replies", replies),
+                headers={"Content-Type": "application/json"},
+            )
+        return serialization.dumps({"replies": replies})
+
+    def _replies(self, cloud_method, bq_tuples):
+        """Calls the function of cloud_method on the calls of a batch and returns one reply per call"""
+        if cloud_method.get("columnar"):
+            columns = self._to_columns(bq_tuples, cloud_method["inputs"])
+            return self._columnar_replies(cloud_method["func"](*columns))
+        if cloud_method["vectorize_func"]:
+            unzipped_list = list(map(list, zip(*bq_tuples)))
+            return cloud_method["func"](*unzipped_list)
+        if inspect.iscoroutinefunction(cloud_method["func"]):
+            return self._call_rows_async(cloud_method, bq_tuples)
+        if cloud_method.get("concurrency", 1) > 1:
+            return self._call_rows_threaded(cloud_method, bq_tuples)
+        tuples_replies = []
+        for _tuple in bq_tuples:
+            tuples_replies.append(cloud_method["func"](*_tuple))
+        return tuples_replies
+
+    @staticmethod
+    def _log_batch(
+        routine_name, rows, size, seconds, sample_rate=BATCH_LOG_SAMPLE_RATE
+    ):
+        """Logs the size and latency of a batch. With structured logging the values are also json fields of the
+        entry, which `goblet bqremotefunction tune` reads. Only a sample_rate fraction of batches is logged at INFO,
+        so busy functions do not log every batch"""
+        level = logging.INFO if random.random() < sample_rate else logging.DEBUG
+        if not log.isEnabledFor(level):
+            return
+        log.log(
+            level,
+            f"{routine_name} batch of {rows} rows in {seconds:.3f}s",
+            extra={
+                "json_fields": {
+                    "bqremotefunction_batch": {
+                        "routine": routine_name,
+                        "rows": rows,
+                        "bytes": size,
+                        "seconds": round(seconds, 4),
+                    }
+                }
+            },
+        )
+
+    def cache_stats(self):
+        """Cache statistics of each function registered with cache"""
+        return {
+            name: resource["cache"].stats
+            for name, resource in self.resources.items()
+            if resource.get("cache") is not None
+        }
+
+    @staticmethod
+    def _row_executor(cloud_method):
+        with cloud_method["executor_lock"]:
+            if cloud_method["executor"] is None:
+                cloud_method["executor"] = ThreadPoolExecutor(
+                    max_workers=cloud_method["concurrency"],
+                    thread_name_prefix=cloud_method["routine_name"],
+                )
+            return cloud_method["executor"]
+
+    @staticmethod
+    def _call_rows_threaded(cloud_method, bq_tuples):
+        """Calls the function for each row on a thread pool of size concurrency, keeping the order of replies. A row
+        running longer than timeout fails the batch. A timed out row cannot be interrupted and keeps its worker, so
+        the pool is then replaced for later batches"""
+        executor = BigQueryRemoteFunction._row_executor(cloud_method)
+        func = cloud_method["func"]
+        timeout = cloud_method["timeout"]
+        started = [None] * len(bq_tuples)
+
+        def call_row(i, row):
+            started[i] = time.monotonic()
+            return func(*row)
+
+        def submit(i, row):
+            nonlocal executor
+            while True:
+                try:
+                    # each row runs in a copy of the request context, so app.current_request and app.g are available
+                    return executor.submit(
+                        contextvars.copy_context().run, call_row, i, row
+                    )
+                except RuntimeError:
+                    # the pool was shut down after a row of another batch timed out
+                    replacement = BigQueryRemoteFunction._row_executor(cloud_method)
+                    if replacement is executor:
+                        raise
+                    executor = replacement
+
+        futures = [submit(i, row) for i, row in enumerate(bq_tuples)]
+        replies = []
+        try:
+            for i, future in enumerate(futures):
+                while True:
+                    # time spent queued for a worker does not count towards the timeout
+                    remaining = (
+                        None
+                        if timeout is None
+                        else (
+                            timeout
+                            if started[i] is None
+                            else started[i] + timeout - time.monotonic()
+                        )
+                    )
+                    try:
+                        replies.append(future.result(timeout=remaining))
+                        break
+                    except FutureTimeoutError:
+                        if started[i] is not None:
+                            # work already submitted by other batches still runs on the old pool
+                            with cloud_method["executor_lock"]:
+                                if cloud_method["executor"] is executor:
+                                    cloud_method["executor"] = None
+                                executor.shutdown(wait=False)
+                            raise TimeoutError(
+                                f"{cloud_method['routine_name']} row {i} timed out after {timeout}s"
+                            )
+        finally:
+            for future in futures:
+                future.cancel()
+        return replies
+
+    @staticmethod
+    def _call_rows_async(cloud_method, bq_tuples):
+        """Awaits a coroutine function for each row, at most concurrency rows at a time, keeping the order of
+        replies. A row running longer than timeout fails the batch"""
+        func = cloud_method["func"]
+
+        async def call_rows():
+            semaphore = asyncio.Semaphore(cloud_method["concurrency"])
+
+            async def call_row(row):
+                async with semaphore:
+                    return await asyncio.wait_for(func(*row), cloud_method["timeout"])
+
+            return await asyncio.gather(*[call_row(row) for row in bq_tuples])
+
+        return list(asyncio.run(call_rows()))
 
     def _deploy(self, source=None, entrypoint=None):
         """
@@ -309,6 +659,37 @@ class BigQueryRemoteFunction(Handler):
                 )
                 raise exception
 
+    @staticmethod
+    def _to_columns(bq_tuples, inputs):
+        """Builds one NumPy array per input from the calls of a batch. INT64, FLOAT64 and BOOL columns are typed
+        arrays, NULL values become nan in FLOAT64 columns and make INT64 and BOOL columns object arrays
+        """
+        import numpy as np
+
+        arrays = []
+        for i, _input in enumerate(inputs):
+            column = [call[i] for call in bq_tuples]
+            dtype = COLUMNAR_DTYPES.get(_input["data_type"])
+            if dtype is None or (dtype != "float64" and None in column):
+                arrays.append(np.fromiter(column, dtype=object, count=len(column)))
+            else:
+                arrays.append(np.array(column, dtype=dtype))
+        return arrays
+
+    @staticmethod
+    def _columnar_replies(result):
+        """Replies of a columnar function. Arrays are converted by ndarray.tolist, nan and infinity are returned as
+        NULL"""
+        import numpy as np
+
+        if isinstance(result, np.ndarray):
+            if result.dtype.kind == "f" and not np.isfinite(result).all():
+                replies = result.astype(object)
+                replies[~np.isfinite(result)] = None
+                result = replies
+            result = result.tolist()
+        return list(result)
+
     @staticmethod
     def _get_composite_hint(hint):
         try:
@@ -343,6 +724,142 @@ class BigQueryRemoteFunction(Handler):
                 )
         return inputs, outputs
 
+    def max_batching_rows(self, resource):
+        """max_batching_rows of the routine, from bqremotefunction.max_batching_rows in config.json if set there"""
+        overrides = (self.config.bqremotefunction or {}).get("max_batching_rows") or {}
+        return overrides.get(resource["routine_name"], resource["max_batching_rows"])
+
+    def backend_timeout(self):
+        """Request timeout of the backend in seconds"""
+        if self.backend.resource_type == "cloudfunction":
+            timeout = (self.config.cloudfunction or {}).get("timeout", "60s")
+        elif self.backend.resource_type == "cloudfunctionv2":
+            timeout = (
+                (self.config.cloudfunction_v2 or {})
+                .get("serviceConfig", {})
+                .get("timeoutSeconds", 60)
+            )
+        else:
+            timeout = (self.config.cloudrun_revision or {}).get("timeout", "300s")
+        return float(str(timeout).rstrip("s"))
+
+    def batch_stats(self, days=7):
+        """{routine name: [(rows, bytes, seconds)]} of the batches logged by the deployed functions in the last days"""
+        since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            days=days
+        )
+        body = {
+            "resourceNames": [f"projects/{get_default_project()}"],
+            "filter": f'resource.type="{self.backend.monitoring_type}" '
+            f'AND resource.labels.{self.backend.monitoring_label_key}="{self.name}" '
+            f"AND jsonPayload.bqremotefunction_batch.rows>0 "
+            f'AND timestamp>="{since.isoformat()}"',
+            "orderBy": "timestamp desc",
+            "pageSize": 1000,
+        }
+        samples = {}
+        count = 0
+        while count < TUNE_MAX_BATCHES:
+            resp = self.versioned_clients.logging_entries.execute(
+                "list", params={"body": body}, parent=False
+            )
+            for entry in resp.get("entries", []):
+                batch = entry["jsonPayload"]["bqremotefunction_batch"]
+                samples.setdefault(batch["routine"], []).append(
+                    (int(batch["rows"]), int(batch.get("bytes", 0)), batch["seconds"])
+                )
+                count += 1
+            if not resp.get("nextPageToken"):
+                break
+            body["pageToken"] = resp["nextPageToken"]
+        return samples
+
+    @staticmethod
+    def recommend_max_batching_rows(samples, timeout):
+        """Fits the batch latency to overhead + rows * seconds per row, and returns the number of rows that reaches
+        TUNE_THROUGHPUT_TARGET of the maximum throughput, limited by the timeout and request size. None when there are
+        too few samples"""
+        if len(samples) < TUNE_MIN_BATCHES:
+            return None
+        rows = [s[0] for s in samples]
+        seconds = [s[2] for s in samples]
+        mean_rows = sum(rows) / len(rows)
+        mean_seconds = sum(seconds) / len(seconds)
+        variance = sum((r - mean_rows) ** 2 for r in rows)
+        per_row = 0
+        if variance:
+            per_row = (
+                sum((r - mean_rows) * (t - mean_seconds) for r, t in zip(rows, seconds))
+                / variance
+            )
+        if per_row <= 0:
+            # batch sizes did not vary enough to separate the overhead
+            per_row = mean_seconds / mean_rows
+        overhead = max(mean_seconds - per_row * mean_rows, 0)
+
+        limit = (timeout * TUNE_TIMEOUT_HEADROOM - overhead) / per_row
+        bytes_per_row = sum(s[1] for s in samples) / sum(rows)
+        if bytes_per_row:
+            limit = min(limit, TUNE_REQUEST_BYTES / bytes_per_row)
+        if overhead:
+            target = TUNE_THROUGHPUT_TARGET
+            limit = min(limit, target / (1 - target) * overhead / per_row)
+        limit = max(int(round(limit, 6)), 1)
+        # two significant digits
+        precision = 10 ** max(len(str(limit)) - 2, 0)
+        return limit // precision * precision
+
+    def tune(self, days=7, apply=False):
+        """Recommends max_batching_rows for each function from the logged batches. With apply, updates the deployed
+        routines whose max_batching_rows changed. Returns a list of (routine name, batches, rows per second, current,
+        recommended)"""
+        samples = self.batch_stats(days)
+        timeout = self.backend_timeout()
+        results = []
+        for routine_name, resource in self.resources.items():
+            routine_samples = samples.get(routine_name, [])
+            current = self.max_batching_rows(resource)
+            recommended = self.recommend_max_batching_rows(routine_samples, timeout)
+            rows_per_second = None
+            if routine_samples:
+                rows_per_second = sum(s[0] for s in routine_samples) / max(
+                    sum(s[2] for s in routine_samples), 1e-9
+                )
+            results.append(
+                (
+                    routine_name,
+                    len(routine_samples),
+                    rows_per_second,
+                    current,
+                    recommended,
+                )
+            )
+            if apply and recommended is not None and recommended != current:
+                self.update_max_batching_rows(resource, recommended)
+        return results
+
+    def update_max_batching_rows(self, resource, max_batching_rows):
+        """Sets maxBatchingRows of a deployed routine, if it differs"""
+        params = {
+            "projectId": get_default_project(),
+            "datasetId": resource["dataset_id"],
+            "routineId": resource["routine_name"],
+        }
+        routine = self.versioned_clients.bigquery_routines.execute(
+            "get", params=params, parent=False
+        )
+        options = routine["remoteFunctionOptions"]
+        if options.get("maxBatchingRows") == str(max_batching_rows):
+            return False
+        options["maxBatchingRows"] = str(max_batching_rows)
+        self.versioned_clients.bigquery_routines.execute(
+            "update", params={**params, "body": routine}, parent=False
+        )
+        log.info(
+            f"updated max_batching_rows of {resource['routine_name']} to {max_batching_rows}"
+        )
+        return True
+
     def create_routine_payload(self, resource):
         """
         Create a routine object according to BigQuery specification
@@ -357,7 +874,7 @@ class BigQueryRemoteFunction(Handler):
             "endpoint": self.backend.http_endpoint,
             "connection": f"projects/{get_default_project()}/locations/{resource['location']}/connections/{self.name}",
             "userDefinedContext": {"X-Goblet-Name": resource["routine_name"]},
-            "maxBatchingRows": str(resource["max_batching_rows"]),
+            "maxBatchingRows": str(self.max_batching_rows(resource)),
         }
         routine_reference = {
             "projectId": get_default_project(),
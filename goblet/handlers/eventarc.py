@@ -3,11 +3,12 @@ from goblet.common_cloud_actions import (
     destroy_eventarc_trigger,
 )
 from goblet.response import Response
+from goblet.utils import then
 import logging
 import os
 
 from goblet.handlers.handler import Handler
-from goblet_gcp_client.client import get_default_project, get_default_location
+from goblet.client import get_default_project, get_default_location
 from goblet.permissions import gcp_generic_resource_permissions
 
 log = logging.getLogger("goblet.deployer")
@@ -72,10 +73,7 @@ class EventArc(Handler):
                 break
         if not trigger:
             raise ValueError("No trigger found")
-        response = trigger["func"](request)
-        if not response:
-            response = Response("success")
-        return response
+        return then(trigger["func"](request), lambda r: r or Response("success"))
 
     def __add__(self, other):
         self.resources.extend(other.resources)
@@ -1,14 +1,18 @@
 import logging
 import os
+import threading
 
 from goblet.client import VersionedClients
-from goblet_gcp_client.client import get_default_project, get_default_location
+from goblet.client import get_default_project, get_default_location
 from goblet.common_cloud_actions import check_or_enable_service
 import goblet.globals as g
 
 log = logging.getLogger("goblet.deployer")
 log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
 
+# handlers deployed concurrently update the same backend iam policy
+_invoker_binding_lock = threading.Lock()
+
 
 class Handler:
     """Base Handler class"""
@@ -31,10 +35,15 @@ class Handler:
     ):
         self.config = g.config
         self.name = name
+        # name before handlers reformat it, used in the function path
+        self._cloudfunction_name = name
         self.backend = backend
         self.resources = resources or {}
         self.versioned_clients = versioned_clients or VersionedClients()
-        self.cloudfunction = f"projects/{get_default_project()}/locations/{get_default_location()}/functions/{name}"
+
+    @property
+    def cloudfunction(self):
+        return f"projects/{get_default_project()}/locations/{get_default_location()}/functions/{self._cloudfunction_name}"
 
     def register(self, name, func, kwargs):
         raise NotImplementedError("register")
@@ -91,4 +100,5 @@ class Handler:
 
     def set_invoker_permissions(self):
         if self.service_accounts:
-            self.backend.add_invoker_binding(self.service_accounts)
+            with _invoker_binding_lock:
+                self.backend.add_invoker_binding(self.service_accounts)
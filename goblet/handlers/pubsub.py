@@ -1,5 +1,10 @@
+import asyncio
 import base64
+import contextvars
+import inspect
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from goblet.common_cloud_actions import (
     create_pubsub_subscription,
     destroy_pubsub_subscription,
@@ -11,17 +16,56 @@ from goblet.common_cloud_actions import (
 
 import logging
 
+from goblet.errors import GobletHandlerError
 from goblet.handlers.handler import Handler
-from goblet_gcp_client.client import get_default_project
-from goblet.utils import attributes_to_filter
+from goblet.infrastructures.pubsub import DEFAULT_ACK_DEADLINE, PullSubscriber
+from goblet.utils import attributes_to_filter, gather_results, then
 from goblet.permissions import gcp_generic_resource_permissions, add_binding
-from goblet.client import get_default_project_number
+from goblet.client import get_default_project, get_default_project_number
 from googleapiclient.errors import HttpError
 
 log = logging.getLogger("goblet.deployer")
 log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
 
 
+# Set on push requests of subscriptions with noWrapper and writeMetadata
+NO_WRAPPER_SUBSCRIPTION_HEADER = "X-Goog-Pubsub-Subscription-Name"
+
+DATA_TYPES = (str, bytes, memoryview)
+
+
+class AttributeIndex:
+    """Functions of a topic indexed by one of their attribute filters, so a message is only checked against the
+    functions whose filter can match it rather than every function of the topic"""
+
+    def __init__(self, consumers):
+        self.consumers = consumers
+        self.unfiltered = []
+        self.by_attribute = {}
+        # attributes used by any filter, read from headers for messages without wrapper
+        self.attribute_keys = set()
+        for position, (_, info) in enumerate(consumers):
+            self.attribute_keys.update(info["attributes"])
+            if info["attributes"]:
+                key = next(iter(info["attributes"].items()))
+                self.by_attribute.setdefault(key, []).append(position)
+            else:
+                self.unfiltered.append(position)
+
+    def match(self, attributes):
+        """(name, info) of the functions whose attributes are all in the message attributes, in registration order"""
+        positions = list(self.unfiltered)
+        for item in attributes.items():
+            positions.extend(self.by_attribute.get(item, ()))
+        positions.sort()
+        matched = []
+        for position in positions:
+            name, info = self.consumers[position]
+            if info["attributes"].items() <= attributes.items():
+                matched.append((name, info))
+        return matched
+
+
 class PubSub(Handler):
     """Pubsub topic trigger
     https://cloud.google.com/functions/docs/calling/pubsub
@@ -34,6 +78,17 @@ class PubSub(Handler):
     required_apis = ["pubsub"]
     permissions = gcp_generic_resource_permissions("pubsub", "subscriptions")
 
+    def __init__(self, name, backend, versioned_clients=None, resources=None):
+        super(PubSub, self).__init__(
+            name=name,
+            versioned_clients=versioned_clients,
+            resources=resources,
+            backend=backend,
+        )
+        self._attribute_index = None
+        self._pull_index = None
+        self._executor = None
+
     def register(self, name, func, kwargs):
         topic = kwargs["topic"]
         kwargs = kwargs.pop("kwargs")
@@ -43,34 +98,73 @@ class PubSub(Handler):
         if not filter and attributes:
             filter = attributes_to_filter(attributes)
         project = kwargs.get("project", get_default_project())
+        data_type = kwargs.get("data_type", str)
+        if data_type not in DATA_TYPES:
+            raise ValueError("data_type must be str, bytes or memoryview")
+        mode = kwargs.get("mode", "push")
+        if mode not in ("push", "pull"):
+            raise ValueError("mode must be push or pull")
         deploy_type = "trigger"
-        if (
+        if mode == "pull":
+            deploy_type = "pull"
+        elif (
             kwargs.get("use_subscription")
+            or kwargs.get("no_wrapper")
             or project != get_default_project()
             or self.backend.resource_type == "cloudrun"
         ):
             deploy_type = "subscription"
 
-        if self.resources.get(topic):
-            self.resources[topic][deploy_type][name] = {
-                "func": func,
-                "attributes": attributes,
-                "project": project,
-                "filter": filter,
-                "force_update": kwargs.get("force_update", False),
+        self.resources.setdefault(
+            topic, {"trigger": {}, "subscription": {}, "pull": {}}
+        )
+        self.resources[topic].setdefault(deploy_type, {})
+        self.resources[topic][deploy_type][name] = {
+            "func": func,
+            "attributes": attributes,
+            "project": project,
+            "filter": filter,
+            "config": config,
+            "force_update": kwargs.get("force_update", False),
+            "fanout": kwargs.get("fanout", False),
+            "no_wrapper": kwargs.get("no_wrapper", False),
+            "data_type": data_type,
+        }
+        self._attribute_index = None
+        self._pull_index = None
+
+    def __add__(self, other):
+        super(PubSub, self).__add__(other)
+        self._attribute_index = None
+        self._pull_index = None
+        return self
+
+    @property
+    def attribute_index(self):
+        """{topic: AttributeIndex} of the triggers and subscriptions of each topic. Rebuilt lazily after new
+        functions are registered"""
+        if self._attribute_index is None:
+            self._attribute_index = {
+                topic_name: AttributeIndex(
+                    [*topic["trigger"].items(), *topic["subscription"].items()]
+                )
+                for topic_name, topic in self.resources.items()
             }
-        else:
-            self.resources[topic] = {"trigger": {}, "subscription": {}}
-            self.resources[topic][deploy_type] = {
-                name: {
-                    "func": func,
-                    "attributes": attributes,
-                    "project": project,
-                    "filter": filter,
-                    "config": config,
-                    "force_update": kwargs.get("force_update", False),
-                }
+        return self._attribute_index
+
+    @property
+    def pull_index(self):
+        """{topic: AttributeIndex} of the pull functions of each topic"""
+        if self._pull_index is None:
+            self._pull_index = {
+                topic_name: AttributeIndex(list(topic["pull"].items()))
+                for topic_name, topic in self.resources.items()
+                if topic.get("pull")
             }
+        return self._pull_index
+
+    def pull_subscription_name(self, topic_name):
+        return f"{self.name}-{topic_name}-pull"
 
     def __call__(self, event, context):
         # Trigger
@@ -79,28 +173,168 @@ class PubSub(Handler):
                 topic_name = context.resource.split("/")[-1]
             except AttributeError:
                 topic_name = context.resource["name"].split("/")[-1]
-            data = base64.b64decode(event["data"]).decode("utf-8")
+            payload = base64.b64decode(event["data"])
             attributes = event.get("attributes") or {}
+        # Subscription without wrapper, the body is the message data and attributes are headers
+        elif event.headers.get(NO_WRAPPER_SUBSCRIPTION_HEADER):
+            subscription = event.headers[NO_WRAPPER_SUBSCRIPTION_HEADER].split("/")[-1]
+            topic_name = subscription.replace(self.name + "-", "", 1)
+            payload = event.get_data()
+            attributes = None
         # Subscription
         else:
             subscription = event.json["subscription"].split("/")[-1]
             topic_name = subscription.replace(self.name + "-", "", 1)
-            data = base64.b64decode(event.json["message"]["data"]).decode("utf-8")
+            payload = base64.b64decode(event.json["message"]["data"])
             attributes = event.json["message"].get("attributes") or {}
 
-        topic = self.resources.get(topic_name)
-        if not topic:
+        index = self.attribute_index.get(topic_name)
+        if not index:
             raise ValueError(f"Topic {topic_name} not found")
+        if attributes is None:
+            attributes = {
+                key: event.headers[key]
+                for key in index.attribute_keys
+                if key in event.headers
+            }
+        return self._dispatch(index, payload, attributes)
 
-        # check attributes
-        response = None
-        for _, info in topic["trigger"].items():
-            if info["attributes"].items() <= attributes.items():
-                response = info["func"](data)
-        for _, info in topic["subscription"].items():
-            if info["attributes"].items() <= attributes.items():
-                response = info["func"](data)
-        return response or "success"
+    def _dispatch(self, index, payload, attributes):
+        """Runs the functions of index matching the message attributes with the message payload"""
+        consumers = index.match(attributes)
+        converted = {}
+
+        def data(info):
+            """Message data as the data_type of the function, converted once per type"""
+            data_type = info.get("data_type", str)
+            if data_type not in converted:
+                converted[data_type] = (
+                    payload.decode("utf-8") if data_type is str else data_type(payload)
+                )
+            return converted[data_type]
+
+        if sum(1 for _, info in consumers if info.get("fanout")) > 1:
+            return then(self._fanout(consumers, data), self._last_response)
+        responses = [info["func"](data(info)) for _, info in consumers]
+        if any(inspect.isawaitable(r) for r in responses):
+            return then(gather_results(responses), self._last_response)
+        return self._last_response(responses)
+
+    def pull(self, topics=None, timeout=None, background=False, **kwargs):
+        """Consumes the pull subscriptions of topics, every topic with functions registered with mode="pull" by
+        default, until timeout seconds elapsed. kwargs configure each PullSubscriber, for example
+        max_outstanding_messages or max_workers. With background=True the started subscribers are returned without
+        waiting, to run alongside a Cloud Run service until their stop method is called
+        """
+        topics = topics or list(self.pull_index)
+        for topic_name in topics:
+            if topic_name not in self.pull_index:
+                raise ValueError(f"Topic {topic_name} has no pull functions")
+        subscribers = [
+            PullSubscriber(
+                "projects/{project_id}/subscriptions/"
+                + self.pull_subscription_name(topic_name),
+                self._pull_callback(self.pull_index[topic_name]),
+                **{
+                    "ack_deadline": self._pull_subscription_config(topic_name)[
+                        "ackDeadlineSeconds"
+                    ],
+                    **kwargs,
+                },
+            ).start()
+            for topic_name in topics
+        ]
+        if background:
+            return subscribers
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            for subscriber in subscribers:
+                subscriber.wait(
+                    None if deadline is None else max(deadline - time.monotonic(), 0)
+                )
+        finally:
+            for subscriber in subscribers:
+                subscriber.stop()
+        return subscribers
+
+    def _pull_callback(self, index):
+        def callback(message):
+            result = self._dispatch(
+                index,
+                base64.b64decode(message.get("data", "")),
+                message.get("attributes") or {},
+            )
+            if inspect.isawaitable(result):
+                asyncio.run(result)
+
+        return callback
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="goblet-pubsub")
+        return self._executor
+
+    def _fanout(self, consumers, data):
+        """Runs the functions registered with fanout=True concurrently, on a thread pool or awaited together when
+        async, alongside the other matching functions. data(info) is the message data of a function. Responses are
+        returned in registration order once all functions finished. A single failure is raised as is, multiple
+        failures are aggregated into a GobletHandlerError
+        """
+        results = []
+        for _, info in consumers:
+            if info.get("fanout") and not inspect.iscoroutinefunction(info["func"]):
+                results.append(
+                    self.executor.submit(
+                        contextvars.copy_context().run, info["func"], data(info)
+                    )
+                )
+                continue
+            try:
+                results.append(info["func"](data(info)))
+            except Exception as e:
+                results.append(e)
+        names = [name for name, _ in consumers]
+        if any(inspect.isawaitable(r) for r in results):
+            return self._gather_fanout(names, results)
+        return self._aggregate(names, [self._future_result(r) for r in results])
+
+    async def _gather_fanout(self, names, results):
+        async def result(r):
+            if isinstance(r, Future):
+                return await asyncio.wrap_future(r)
+            return await r if inspect.isawaitable(r) else r
+
+        return self._aggregate(
+            names,
+            await asyncio.gather(*[result(r) for r in results], return_exceptions=True),
+        )
+
+    @staticmethod
+    def _future_result(result):
+        if not isinstance(result, Future):
+            return result
+        try:
+            return result.result()
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _aggregate(names, results):
+        errors = {
+            name: result
+            for name, result in zip(names, results)
+            if isinstance(result, Exception)
+        }
+        if len(errors) == 1:
+            raise list(errors.values())[0]
+        if errors:
+            raise GobletHandlerError(errors)
+        return results
+
+    @staticmethod
+    def _last_response(responses):
+        return (responses[-1] if responses else None) or "success"
 
     def _deploy(self, source=None, entrypoint=None):
         if not self.resources:
@@ -114,6 +348,11 @@ class PubSub(Handler):
             # Deploy subscriptions
             for _, topic_info in self.resources[topic_name]["subscription"].items():
                 self._deploy_subscription(topic_name=topic_name, topic=topic_info)
+            # Deploy pull subscription shared by the pull functions of the topic
+            if self.resources[topic_name].get("pull"):
+                self._deploy_pull_subscription(
+                    topic_name, list(self.resources[topic_name]["pull"].values())
+                )
 
     def _deploy_subscription(self, topic_name, topic):
         sub_name = f"{self.name}-{topic_name}"
@@ -154,6 +393,11 @@ class PubSub(Handler):
                         "serviceAccountEmail": service_account,
                         "audience": push_url,
                     },
+                    **(
+                        {"noWrapper": {"writeMetadata": True}}
+                        if topic.get("no_wrapper")
+                        else {}
+                    ),
                 }
             ),
             "labels": self.config.labels,
@@ -184,6 +428,38 @@ class PubSub(Handler):
                         f"User is not authorized to add IAM role 'roles/pubsub.subscriber' to subscription '{sub_name}' you need to handle this manually."
                     )
 
+    def _pull_subscription_config(self, topic_name):
+        """Subscription config of the pull functions of topic_name. The ack deadline matches the lease of the
+        PullSubscriber unless it is configured"""
+        config = {"ackDeadlineSeconds": DEFAULT_ACK_DEADLINE}
+        for consumer in self.resources[topic_name]["pull"].values():
+            config.update(consumer["config"])
+        return config
+
+    def _deploy_pull_subscription(self, topic_name, consumers):
+        sub_name = self.pull_subscription_name(topic_name)
+        log.info(f"deploying pubsub pull subscription {sub_name}......")
+        # A message is delivered if any function can match it
+        filters = [consumer["filter"] for consumer in consumers]
+        if not all(filters):
+            filter = ""
+        elif len(set(filters)) == 1:
+            filter = filters[0]
+        else:
+            filter = " OR ".join(f"({f})" for f in dict.fromkeys(filters))
+        config = self._pull_subscription_config(topic_name)
+        create_pubsub_subscription(
+            client=self.versioned_clients.pubsub,
+            sub_name=sub_name,
+            req_body={
+                "topic": f"projects/{consumers[0]['project']}/topics/{topic_name}",
+                "filter": filter,
+                "labels": self.config.labels,
+                **config,
+            },
+            force_update=any(consumer["force_update"] for consumer in consumers),
+        )
+
     def _deploy_trigger(self, topic_name, source=None, entrypoint=None):
         function_name = f"{self.cloudfunction}-topic-{topic_name}"
         log.info(f"deploying topic function {function_name}......")
@@ -251,7 +527,8 @@ class PubSub(Handler):
                 log.info(f'Detected unused subscription in GCP {filtered_sub["name"]}')
                 if not dryrun:
                     destroy_pubsub_subscription(
-                        self.versioned_clients.pubsub, f"{self.name}-{filtered_name}"
+                        self.versioned_clients.pubsub,
+                        filtered_sub["name"].split("/")[-1],
                     )
 
     def is_http(self):
@@ -278,3 +555,8 @@ class PubSub(Handler):
                 destroy_pubsub_subscription(
                     self.versioned_clients.pubsub, f"{self.name}-{topic_name}"
                 )
+            if self.resources[topic_name].get("pull"):
+                destroy_pubsub_subscription(
+                    self.versioned_clients.pubsub,
+                    self.pull_subscription_name(topic_name),
+                )
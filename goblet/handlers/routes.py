@@ -1,19 +1,14 @@
 from collections import OrderedDict
-from marshmallow.schema import Schema
-from pydantic import BaseModel
 import logging
 import os
 import re
 from typing import get_type_hints
-from apispec import APISpec
-from apispec.ext.marshmallow import MarshmallowPlugin
 from enum import Enum
 
 import goblet
 
 from goblet.handlers.handler import Handler
-from goblet.handlers.plugins.pydantic import PydanticPlugin
-from goblet.utils import get_g_dir
+from goblet.utils import get_g_dir, then
 from goblet.common_cloud_actions import deploy_apigateway, destroy_apigateway
 from goblet.permissions import gcp_generic_resource_permissions
 from goblet.errors import GobletRouteNotFoundError
@@ -56,6 +51,7 @@ class Routes(Handler):
         self.cors = cors or {}
         self.routes_type = routes_type
         self.marshmallow_attribute_function = None
+        self._route_trie = None
 
     def format_name(self, name):
         # ([a-z0-9-.]+) for api gateway name
@@ -88,19 +84,27 @@ class Routes(Handler):
             entry = RouteEntry(handle_cors_options, name, path, "OPTIONS", **kwargs)
             path_entries["OPTIONS"] = entry
         self.resources[path] = path_entries
+        self._route_trie = None
+
+    def __add__(self, other):
+        super(Routes, self).__add__(other)
+        self._route_trie = None
+        return self
+
+    @property
+    def route_trie(self):
+        """Segment trie compiled from registered routes. Rebuilt lazily after new routes are registered"""
+        if self._route_trie is None:
+            self._route_trie = RouteTrie(self.resources)
+        return self._route_trie
 
     def __call__(self, request, context=None):
         method = request.method
         path = request.path
-        entry = self.resources.get(path, {}).get(method)
-        if not entry:
-            # search param paths "/{PARAM}"
-            for p in self.resources:
-                if "{" in p and self._matched_path(p, path):
-                    entry = self.resources.get(p, {}).get(method)
+        entry, view_args = self.route_trie.match(path, method)
         if not entry:
             raise GobletRouteNotFoundError(f"No route found for {path} with {method}")
-        return entry(request)
+        return entry(request, view_args=view_args)
 
     @staticmethod
     def _matched_path(org_path, path):
@@ -181,6 +185,9 @@ PRIMITIVE_MAPPINGS = {str: "string", bool: "boolean", int: "integer"}
 
 
 class OpenApiSpec:
+    """Swagger 2.0 spec of the routes of an app, used by API Gateway. apispec, marshmallow and pydantic are imported
+    when a spec is built, so serving requests does not load them"""
+
     def __init__(
         self,
         app_name,
@@ -206,6 +213,10 @@ class OpenApiSpec:
             )
         self.options["schemes"] = ["https"]
         self.options["produces"] = ["application/json"]
+        from apispec import APISpec
+        from apispec.ext.marshmallow import MarshmallowPlugin
+        from goblet.handlers.plugins.pydantic import PydanticPlugin
+
         marshmallow_plugin = MarshmallowPlugin()
         pydantic_plugin = PydanticPlugin()
         # Support existing spec. Needs to be version "2.0"
@@ -244,6 +255,9 @@ class OpenApiSpec:
                 self.add_route(entry)
 
     def get_param_type(self, type_info, only_primititves=False):
+        from marshmallow.schema import Schema
+        from pydantic import BaseModel
+
         if not type_info:
             return {"type": "string"}
         if type_info in PRIMITIVE_MAPPINGS.keys():
@@ -339,6 +353,9 @@ class OpenApiSpec:
         """
         Return openapi spec response content for the given return type
         """
+        from marshmallow.schema import Schema
+        from pydantic import BaseModel
+
         if return_type in PRIMITIVE_MAPPINGS.keys():
             return {"schema": {"type": PRIMITIVE_MAPPINGS[return_type]}}
         # list
@@ -426,10 +443,11 @@ class RouteEntry:
                 matches += 1
         return args
 
-    def __call__(self, request):
-        args = self._extract_view_args(request.path)
-        resp = self.route_function(**args)
-        return self._apply_cors(resp)
+    def __call__(self, request, view_args=None):
+        if view_args is None:
+            view_args = self._extract_view_args(request.path)
+        resp = self.route_function(**view_args)
+        return then(resp, self._apply_cors)
 
     def _parse_view_args(self):
         if "{" not in self.uri_pattern:
@@ -464,6 +482,61 @@ class RouteEntry:
         return resp
 
 
+class _RouteNode:
+    __slots__ = ("static", "param", "entries")
+
+    def __init__(self):
+        self.static = {}
+        self.param = None
+        self.entries = {}
+
+
+class RouteTrie:
+    """Routes compiled into a trie of path segments. Static segments take priority over {param} segments,
+    so a lookup costs O(path segments) instead of O(registered routes)"""
+
+    def __init__(self, resources=None):
+        self.root = _RouteNode()
+        for path, methods in (resources or {}).items():
+            self.add(path, methods)
+
+    def add(self, path, methods):
+        node = self.root
+        for segment in path.split("/"):
+            if _PARAMS.fullmatch(segment):
+                if node.param is None:
+                    node.param = _RouteNode()
+                node = node.param
+            else:
+                node = node.static.setdefault(segment, _RouteNode())
+        node.entries.update(methods)
+
+    def match(self, path, method):
+        """Return a tuple of the matching RouteEntry and its view args, or (None, None)"""
+        values = []
+        entry = self._match(self.root, path.split("/"), 0, method, values)
+        if not entry:
+            return None, None
+        return entry, dict(zip(entry.view_args, values))
+
+    def _match(self, node, segments, index, method, values):
+        if index == len(segments):
+            return node.entries.get(method)
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child:
+            entry = self._match(child, segments, index + 1, method, values)
+            if entry:
+                return entry
+        if node.param and segment:
+            values.append(segment)
+            entry = self._match(node.param, segments, index + 1, method, values)
+            if entry:
+                return entry
+            values.pop()
+        return None
+
+
 class CORSConfig(object):
     """A cors configuration to attach to a route."""
 
@@ -2,7 +2,7 @@ import logging
 import os
 
 from goblet.handlers.handler import Handler
-from goblet_gcp_client.client import get_default_project, get_default_location
+from goblet.client import get_default_project, get_default_location
 
 from goblet.common_cloud_actions import get_cloudrun_url
 from goblet.permissions import gcp_generic_resource_permissions, add_binding
@@ -2,7 +2,7 @@ import logging
 import os
 
 from goblet.handlers.handler import Handler
-from goblet_gcp_client.client import get_default_project, get_default_location
+from goblet.client import get_default_project
 from goblet.common_cloud_actions import (
     get_function_runtime,
     create_cloudfunctionv2,
@@ -37,7 +37,6 @@ class Storage(Handler):
             backend=backend,
         )
         self.resources = resources or []
-        self.cloudfunction = f"projects/{get_default_project()}/locations/{get_default_location()}/functions/{name}"
 
     def validate_event_type(self, event_type):
         gcf_version = self.versioned_clients.cloudfunctions.version[:2]
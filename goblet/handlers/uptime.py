@@ -4,7 +4,7 @@ import os
 from goblet.handlers.handler import Handler
 from goblet.permissions import gcp_generic_resource_permissions
 from goblet.utils import nested_update
-from goblet_gcp_client.client import get_default_project, get_default_location
+from goblet.client import get_default_project, get_default_location
 from googleapiclient.errors import HttpError
 
 log = logging.getLogger("goblet.deployer")
@@ -4,12 +4,8 @@ import inspect
 
 from googleapiclient.errors import HttpError
 from goblet.infrastructures.infrastructure import Infrastructure
-from goblet_gcp_client.client import (
-    get_default_project,
-    get_default_location,
-)
 from goblet.permissions import gcp_generic_resource_permissions
-from goblet.client import VersionedClients
+from goblet.client import VersionedClients, get_default_project, get_default_location
 
 
 log = logging.getLogger("goblet.deployer")
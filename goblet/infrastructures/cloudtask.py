@@ -1,12 +1,15 @@
 import json
+import random
+import threading
+import time
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.errors import HttpError
 from goblet.infrastructures.infrastructure import Infrastructure
 from goblet.permissions import gcp_generic_resource_permissions
 import logging
 import os
 import datetime
-from google.protobuf import duration_pb2, timestamp_pb2
 from goblet.client import VersionedClients
 
 log = logging.getLogger("goblet.deployer")
@@ -19,18 +22,19 @@ class CloudTaskClient:
         self.queue = queue
         self.backend = backend
 
-    def build_task(self, target, payload, in_seconds, task_name, deadline):
+    def build_task(self, target, payload, in_seconds, task_name, deadline, url=None):
         # https://cloud.google.com/tasks/docs/reference/rest/v2/projects.locations.queues.tasks/create
+        url = url or self.backend.http_endpoint
         task = {
             "httpRequest": {
                 "httpMethod": "POST",
                 "headers": {
                     "X-Goblet-CloudTask-Target": target,
                 },
-                "url": self.backend.http_endpoint,
+                "url": url,
                 "oidcToken": {
                     "serviceAccountEmail": self.service_account,
-                    "audience": self.backend.http_endpoint,
+                    "audience": url,
                 },
             }
         }
@@ -52,6 +56,8 @@ class CloudTaskClient:
             d = datetime.datetime.utcnow() + datetime.timedelta(seconds=in_seconds)
 
             # Create Timestamp protobuf.
+            from google.protobuf import timestamp_pb2
+
             timestamp = timestamp_pb2.Timestamp()
             timestamp.FromDatetime(d)
 
@@ -64,6 +70,8 @@ class CloudTaskClient:
 
         if deadline is not None:
             # Add dispatch deadline for requests sent to the worker.
+            from google.protobuf import duration_pb2
+
             duration = duration_pb2.Duration()
             duration.FromSeconds(deadline)
             task["dispatchDeadline"] = duration.ToJsonString()
@@ -76,6 +84,92 @@ class CloudTaskClient:
             "create", parent_schema=self.queue, params={"body": {"task": task}}
         )
 
+    def enqueue_many(self, tasks, max_workers=10, max_retries=5, backoff=0.5):
+        """Enqueue tasks concurrently over a bounded thread pool. Each task is a dict of enqueue keyword arguments
+        (target, payload, in_seconds, task_name, deadline). Creates failing with 429 or 5xx are retried with
+        exponential backoff. Returns an EnqueueManyResult with per task responses and failures
+        """
+        url = self.backend.http_endpoint
+        result = EnqueueManyResult()
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._create_with_retry,
+                    self.build_task(
+                        task["target"],
+                        task.get("payload"),
+                        task.get("in_seconds"),
+                        task.get("task_name"),
+                        task.get("deadline"),
+                        url=url,
+                    ),
+                    max_retries,
+                    backoff,
+                    result,
+                )
+                for task in tasks
+            ]
+            for index, future in enumerate(futures):
+                try:
+                    result.responses.append(future.result())
+                except Exception as e:
+                    result.responses.append(None)
+                    result.failures.append((index, e))
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def _create_with_retry(self, task, max_retries, backoff, result):
+        attempt = 0
+        while True:
+            try:
+                return VersionedClients().cloudtask.execute(
+                    "create",
+                    parent_schema=self.queue,
+                    params={"body": {"task": task}},
+                )
+            except HttpError as e:
+                if attempt and task.get("name") and int(e.resp.status) == 409:
+                    # a retried named task already exists when an earlier attempt was created but its
+                    # response was lost
+                    return task
+                if attempt >= max_retries or not _is_retryable(e):
+                    raise e
+                result.add_retry()
+                time.sleep(backoff * 2**attempt * (1 + random.random()))
+                attempt += 1
+
+
+def _is_retryable(error):
+    status = int(error.resp.status)
+    return status == 429 or status >= 500
+
+
+class EnqueueManyResult:
+    """Per task responses (None for failed tasks, in the order tasks were given), failures as (index, exception)
+    tuples and throughput counters for CloudTaskClient.enqueue_many"""
+
+    def __init__(self):
+        self.responses = []
+        self.failures = []
+        self.retries = 0
+        self.elapsed = 0
+        self._lock = threading.Lock()
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        enqueued = len(self.responses) - len(self.failures)
+        return {
+            "enqueued": enqueued,
+            "failed": len(self.failures),
+            "retries": self.retries,
+            "elapsed": self.elapsed,
+            "tasks_per_second": enqueued / self.elapsed if self.elapsed else 0,
+        }
+
 
 class CloudTaskQueue(Infrastructure):
     resource_type = "cloudtaskqueue"
@@ -1,6 +1,10 @@
 import json
 import logging
+import threading
+import time
+from collections import deque
 from base64 import b64encode
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from googleapiclient.errors import HttpError
 from goblet.infrastructures.infrastructure import Infrastructure
 from goblet.client import VersionedClients
@@ -15,24 +19,402 @@ log = logging.getLogger("goblet.deployer")
 log.setLevel(logging.INFO)
 
 
+# Pub/Sub allows at most 1000 messages and 10MB per publish request
+MAX_PUBLISH_MESSAGES = 1000
+MAX_PUBLISH_BYTES = 9 * 1024 * 1024
+# Pub/Sub returns at most 1000 messages per pull, acknowledge requests are kept to 1000 ack ids
+MAX_PULL_MESSAGES = 1000
+MAX_ACK_IDS = 1000
+# ackDeadlineSeconds of goblet pull subscriptions and the lease PullSubscriber keeps on each message
+DEFAULT_ACK_DEADLINE = 60
+
+
+class PubSubMessage:
+    """Message with optional attributes and ordering key for PubSubClient.publish_many and BatchPublisher"""
+
+    def __init__(self, data, attributes=None, ordering_key=None):
+        self.data = data
+        self.attributes = attributes
+        self.ordering_key = ordering_key
+
+    def payload(self):
+        """Pub/Sub PubsubMessage body. Bytes are sent as is, any other data is json encoded"""
+        data = self.data
+        if not isinstance(data, bytes):
+            data = json.dumps(data).encode()
+        payload = {"data": b64encode(data).decode("utf8")}
+        if self.attributes:
+            payload["attributes"] = self.attributes
+        if self.ordering_key:
+            payload["orderingKey"] = self.ordering_key
+        return payload
+
+
+def _payload_size(payload):
+    size = len(payload["data"]) + len(payload.get("orderingKey", ""))
+    for k, v in payload.get("attributes", {}).items():
+        size += len(k) + len(v)
+    return size
+
+
 class PubSubClient:
     def __init__(self, topic):
         self.topic = topic
 
-    def publish(self, message):
-        message = json.dumps(message)
+    def publish(self, message, attributes=None, ordering_key=None):
+        return self._publish_payloads(
+            [PubSubMessage(message, attributes, ordering_key).payload()]
+        )
+
+    def publish_many(
+        self,
+        messages,
+        max_messages=MAX_PUBLISH_MESSAGES,
+        max_bytes=MAX_PUBLISH_BYTES,
+    ):
+        """Publish messages packing up to max_messages or max_bytes into each publish request. Messages can be
+        PubSubMessage instances or raw data. Returns message ids in the order of messages
+        """
+        max_messages = min(max_messages, MAX_PUBLISH_MESSAGES)
+        message_ids = []
+        batch = []
+        batch_bytes = 0
+        for message in messages:
+            if not isinstance(message, PubSubMessage):
+                message = PubSubMessage(message)
+            payload = message.payload()
+            size = _payload_size(payload)
+            if batch and (len(batch) >= max_messages or batch_bytes + size > max_bytes):
+                message_ids.extend(self._publish_payloads(batch)["messageIds"])
+                batch = []
+                batch_bytes = 0
+            batch.append(payload)
+            batch_bytes += size
+        if batch:
+            message_ids.extend(self._publish_payloads(batch)["messageIds"])
+        return message_ids
+
+    def batch(
+        self,
+        max_messages=100,
+        max_bytes=MAX_PUBLISH_BYTES,
+        max_latency=0.05,
+    ):
+        """Buffered publisher which flushes in the background once max_messages, max_bytes or max_latency
+        (seconds since the oldest buffered message) is reached"""
+        return BatchPublisher(
+            self,
+            max_messages=max_messages,
+            max_bytes=max_bytes,
+            max_latency=max_latency,
+        )
+
+    def _publish_payloads(self, payloads):
         return VersionedClients().pubsub_topic.execute(
             "publish",
             parent_key="topic",
             parent_schema=self.topic,
-            params={
-                "body": {
-                    "messages": [{"data": b64encode(message.encode()).decode("utf8")}]
-                }
-            },
+            params={"body": {"messages": payloads}},
         )
 
 
+class BatchPublisher:
+    """Buffers published messages and sends them in batches from a background thread. publish returns a
+    concurrent.futures.Future which resolves to the message id. Use as a context manager or call close to
+    flush remaining messages"""
+
+    def __init__(
+        self,
+        client,
+        max_messages=100,
+        max_bytes=MAX_PUBLISH_BYTES,
+        max_latency=0.05,
+    ):
+        self.client = client
+        self.max_messages = min(max_messages, MAX_PUBLISH_MESSAGES)
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._flush_requested = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, message, attributes=None, ordering_key=None):
+        payload = PubSubMessage(message, attributes, ordering_key).payload()
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchPublisher is closed")
+            first = not self._pending
+            # the enqueue time is kept so the latency deadline follows the oldest message still buffered
+            self._pending.append((payload, future, time.monotonic()))
+            self._pending_bytes += _payload_size(payload)
+            if first or self._is_full():
+                self._condition.notify()
+        return future
+
+    def flush(self):
+        """Send all buffered messages and wait for them to be published"""
+        with self._condition:
+            futures = [f for _, f, _ in self._pending]
+            self._flush_requested = True
+            self._condition.notify()
+        wait(futures)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _is_full(self):
+        return (
+            len(self._pending) >= self.max_messages
+            or self._pending_bytes >= self.max_bytes
+        )
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._condition.wait()
+            while not (self._closed or self._flush_requested or self._is_full()):
+                remaining = self._pending[0][2] + self.max_latency - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            batch_bytes = 0
+            while self._pending and len(batch) < self.max_messages:
+                size = _payload_size(self._pending[0][0])
+                if batch and batch_bytes + size > self.max_bytes:
+                    break
+                payload, future, _ = self._pending.popleft()
+                batch.append((payload, future))
+                batch_bytes += size
+            self._pending_bytes -= batch_bytes
+            if not self._pending:
+                self._flush_requested = False
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                message_ids = self.client._publish_payloads([p for p, _ in batch])[
+                    "messageIds"
+                ]
+                for (_, future), message_id in zip(batch, message_ids):
+                    future.set_result(message_id)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class PullSubscriber:
+    """Consumes a pull subscription. Messages are pulled up to max_messages at a time and callback(message) is run
+    on a pool of max_workers threads with the PubsubMessage dict. Pulling pauses while max_outstanding_messages or
+    max_outstanding_bytes are being processed. The ack deadline of each message is set to ack_deadline when it is
+    received and extended every ack_deadline / 2 seconds while it is processed. Messages are acknowledged once callback returns, or nacked for redelivery when it
+    raises, in batches sent every ack_latency seconds. Uses the Pub/Sub emulator when PUBSUB_EMULATOR_HOST is set
+    """
+
+    def __init__(
+        self,
+        subscription,
+        callback,
+        max_messages=100,
+        max_outstanding_messages=1000,
+        max_outstanding_bytes=100 * 1024 * 1024,
+        max_workers=10,
+        ack_deadline=DEFAULT_ACK_DEADLINE,
+        ack_latency=0.1,
+        client=None,
+    ):
+        self.subscription = subscription
+        self.callback = callback
+        self.max_messages = min(max_messages, MAX_PULL_MESSAGES)
+        self.max_outstanding_messages = max_outstanding_messages
+        self.max_outstanding_bytes = max_outstanding_bytes
+        self.max_workers = max_workers
+        self.ack_deadline = ack_deadline
+        self.ack_latency = ack_latency
+        self._client = client
+        self.stats = {"received": 0, "acked": 0, "nacked": 0}
+        self._outstanding = {}
+        self._outstanding_bytes = 0
+        # ack_id -> monotonic time the lease of an outstanding message is next extended
+        self._leases = {}
+        self._acks = []
+        self._nacks = []
+        self._pulling = False
+        self._stopped = threading.Event()
+        self._condition = threading.Condition()
+        self._executor = None
+        self._pull_thread = None
+        self._ack_thread = None
+
+    @property
+    def client(self):
+        """Resolved in the thread using it, since clients are not thread safe"""
+        return self._client or VersionedClients().pubsub
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="goblet-pull"
+        )
+        self._pulling = True
+        self._pull_thread = threading.Thread(target=self._pull_loop, daemon=True)
+        self._ack_thread = threading.Thread(target=self._ack_loop, daemon=True)
+        self._pull_thread.start()
+        self._ack_thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Blocks until stop is called or timeout seconds elapsed. Returns True if stopped"""
+        return self._stopped.wait(timeout)
+
+    def stop(self):
+        """Stops pulling, waits for outstanding messages to be processed and sends their acks"""
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._pull_thread:
+            self._pull_thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        if self._ack_thread:
+            self._ack_thread.join()
+
+    def run(self, timeout=None):
+        """Processes messages until timeout seconds elapsed or stop is called from another thread"""
+        self.start()
+        try:
+            self.wait(timeout)
+        finally:
+            self.stop()
+        return self.stats
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _is_full(self):
+        return (
+            len(self._outstanding) >= self.max_outstanding_messages
+            or self._outstanding_bytes >= self.max_outstanding_bytes
+        )
+
+    def _pull_loop(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._stopped.is_set() and self._is_full():
+                        self._condition.wait()
+                    if self._stopped.is_set():
+                        return
+                    count = min(
+                        self.max_messages,
+                        self.max_outstanding_messages - len(self._outstanding),
+                    )
+                try:
+                    received = self._pull(count)
+                except Exception as e:
+                    log.error(f"pulling from {self.subscription} failed: {e}")
+                    self._stopped.wait(1)
+                    continue
+                for received_message in received:
+                    ack_id = received_message["ackId"]
+                    message = received_message["message"]
+                    size = _payload_size(
+                        {
+                            "data": message.get("data", ""),
+                            "attributes": message.get("attributes") or {},
+                        }
+                    )
+                    with self._condition:
+                        self._outstanding[ack_id] = size
+                        self._outstanding_bytes += size
+                        # the lease is set by the next iteration of the ack loop
+                        self._leases[ack_id] = 0
+                        self.stats["received"] += 1
+                    self._executor.submit(self._process, ack_id, message)
+        finally:
+            with self._condition:
+                self._pulling = False
+
+    def _process(self, ack_id, message):
+        try:
+            self.callback(message)
+            acked = True
+        except Exception as e:
+            log.error(
+                f"processing message {message.get('messageId')} from {self.subscription} failed: {e}"
+            )
+            acked = False
+        with self._condition:
+            (self._acks if acked else self._nacks).append(ack_id)
+            self._outstanding_bytes -= self._outstanding.pop(ack_id)
+            self._leases.pop(ack_id, None)
+            self._condition.notify_all()
+
+    def _ack_loop(self):
+        while True:
+            time.sleep(self.ack_latency)
+            now = time.monotonic()
+            with self._condition:
+                acks, self._acks = self._acks, []
+                nacks, self._nacks = self._nacks, []
+                leases = [ack_id for ack_id, at in self._leases.items() if at <= now]
+                for ack_id in leases:
+                    self._leases[ack_id] = now + self.ack_deadline / 2
+                done = not self._pulling and not self._outstanding
+            self._send("acknowledge", acks)
+            self._send("modifyAckDeadline", nacks, ackDeadlineSeconds=0)
+            self.stats["acked"] += len(acks)
+            self.stats["nacked"] += len(nacks)
+            self._send(
+                "modifyAckDeadline", leases, ackDeadlineSeconds=self.ack_deadline
+            )
+            if done:
+                return
+
+    def _pull(self, count):
+        return self.client.execute(
+            "pull",
+            parent_key="subscription",
+            parent_schema=self.subscription,
+            params={"body": {"maxMessages": count}},
+        ).get("receivedMessages", [])
+
+    def _send(self, method, ack_ids, **body):
+        for i in range(0, len(ack_ids), MAX_ACK_IDS):
+            try:
+                self.client.execute(
+                    method,
+                    parent_key="subscription",
+                    parent_schema=self.subscription,
+                    params={"body": {"ackIds": ack_ids[i : i + MAX_ACK_IDS], **body}},
+                )
+            except Exception as e:
+                log.error(f"{method} on {self.subscription} failed: {e}")
+
+
 class PubSubTopic(Infrastructure):
     resource_type = "pubsub_topic"
     required_apis = ["pubsub"]
@@ -1,7 +1,14 @@
 from __future__ import annotations
+import asyncio
+import contextvars
+import inspect
 import os
 import logging
+import threading
+from collections.abc import MutableMapping
+from functools import partial
 from googleapiclient.errors import HttpError
+from werkzeug.exceptions import BadRequest
 
 from goblet.client import VersionedClients
 
@@ -11,7 +18,7 @@ from goblet.backends.cloudrun import CloudRun
 
 from goblet.handlers.bq_remote_function import BigQueryRemoteFunction
 from goblet.handlers.eventarc import EventArc
-from goblet.handlers.pubsub import PubSub
+from goblet.handlers.pubsub import NO_WRAPPER_SUBSCRIPTION_HEADER, PubSub
 from goblet.handlers.routes import Routes
 from goblet.handlers.scheduler import Scheduler
 from goblet.handlers.cloudtasktarget import CloudTaskTarget
@@ -33,6 +40,7 @@ from goblet.infrastructures.bq_spark_stored_procedure import (
 from goblet.alerts import Alerts
 
 from goblet.response import default_missing_route
+from goblet import serialization
 
 import goblet.globals as g
 
@@ -57,6 +65,44 @@ EVENT_TYPES = [
     "uptime",
 ]
 
+# Event types detected from request headers or the request body. They are only probed for when their handler has
+# registered resources
+PROBED_EVENT_TYPES = [
+    "schedule",
+    "uptime",
+    "cloudtasktarget",
+    "bqremotefunction",
+    "pubsub",
+]
+
+# Event type -> (handler, whether the handler is called with the event context)
+EVENT_HANDLERS = {
+    "job": ("jobs", True),
+    "schedule": ("schedule", False),
+    "pubsub": ("pubsub", True),
+    "route": ("route", False),
+    "http": ("http", False),
+    "eventarc": ("eventarc", False),
+    "bqremotefunction": ("bqremotefunction", False),
+    "cloudtasktarget": ("cloudtasktarget", False),
+    "uptime": ("uptime", False),
+}
+
+
+class RequestState:
+    """Request being handled in the current thread or task"""
+
+    __slots__ = ("request", "context", "g")
+
+    def __init__(self, request=None, context=None):
+        self.request = request
+        self.context = context
+        self.g = None
+
+
+# Shared by combined apps, so sub apps see the request passed to the main app
+request_state = contextvars.ContextVar("goblet_request_state", default=None)
+
 SUPPORTED_BACKENDS = {
     "cloudfunction": CloudFunctionV1,
     "cloudfunctionv2": CloudFunctionV2,
@@ -72,6 +118,48 @@ SUPPORTED_INFRASTRUCTURES = {
 }
 
 
+class LazyComponents(MutableMapping):
+    """Handlers or infrastructures by name, each created from its factory on first access. An app serving requests
+    only creates the components it registers resources with or dispatches to. Components keep the config that was
+    current when the app was created"""
+
+    def __init__(self, factories, config):
+        self._factories = dict(factories)
+        self._components = {}
+        self._config = config
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        component = self._components.get(key)
+        if component is None:
+            factory = self._factories[key]
+            with self._lock:
+                component = self._components.get(key)
+                if component is None:
+                    component = factory()
+                    component.config = self._config
+                    self._components[key] = component
+        return component
+
+    def __setitem__(self, key, component):
+        self._factories.setdefault(key, None)
+        self._components[key] = component
+
+    def __delitem__(self, key):
+        del self._factories[key]
+        self._components.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    def created(self, key):
+        """The component if it was already created, otherwise None"""
+        return self._components.get(key)
+
+
 class Resource_Manager:
     """Core Goblet logic. App entrypoint is the __call__ function which routes the request to the corresonding handler class"""
 
@@ -84,43 +172,59 @@ class Resource_Manager:
     ):
         self.app_list = []
 
-        self.handlers = {
-            "cloudtasktarget": CloudTaskTarget(function_name, backend=backend),
-            "route": Routes(
-                function_name,
-                cors=cors,
-                backend=backend,
-                routes_type=routes_type,
-            ),
-            "pubsub": PubSub(function_name, backend=backend),
-            "storage": Storage(function_name, backend=backend),
-            "eventarc": EventArc(function_name, backend=backend),
-            "http": HTTP(function_name, backend=backend),
-            "jobs": Jobs(function_name, backend=backend),
-            "schedule": Scheduler(function_name, backend=backend),
-            "bqremotefunction": BigQueryRemoteFunction(function_name, backend=backend),
-            "uptime": Uptime(function_name, backend=backend, routes_type=routes_type),
-        }
+        self.handlers = LazyComponents(
+            {
+                "cloudtasktarget": partial(
+                    CloudTaskTarget, function_name, backend=backend
+                ),
+                "route": partial(
+                    Routes,
+                    function_name,
+                    cors=cors,
+                    backend=backend,
+                    routes_type=routes_type,
+                ),
+                "pubsub": partial(PubSub, function_name, backend=backend),
+                "storage": partial(Storage, function_name, backend=backend),
+                "eventarc": partial(EventArc, function_name, backend=backend),
+                "http": partial(HTTP, function_name, backend=backend),
+                "jobs": partial(Jobs, function_name, backend=backend),
+                "schedule": partial(Scheduler, function_name, backend=backend),
+                "bqremotefunction": partial(
+                    BigQueryRemoteFunction, function_name, backend=backend
+                ),
+                "uptime": partial(
+                    Uptime, function_name, backend=backend, routes_type=routes_type
+                ),
+            },
+            g.config,
+        )
 
-        self.infrastructure = {
-            "cloudtaskqueue": CloudTaskQueue(
-                function_name,
-                backend=backend,
-            ),
-            "redis": Redis(
-                function_name,
-                backend=backend,
-            ),
-            "vpcconnector": VPCConnector(
-                function_name,
-                backend=backend,
-            ),
-            "apigateway": ApiGateway(function_name, backend=backend),
-            "pubsub_topic": PubSubTopic(function_name, backend=backend),
-            "bqsparkstoredprocedure": BigQuerySparkStoredProcedure(
-                function_name, backend=backend
-            ),
-        }
+        self.infrastructure = LazyComponents(
+            {
+                "cloudtaskqueue": partial(
+                    CloudTaskQueue,
+                    function_name,
+                    backend=backend,
+                ),
+                "redis": partial(
+                    Redis,
+                    function_name,
+                    backend=backend,
+                ),
+                "vpcconnector": partial(
+                    VPCConnector,
+                    function_name,
+                    backend=backend,
+                ),
+                "apigateway": partial(ApiGateway, function_name, backend=backend),
+                "pubsub_topic": partial(PubSubTopic, function_name, backend=backend),
+                "bqsparkstoredprocedure": partial(
+                    BigQuerySparkStoredProcedure, function_name, backend=backend
+                ),
+            },
+            g.config,
+        )
 
         self.middleware_handlers = {
             "before": {},
@@ -130,19 +234,20 @@ class Resource_Manager:
 
         self.error_handlers = {"GobletRouteNotFoundError": default_missing_route}
 
-        self.current_request = None
         self.function_name = function_name
 
+        self._active_event_types = None
+        self._middleware_chains = None
+
     def __call__(self, request, context=None):
         """Goblet entrypoint"""
-        self.current_request = request
-        self.request_context = context
-
-        # set var's for added apps
-        for added_app in self.app_list:
-            added_app.current_request = request
-            added_app.request_context = context
+        token = request_state.set(RequestState(request, context))
+        try:
+            return self._handle(request, context)
+        finally:
+            request_state.reset(token)
 
+    def _handle(self, request, context=None):
         event_type = self.get_event_type(request, context)
 
         try:
@@ -150,33 +255,7 @@ class Resource_Manager:
             request = self._call_middleware(
                 request, event_type, before_or_after="before"
             )
-            response = None
-            if event_type not in EVENT_TYPES:
-                raise ValueError(f"{event_type} not a valid event type")
-            if event_type == "job":
-                response = self.handlers["jobs"](request, context)
-            if event_type == "schedule":
-                response = self.handlers["schedule"](request)
-            if event_type == "pubsub":
-                response = self.handlers["pubsub"](request, context)
-            if event_type == "storage":
-                # Storage trigger can be made with @eventarc decorator
-                try:
-                    response = self.handlers["storage"](request, context)
-                except ValueError:
-                    event_type = "eventarc"
-            if event_type == "route":
-                response = self.handlers["route"](request)
-            if event_type == "http":
-                response = self.handlers["http"](request)
-            if event_type == "eventarc":
-                response = self.handlers["eventarc"](request)
-            if event_type == "bqremotefunction":
-                response = self.handlers["bqremotefunction"](request)
-            if event_type == "cloudtasktarget":
-                response = self.handlers["cloudtasktarget"](request)
-            if event_type == "uptime":
-                response = self.handlers["uptime"](request)
+            response, event_type = self._dispatch(request, event_type, context)
 
             # call after request middleware
             response = self._call_middleware(
@@ -190,10 +269,98 @@ class Resource_Manager:
 
         return response
 
+    async def call_async(self, request, context=None):
+        """Async Goblet entrypoint. Async middleware and handlers are awaited on the event loop, sync handlers run in a
+        thread pool so they do not block it"""
+        token = request_state.set(RequestState(request, context))
+        try:
+            return await self._handle_async(request, context)
+        finally:
+            request_state.reset(token)
+
+    async def _handle_async(self, request, context=None):
+        event_type = self.get_event_type(request, context)
+
+        try:
+            request = await self._call_middleware_async(
+                request, event_type, before_or_after="before"
+            )
+            # handlers of async functions return an awaitable without blocking
+            response, event_type = await asyncio.get_running_loop().run_in_executor(
+                None,
+                contextvars.copy_context().run,
+                self._dispatch,
+                request,
+                event_type,
+                context,
+            )
+            if inspect.isawaitable(response):
+                response = await response
+            response = await self._call_middleware_async(
+                response, event_type, before_or_after="after"
+            )
+
+        except Exception as e:
+            if self.error_handlers.get(e.__class__.__name__):
+                response = self.error_handlers[e.__class__.__name__](e)
+                if inspect.isawaitable(response):
+                    response = await response
+                return response
+            raise e
+
+        return response
+
+    def _dispatch(self, request, event_type, context=None):
+        """Calls the handler for event_type. Returns the response and the event type that handled it"""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"{event_type} not a valid event type")
+        response = None
+        if event_type == "storage":
+            # Storage trigger can be made with @eventarc decorator
+            try:
+                response = self.handlers["storage"](request, context)
+            except ValueError:
+                event_type = "eventarc"
+        if event_type in EVENT_HANDLERS:
+            handler_name, with_context = EVENT_HANDLERS[event_type]
+            handler = self.handlers[handler_name]
+            response = handler(request, context) if with_context else handler(request)
+        return response, event_type
+
+    @property
+    def current_request(self):
+        """Request being handled, local to the current thread or task"""
+        state = request_state.get()
+        return state.request if state else None
+
+    @current_request.setter
+    def current_request(self, request):
+        state = request_state.get()
+        if state:
+            state.request = request
+        else:
+            request_state.set(RequestState(request))
+
+    @property
+    def request_context(self):
+        """Event context of the request being handled, local to the current thread or task"""
+        state = request_state.get()
+        return state.context if state else None
+
+    @request_context.setter
+    def request_context(self, context):
+        state = request_state.get()
+        if state:
+            state.context = context
+        else:
+            request_state.set(RequestState(context=context))
+
     def __add__(self, other):
         self.app_list.append(other)
-        for handler in self.handlers:
-            self.handlers[handler] += other.handlers[handler]
+        self._active_event_types = None
+        for handler in other.handlers:
+            if other.handlers.created(handler) is not None:
+                self.handlers[handler] += other.handlers[handler]
         return self
 
     def combine(self, other):
@@ -205,29 +372,31 @@ class Resource_Manager:
             return "job"
         if context and context.event_type:
             return context.event_type.split(".")[1].split("/")[0]
-        if request.headers.get("X-Goblet-Type") == "schedule":
+        active = self.active_event_types
+        headers = request.headers
+        if "schedule" in active and headers.get("X-Goblet-Type") == "schedule":
             return "schedule"
-        if request.headers.get("X-Goblet-Uptime-Name"):
+        if "uptime" in active and headers.get("X-Goblet-Uptime-Name"):
             return "uptime"
-        if request.headers.get("User-Agent") == "Google-Cloud-Tasks":
-            return "cloudtasktarget"
-        if request.headers.get("Ce-Type") and request.headers.get("Ce-Source"):
-            return "eventarc"
-        if (
-            request.is_json
-            and isinstance(request.json, dict)
-            and request.json.get("userDefinedContext")
-            and request.json["userDefinedContext"].get("X-Goblet-Name")
-        ):
-            return "bqremotefunction"
+        if "pubsub" in active and headers.get(NO_WRAPPER_SUBSCRIPTION_HEADER):
+            return "pubsub"
         if (
-            request.is_json
-            and request.get_json(silent=True)
-            and isinstance(request.json, dict)
-            and request.json.get("subscription")
-            and request.json.get("message")
+            "cloudtasktarget" in active
+            and headers.get("User-Agent") == "Google-Cloud-Tasks"
         ):
-            return "pubsub"
+            return "cloudtasktarget"
+        if headers.get("Ce-Type") and headers.get("Ce-Source"):
+            return "eventarc"
+        if "bqremotefunction" in active or "pubsub" in active:
+            body = self._json_body(request)
+            if (
+                "bqremotefunction" in active
+                and body.get("userDefinedContext")
+                and body["userDefinedContext"].get("X-Goblet-Name")
+            ):
+                return "bqremotefunction"
+            if "pubsub" in active and body.get("subscription") and body.get("message"):
+                return "pubsub"
         if (
             request.path
             and request.path == "/"
@@ -238,11 +407,63 @@ class Resource_Manager:
             return "route"
         return None
 
+    @property
+    def active_event_types(self):
+        """Probed event types with registered handlers, computed on the first request"""
+        if self._active_event_types is None:
+            self._active_event_types = frozenset(
+                event_type
+                for event_type in PROBED_EVENT_TYPES
+                if self.handlers.created(event_type) is not None
+                and self.handlers[event_type].resources
+            )
+        return self._active_event_types
+
+    @staticmethod
+    def _json_body(request):
+        """Json body as a dict, parsed with the fastest installed json library. The parsed body is cached on the
+        request, so handlers reading request.json do not parse it again"""
+        if not request.is_json:
+            return {}
+        request.json_module = serialization
+        try:
+            body = request.json
+        except BadRequest:
+            return {}
+        return body if isinstance(body, dict) else {}
+
+    @property
+    def middleware_chains(self):
+        """{before_or_after: {event_type: tuple of middleware}} with the "all" middleware followed by the event type
+        middleware. Built on the first request and rebuilt after new middleware is registered
+        """
+        if self._middleware_chains is None:
+            chains = {}
+            for before_or_after, handlers in self.middleware_handlers.items():
+                all_middleware = tuple(handlers.get("all", []))
+                chains[before_or_after] = {
+                    event_type: all_middleware
+                    + (
+                        tuple(handlers.get(event_type, []))
+                        if event_type != "all"
+                        else ()
+                    )
+                    for event_type in EVENT_TYPES
+                }
+            self._middleware_chains = chains
+        return self._middleware_chains
+
     def _call_middleware(self, event, event_type, before_or_after="before"):
-        middleware = self.middleware_handlers[before_or_after].get("all", [])
-        middleware.extend(self.middleware_handlers[before_or_after].get(event_type, []))
-        for m in middleware:
+        for m in self.middleware_chains[before_or_after].get(event_type, ()):
+            event = m(event)
+
+        return event
+
+    async def _call_middleware_async(self, event, event_type, before_or_after="before"):
+        for m in self.middleware_chains[before_or_after].get(event_type, ()):
             event = m(event)
+            if inspect.isawaitable(event):
+                event = await event
 
         return event
 
@@ -1,4 +1,5 @@
 import json
+import types
 
 
 class Response(object):
@@ -15,6 +16,10 @@ class Response(object):
 
     def __call__(self, environ, start_response):
         body = self.body
+        if isinstance(body, types.GeneratorType):
+            # streamed body
+            start_response(self.status_code, list(self.headers.items()))
+            return body
         if not isinstance(body, (str, bytes)):
             body = json.dumps(body, separators=(",", ":"))
         status = self.status_code
@@ -6,7 +6,7 @@ from goblet.client import (
     get_default_project_number,
 )
 
-from goblet_gcp_client.client import get_default_location
+from goblet.client import get_default_location
 from goblet.common_cloud_actions import deploy_cloudrun, get_artifact_image_name
 from goblet.config import GConfig
 
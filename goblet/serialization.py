@@ -0,0 +1,106 @@
+import importlib
+import json
+import logging
+import math
+import os
+
+log = logging.getLogger("goblet.deployer")
+log.setLevel(logging.getLevelName(os.getenv("GOBLET_LOG_LEVEL", "INFO")))
+
+# Fastest first, json is always available
+JSON_BACKENDS = ["orjson", "ujson", "json"]
+
+_backend = None
+_loads = None
+_dumps = None
+
+
+def set_backend(name=None):
+    """Selects the JSON library used by loads and dumps. Defaults to the GOBLET_JSON_BACKEND environment variable or
+    the fastest installed library"""
+    global _backend, _loads, _dumps
+    name = name or os.environ.get("GOBLET_JSON_BACKEND")
+    if name and name not in JSON_BACKENDS:
+        raise ValueError(f"JSON backend must be one of {', '.join(JSON_BACKENDS)}")
+    for candidate in [name] if name else JSON_BACKENDS:
+        try:
+            module = importlib.import_module(candidate)
+        except ImportError:
+            if name:
+                raise
+            continue
+        break
+    _backend = candidate
+    _loads = module.loads
+    if candidate == "orjson":
+        _dumps = lambda obj: _orjson_dumps(module.dumps, obj)  # noqa: E731
+    else:
+        _dumps = lambda obj: module.dumps(obj).encode("utf-8")  # noqa: E731
+    log.debug(f"using {candidate} for json")
+    return candidate
+
+
+def _orjson_dumps(dumps, obj):
+    # orjson writes NaN and Infinity as null, json writes them as NaN and Infinity. Only output that contains a
+    # null is checked for them
+    encoded = dumps(obj)
+    if b"null" in encoded and _has_non_finite(obj):
+        raise ValueError("non finite float")
+    return encoded
+
+
+def _has_non_finite(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(v) for v in obj)
+    return False
+
+
+def get_backend():
+    return _backend
+
+
+def loads(s, **kwargs):
+    """Parses str or bytes. Has the signature of json.loads so this module can be used as the json_module of a
+    werkzeug request"""
+    if kwargs:
+        return json.loads(s, **kwargs)
+    return _loads(s)
+
+
+def dumps_bytes(obj):
+    """JSON encoded obj as utf-8 bytes. Objects the backend cannot encode the way json does, such as integers over
+    64 bits or NaN and Infinity for orjson, are encoded by json"""
+    try:
+        return _dumps(obj)
+    except (TypeError, OverflowError, ValueError):
+        return json.dumps(obj).encode("utf-8")
+
+
+def dumps(obj, **kwargs):
+    if kwargs:
+        return json.dumps(obj, **kwargs)
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def iter_object_array(key, items, chunk_size=1000):
+    """Yields {key: [items]} encoded as JSON in chunks of bytes, so the whole document is never held in memory.
+    Items are encoded chunk_size at a time"""
+    yield b"{" + dumps_bytes(key) + b":["
+    chunk = []
+    separator = b""
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield separator + dumps_bytes(chunk)[1:-1]
+            separator = b","
+            chunk = []
+    if chunk:
+        yield separator + dumps_bytes(chunk)[1:-1]
+    yield b"]}"
+
+
+set_backend()
@@ -1,9 +1,18 @@
+import base64
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from unittest.mock import Mock
+from unittest.mock import Mock, PropertyMock
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
 
 import pytest
 
-from goblet import Goblet, Response, jsonify
+from goblet import Goblet, Response, jsonify, serialization
 
 
 class TestJsonify:
@@ -175,6 +184,75 @@ class TestDecoraters:
 
         assert app(mock_request, {}) == "test after request"
 
+    def test_middleware_runs_once_per_request(self):
+        app = Goblet("test")
+        calls = []
+
+        mock_request = Mock()
+        mock_request.path = "/test"
+        mock_request.method = "GET"
+        mock_request.headers = {}
+
+        @app.before_request()
+        def before_all(request):
+            calls.append("all")
+            return request
+
+        @app.before_request("route")
+        def before_route(request):
+            calls.append("route")
+            return request
+
+        @app.route("/test")
+        def dummy_function():
+            return "test"
+
+        for _ in range(1000):
+            app(mock_request, None)
+        assert calls == ["all", "route"] * 1000
+        assert app.middleware_handlers["before"]["all"] == [before_all]
+
+        @app.after_request("route")
+        def after_route(response):
+            return response + " after"
+
+        assert app(mock_request, None) == "test after"
+
+    def test_request_state_is_isolated(self):
+        app = Goblet("test")
+        app2 = Goblet("test2", is_sub_app=True)
+        barrier = threading.Barrier(50, timeout=10)
+
+        @app.before_request()
+        def before_request(request):
+            app.g.request_id = request.headers["X-Request-Id"]
+            return request
+
+        @app2.route("/test")
+        def dummy_function():
+            # wait until other requests have set their state
+            barrier.wait()
+            return (
+                app2.current_request.headers["X-Request-Id"],
+                app.g.request_id,
+                app2.request_context.id,
+            )
+
+        app.combine(app2)
+
+        def call(i):
+            mock_request = Mock()
+            mock_request.path = "/test"
+            mock_request.method = "GET"
+            mock_request.headers = {"X-Request-Id": str(i)}
+            return app(mock_request, Mock(event_type=None, id=i))
+
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            results = list(executor.map(call, range(500)))
+
+        assert results == [(str(i), str(i), i) for i in range(500)]
+        assert app.current_request is None
+
     def test_stage(self, monkeypatch):
         monkeypatch.setenv("STAGE", "TEST2")
 
@@ -255,3 +333,179 @@ class TestDecoraters:
             raise ValueError("test_error")
 
         assert app(mock_request, {}) == "test_error"
+
+
+class TestEventDispatch:
+    def test_route_only_app_does_not_read_body(self):
+        app = Goblet("test")
+
+        @app.route("/test")
+        def dummy_function():
+            return "test"
+
+        mock_request = Mock()
+        mock_request.path = "/test"
+        mock_request.method = "GET"
+        mock_request.headers = {"User-Agent": "Google-Cloud-Tasks"}
+        json_body = PropertyMock(side_effect=AssertionError("body read"))
+        type(mock_request).json = json_body
+
+        assert app(mock_request, None) == "test"
+        json_body.assert_not_called()
+
+    def test_body_parsed_once(self, monkeypatch):
+        app = Goblet("test")
+        mock = Mock()
+
+        @app.pubsub_subscription("test")
+        def subscription(data):
+            mock(data)
+
+        @app.bqremotefunction(dataset_id="dataset")
+        def remote_function(x: str) -> str:
+            return x
+
+        data = base64.b64encode(b"message").decode()
+        request = Request(
+            EnvironBuilder(
+                path="/",
+                method="POST",
+                json={
+                    "subscription": "projects/goblet/subscriptions/test-test",
+                    "message": {"data": data},
+                },
+            ).get_environ()
+        )
+        loads = Mock(side_effect=serialization.loads)
+        monkeypatch.setattr(serialization, "loads", loads)
+
+        app(request, None)
+
+        mock.assert_called_once_with("message")
+        loads.assert_called_once()
+
+    def test_registration_updates_active_event_types(self):
+        app = Goblet("test")
+        assert app.active_event_types == frozenset()
+
+        app.schedule("* * * * *")(lambda: None)
+        assert app.active_event_types == {"schedule"}
+
+
+COLD_START = """
+import time
+
+start = time.perf_counter()
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+from goblet import Goblet
+
+app = Goblet(function_name="cold-start", backend="cloudrun")
+
+
+@app.route("/home")
+def home():
+    return "home"
+
+
+assert app(Request(EnvironBuilder(path="/home").get_environ())) == "home"
+print(time.perf_counter() - start)
+print(",".join(name for name in app.handlers if app.handlers.created(name)))
+print(",".join(name for name in app.infrastructure if app.infrastructure.created(name)))
+"""
+
+
+class TestColdStart:
+    def test_components_created_on_first_use(self):
+        app = Goblet("test")
+        assert not any(app.handlers.created(name) for name in app.handlers)
+
+        app.pubsub_subscription("test")(lambda data: None)
+
+        assert app.handlers.created("pubsub") is app.handlers["pubsub"]
+        assert app.handlers.created("route") is None
+        assert len(list(app.handlers.values())) == 10
+        assert len(app.infrastructure) == 6
+
+    def test_time_to_first_request(self):
+        """Minimal app served without credentials, only creating the handler it dispatches to"""
+        env = {
+            k: v
+            for k, v in os.environ.items()
+            if not k.startswith("G_") and k != "GOOGLE_APPLICATION_CREDENTIALS"
+        }
+        env.update(
+            {
+                "GOOGLE_PROJECT": "goblet",
+                "GOOGLE_LOCATION": "us-central1",
+                "X-GOBLET-DEPLOY": "true",
+            }
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+
+        assert float(output[0]) < 10
+        assert output[1:] == ["route", ""]
+
+
+# Only needed to deploy, generate specs or call google apis, so importing goblet to serve requests must not load them
+DEPLOY_ONLY_MODULES = [
+    "apispec",
+    "marshmallow",
+    "pydantic",
+    "yaml",
+    "goblet_gcp_client",
+    "googleapiclient.discovery",
+    "google.auth",
+    "google.cloud.logging",
+    "google.protobuf",
+    "httplib2",
+    "requests",
+]
+IMPORT_BUDGET_MODULES = 400
+IMPORT_BUDGET_SECONDS = 0.5
+
+# wall clock benchmarks depend on the machine, so they only run when G_BENCHMARK is set
+benchmark = pytest.mark.skipif(
+    not os.environ.get("G_BENCHMARK"), reason="set G_BENCHMARK to run benchmarks"
+)
+
+
+def import_times():
+    """{module: cumulative seconds} reported by python -X importtime for import goblet"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import goblet"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+class TestImportTime:
+    def test_import_budget(self):
+        modules = import_times()
+
+        loaded = [
+            m
+            for m in DEPLOY_ONLY_MODULES
+            if any(name == m or name.startswith(m + ".") for name in modules)
+        ]
+        assert loaded == []
+        assert len(modules) < IMPORT_BUDGET_MODULES
+
+    @benchmark
+    def test_import_time(self):
+        runs = [import_times() for _ in range(3)]
+        assert min(run["goblet"] for run in runs) < IMPORT_BUDGET_SECONDS
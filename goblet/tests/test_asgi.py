@@ -0,0 +1,218 @@
+import asyncio
+import base64
+import json
+import threading
+import time
+
+from goblet import Goblet, Response
+
+
+async def asgi_request(app, path, method="GET", headers=None, body=b""):
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [
+            (k.lower().encode(), v.encode()) for k, v in (headers or {}).items()
+        ],
+    }
+    await app.asgi(scope, receive, send)
+    start, *response_body = sent
+    assert not response_body[-1].get("more_body")
+    return (
+        start["status"],
+        dict(start["headers"]),
+        b"".join(message["body"] for message in response_body),
+    )
+
+
+def call(app, path, **kwargs):
+    return asyncio.run(asgi_request(app, path, **kwargs))
+
+
+class TestAsgi:
+    def test_async_route(self):
+        app = Goblet(function_name="goblet_example")
+
+        @app.route("/home/{id}")
+        async def home(id):
+            await asyncio.sleep(0)
+            return {"id": id, "path": app.current_request.path}
+
+        status, headers, body = call(app, "/home/1")
+
+        assert status == 200
+        assert headers[b"Content-Type"] == b"application/json"
+        assert json.loads(body) == {"id": "1", "path": "/home/1"}
+
+    def test_sync_route_runs_in_thread(self):
+        app = Goblet(function_name="goblet_example")
+        threads = []
+
+        @app.route("/home")
+        def home():
+            threads.append(threading.current_thread())
+            return "home", 201, {"X-Custom": "custom"}
+
+        status, headers, body = call(app, "/home")
+
+        assert (status, headers[b"X-Custom"], body) == (201, b"custom", b"home")
+        assert threads[0] is not threading.main_thread()
+
+    def test_concurrent_async_requests(self):
+        app = Goblet(function_name="goblet_example")
+
+        @app.route("/slow/{id}")
+        async def slow(id):
+            await asyncio.sleep(0.2)
+            return app.current_request.path
+
+        async def run():
+            return await asyncio.gather(
+                *[asgi_request(app, f"/slow/{i}") for i in range(200)]
+            )
+
+        start = time.monotonic()
+        results = asyncio.run(run())
+
+        assert time.monotonic() - start < 2
+        assert [body for _, _, body in results] == [
+            f"/slow/{i}".encode() for i in range(200)
+        ]
+
+    def test_async_middleware(self):
+        app = Goblet(function_name="goblet_example")
+
+        @app.before_request()
+        async def before_request(request):
+            app.g.user = "user"
+            return request
+
+        @app.after_request()
+        def after_request(response):
+            return Response(response, headers={"X-User": app.g.user})
+
+        @app.http()
+        async def http(request):
+            return "http"
+
+        status, headers, body = call(app, "/")
+
+        assert (status, headers[b"X-User"], body) == (200, b"user", b"http")
+
+    def test_async_event_handlers(self):
+        app = Goblet(function_name="goblet_example")
+        received = []
+
+        @app.pubsub_subscription("test")
+        async def subscription(data):
+            received.append(data)
+
+        @app.cloudtasktarget(name="target")
+        async def target(request):
+            return {"task": request.json["key"]}
+
+        @app.eventarc(topic="test")
+        async def trigger(request):
+            received.append("eventarc")
+
+        message = {
+            "subscription": "projects/goblet/subscriptions/goblet_example-test",
+            "message": {"data": base64.b64encode(b"message").decode()},
+        }
+        assert call(
+            app,
+            "/",
+            method="POST",
+            headers={"Content-Type": "application/json"},
+            body=json.dumps(message).encode(),
+        )[2] == (b"success")
+
+        _, _, body = call(
+            app,
+            "/",
+            method="POST",
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": "Google-Cloud-Tasks",
+                "X-Goblet-CloudTask-Target": "target",
+            },
+            body=b'{"key": "value"}',
+        )
+        assert json.loads(body) == {"task": "value"}
+
+        status, _, body = call(
+            app,
+            "/x-goblet-eventarc-triggers/goblet-example-trigger",
+            method="POST",
+            headers={"Ce-Type": "type", "Ce-Source": "source"},
+        )
+        assert (status, body) == (200, b"success")
+        assert received == ["message", "eventarc"]
+
+    def test_streamed_response(self):
+        app = Goblet(function_name="goblet_example")
+
+        @app.route("/stream")
+        def stream():
+            return Response(
+                (chunk for chunk in [b"a", "b", b"c"]),
+                headers={"Content-Type": "text/plain"},
+            )
+
+        status, headers, body = call(app, "/stream")
+
+        assert (status, headers[b"Content-Type"], body) == (200, b"text/plain", b"abc")
+
+    def test_async_pubsub_fanout(self):
+        app = Goblet(function_name="goblet_example")
+        received = []
+
+        @app.pubsub_subscription("test", fanout=True)
+        async def first(data):
+            await asyncio.sleep(0.2)
+            received.append("first")
+
+        @app.pubsub_subscription("test", fanout=True)
+        def second(data):
+            time.sleep(0.2)
+            received.append("second")
+
+        @app.pubsub_subscription("test", fanout=True)
+        async def third(data):
+            await asyncio.sleep(0.2)
+            return "third"
+
+        message = {
+            "subscription": "projects/goblet/subscriptions/goblet_example-test",
+            "message": {"data": base64.b64encode(b"message").decode()},
+        }
+        start = time.monotonic()
+        _, _, body = call(
+            app,
+            "/",
+            method="POST",
+            headers={"Content-Type": "application/json"},
+            body=json.dumps(message).encode(),
+        )
+
+        assert time.monotonic() - start < 0.5
+        assert body == b"third"
+        assert sorted(received) == ["first", "second"]
+
+    def test_missing_route(self):
+        app = Goblet(function_name="goblet_example")
+
+        status, _, _ = call(app, "/missing")
+
+        assert status == 404
@@ -1,3 +1,10 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import zipfile
+from unittest.mock import Mock
+
 import pytest
 
 from goblet import Goblet
@@ -5,6 +12,14 @@ from goblet.backends.backend import Backend
 from goblet.backends import CloudFunctionV1, CloudFunctionV2, CloudRun
 from goblet.errors import GobletValidationError
 
+# modules of the generated app imported by test_precompile_import_time
+PRECOMPILE_MODULES = 20
+
+# wall clock benchmarks depend on the machine, so they only run when G_BENCHMARK is set
+benchmark = pytest.mark.skipif(
+    not os.environ.get("G_BENCHMARK"), reason="set G_BENCHMARK to run benchmarks"
+)
+
 
 class TestBackend:
     def test_custom_files(self, monkeypatch):
@@ -104,3 +119,276 @@ class TestBackend:
             CloudFunctionV2(Goblet(function_name="in_valid"))
 
         CloudFunctionV2(Goblet(function_name="valid"))
+
+    def test_zip_cache(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "main.py").write_text("print('main')")
+        (tmp_path / "requirements.txt").write_text("goblet-gcp")
+        os.mkdir(tmp_path / "venv")
+        (tmp_path / "venv" / "lib.py").write_text("excluded")
+
+        backend = CloudFunctionV1(Goblet(function_name="goblet_zip"))
+        backend.zip()
+        assert not backend.zip_skipped
+        with zipfile.ZipFile(backend.zip_path) as z:
+            assert sorted(z.namelist()) == ["main.py", "requirements.txt"]
+
+        backend = CloudFunctionV1(Goblet(function_name="goblet_zip"))
+        backend.zip()
+        assert backend.zip_skipped
+
+        # same content with a new mtime keeps the existing zip
+        mtime = os.stat(tmp_path / "main.py").st_mtime + 10
+        os.utime(tmp_path / "main.py", (mtime, mtime))
+        backend = CloudFunctionV1(Goblet(function_name="goblet_zip"))
+        backend.zip()
+        assert backend.zip_skipped
+
+        (tmp_path / "new.py").write_text("print('new')")
+        backend = CloudFunctionV1(Goblet(function_name="goblet_zip"))
+        backend.zip()
+        assert not backend.zip_skipped
+        with zipfile.ZipFile(backend.zip_path) as z:
+            assert "new.py" in z.namelist()
+
+    def test_zip_compression_level(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "main.py").write_text("print('main')\n" * 1000)
+        (tmp_path / "requirements.txt").write_text("goblet-gcp")
+
+        backend = CloudFunctionV1(Goblet(function_name="goblet_zip"))
+        backend.zip()
+        default_size = os.path.getsize(backend.zip_path)
+
+        backend = CloudFunctionV1(
+            Goblet(
+                function_name="goblet_zip", config={"package": {"compression_level": 0}}
+            )
+        )
+        backend.zip()
+        assert not backend.zip_skipped
+        assert os.path.getsize(backend.zip_path) > default_size
+
+    def test_zip_precompile(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "main.py").write_text("from lib.util import value\n")
+        (tmp_path / "requirements.txt").write_text("goblet-gcp")
+        os.mkdir(tmp_path / "lib")
+        (tmp_path / "lib" / "__init__.py").write_text("")
+        (tmp_path / "lib" / "util.py").write_text("value = 'compiled'\n")
+        (tmp_path / "lib" / "broken.py").write_text("def broken(:\n")
+        cached = importlib.util.cache_from_source("lib/util.py")
+
+        backend = CloudFunctionV1(Goblet(function_name="goblet_zip"))
+        backend.zip()
+        with zipfile.ZipFile(backend.zip_path) as z:
+            assert cached not in z.namelist()
+
+        backend = CloudFunctionV1(
+            Goblet(function_name="goblet_zip", config={"package": {"precompile": True}})
+        )
+        backend.zip()
+        assert not backend.zip_skipped
+        with zipfile.ZipFile(backend.zip_path) as z:
+            assert {"lib/util.py", cached, "lib/broken.py"} <= set(z.namelist())
+            assert importlib.util.cache_from_source("lib/broken.py") not in z.namelist()
+
+        backend = CloudFunctionV1(
+            Goblet(
+                function_name="goblet_zip",
+                config={"package": {"precompile": True, "strip_sources": True}},
+            )
+        )
+        backend.zip()
+        assert not backend.zip_skipped
+        with zipfile.ZipFile(backend.zip_path) as z:
+            names = z.namelist()
+            z.extractall(tmp_path / "artifact")
+        assert {"main.py", "lib/__init__.pyc", "lib/util.pyc"} <= set(names)
+        assert not {"lib/__init__.py", "lib/util.py", cached} & set(names)
+
+        result = subprocess.run(
+            [sys.executable, "-B", "-c", "import main; print(main.value)"],
+            cwd=tmp_path / "artifact",
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert result.stdout.strip() == "compiled"
+
+    def test_zip_precompile_runtime_mismatch(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "main.py").write_text("print('main')")
+        (tmp_path / "requirements.txt").write_text("goblet-gcp")
+
+        backend = CloudFunctionV1(
+            Goblet(
+                function_name="goblet_zip",
+                config={"runtime": "python399", "package": {"precompile": True}},
+            )
+        )
+        backend.zip()
+        with zipfile.ZipFile(backend.zip_path) as z:
+            assert sorted(z.namelist()) == ["main.py", "requirements.txt"]
+
+        backend = CloudRun(
+            Goblet(function_name="goblet-zip", config={"package": {"precompile": True}})
+        )
+        assert backend._precompile_runtime() is None
+
+    @benchmark
+    def test_precompile_import_time(self, monkeypatch, tmp_path):
+        """Cold start import of a generated app from the plain and the precompiled zip"""
+        project = tmp_path / "project"
+        os.makedirs(project / "app")
+        monkeypatch.chdir(project)
+        (project / "requirements.txt").write_text("goblet-gcp")
+        for i in range(PRECOMPILE_MODULES):
+            functions = "".join(
+                f"def f{j}(x):\n    return {{'x': [x * {j} for _ in range(3)]}}\n"
+                for j in range(200)
+            )
+            (project / "app" / f"module{i}.py").write_text(functions)
+        (project / "main.py").write_text(
+            "".join(f"import app.module{i}\n" for i in range(PRECOMPILE_MODULES))
+        )
+
+        def import_time(config):
+            backend = CloudFunctionV1(
+                Goblet(function_name="goblet_zip", config={"package": config})
+            )
+            backend.zip()
+            artifact = tmp_path / ("precompiled" if config else "source")
+            with zipfile.ZipFile(backend.zip_path) as z:
+                z.extractall(artifact)
+            return min(
+                float(
+                    subprocess.run(
+                        [
+                            sys.executable,
+                            "-B",
+                            "-c",
+                            "import time; s = time.perf_counter(); import main; "
+                            "print(time.perf_counter() - s)",
+                        ],
+                        cwd=artifact,
+                        capture_output=True,
+                        text=True,
+                        check=True,
+                    ).stdout
+                )
+                for _ in range(3)
+            )
+
+        source = import_time({})
+        precompiled = import_time({"precompile": True})
+        assert precompiled < source
+
+    def test_zip_walk_prunes_excluded(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        for path in [
+            "main.py",
+            "requirements.txt",
+            "src/app.py",
+            "src/notes.txt",
+            "src/.goblet/extra.py",
+            "venv/lib/site.py",
+            "node_modules/pkg/gyp.py",
+            "generated/out.py",
+            "generated/keep.py",
+        ]:
+            os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+            (tmp_path / path).write_text("")
+        (tmp_path / ".gcloudignore").write_text(
+            "# comment\nnode_modules/\n/generated/*\n!generated/keep.py\n"
+        )
+
+        scanned = []
+        scandir = os.scandir
+        monkeypatch.setattr(
+            os, "scandir", lambda path: scanned.append(path) or scandir(path)
+        )
+        backend = CloudFunctionV1(
+            Goblet(
+                function_name="goblet_zip",
+                config={"custom_files": {"include": ["*.txt"], "exclude": ["notes*"]}},
+            )
+        )
+        backend._zip_directory()
+
+        assert list(backend.zip_entries) == [
+            "generated/keep.py",
+            "main.py",
+            "requirements.txt",
+            "src/.goblet/extra.py",
+            "src/app.py",
+        ]
+        assert not any("venv" in p or "node_modules" in p for p in scanned)
+
+    def test_cloudrun_checksum_metadata_only(self, monkeypatch):
+        clients = Mock()
+        clients.cloudbuild.execute.return_value = {
+            "builds": [
+                {"source": {"storageSource": {"bucket": "bucket", "object": "a.zip"}}}
+            ]
+        }
+        clients.storage_objects.execute.return_value = {"md5Hash": "abc=="}
+        monkeypatch.setattr(
+            "goblet.backends.cloudrun.VersionedClients", lambda: clients
+        )
+
+        backend = CloudRun(Goblet(function_name="goblet", backend="cloudrun"))
+
+        assert backend._checksum() == "abc=="
+        clients.storage_objects.execute.assert_called_once_with(
+            "get", params={"bucket": "bucket", "object": "a.zip", "fields": "md5Hash"}
+        )
+
+    def test_deployed_fingerprint(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        os.mkdir(tmp_path / ".goblet")
+        (tmp_path / "main.py").write_text("print('main')")
+        (tmp_path / "requirements.txt").write_text("goblet-gcp")
+
+        backend = CloudRun(Goblet(function_name="goblet", backend="cloudrun"))
+        backend.zip()
+        backend._save_deployed_fingerprint()
+
+        backend = CloudRun(Goblet(function_name="goblet", backend="cloudrun"))
+        monkeypatch.setattr(backend, "get", Mock(return_value={"name": "goblet"}))
+        monkeypatch.setattr(backend, "delta", Mock(side_effect=AssertionError))
+        assert backend._gcs_upload(None, {}) == (None, False)
+
+        # a fingerprint is not trusted once the service is gone
+        monkeypatch.setattr(backend, "get", Mock(return_value=None))
+        monkeypatch.setattr(backend, "_upload_zip", Mock(return_value="source"))
+        assert backend._gcs_upload(None, {}) == ("source", True)
+
+        # other projects and locations have their own fingerprint
+        monkeypatch.setenv("GOOGLE_LOCATION", "europe-west1")
+        backend = CloudRun(Goblet(function_name="goblet", backend="cloudrun"))
+        assert backend._deployed_fingerprint() is None
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        monkeypatch.setenv("STAGE", "dev")
+        backend = CloudRun(
+            Goblet(
+                function_name="goblet",
+                backend="cloudrun",
+                config={"stages": {"dev": {}}},
+            )
+        )
+        backend.zip()
+        assert backend._deployed_fingerprint() is None
+
+        (tmp_path / "main.py").write_text("print('changed')")
+        monkeypatch.delenv("STAGE")
+        backend = CloudRun(Goblet(function_name="goblet", backend="cloudrun"))
+        backend.zip()
+        assert backend._local_checksum() != backend._deployed_fingerprint()
+
+        monkeypatch.setattr(
+            "goblet.backends.cloudrun.destroy_cloudrun", Mock(return_value=None)
+        )
+        backend.destroy()
+        assert backend._deployed_fingerprint() is None
@@ -1,8 +1,16 @@
+import asyncio
 import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock
+
+import pytest
+
 from goblet import Goblet
 from goblet_gcp_client import get_responses
-from goblet.handlers.bq_remote_function import BigQueryRemoteFunction
+from goblet.handlers.bq_remote_function import BigQueryRemoteFunction, ResultCache
 from typing import List
 
 
@@ -99,6 +107,494 @@ class TestBqRemoteFunction:
         assert result["replies"][0] == 4
         assert result["replies"][1] == 9
 
+    def test_call_bqremotefunction_columnar(self, monkeypatch):
+        np = pytest.importorskip("numpy")
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+        columns = []
+
+        @app.bqremotefunction(dataset_id="blogs", columnar=True)
+        def function_test(
+            x: List[int], y: List[float], z: List[bool], name: List[str]
+        ) -> List[float]:
+            columns.extend([x, y, z, name])
+            return np.where(z, x * y, np.nan)
+
+        body = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            "calls": [[2, 1.5, True, "a"], [3, None, True, "b"], [4, 2.0, False, "c"]],
+        }
+
+        mock_request = Mock()
+        mock_request.json = body
+        mock_request.headers = {}
+
+        result = json.loads(app(mock_request, None))
+
+        assert result["replies"] == [3.0, None, None]
+        assert [c.dtype for c in columns] == [
+            np.dtype("int64"),
+            np.dtype("float64"),
+            np.dtype("bool"),
+            np.dtype(object),
+        ]
+
+    def test_columnar_replies(self):
+        np = pytest.importorskip("numpy")
+        replies = BigQueryRemoteFunction._columnar_replies
+
+        assert replies(np.array([1, 2])) == [1, 2]
+        assert replies(np.array([True, False])) == [True, False]
+        assert replies(np.array(["a", None], dtype=object)) == ["a", None]
+        assert replies(np.array([1.5, np.nan, np.inf])) == [1.5, None, None]
+        assert replies([1, 2]) == [1, 2]
+
+    def test_call_bqremotefunction_concurrency(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+
+        @app.bqremotefunction(dataset_id="blogs", concurrency=10)
+        def function_test(x: int, y: float) -> int:
+            time.sleep(y)
+            return x
+
+        body = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            # later rows finish first
+            "calls": [[i, 0.2 - i * 0.01] for i in range(20)],
+        }
+
+        mock_request = Mock()
+        mock_request.json = body
+        mock_request.headers = {}
+
+        start = time.monotonic()
+        result = json.loads(app(mock_request, None))
+
+        assert time.monotonic() - start < 1.5
+        assert result["replies"] == list(range(20))
+
+    def test_call_bqremotefunction_concurrency_context(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+
+        @app.before_request()
+        def before_request(request):
+            app.g.user = "user"
+            return request
+
+        @app.bqremotefunction(dataset_id="blogs", concurrency=4)
+        def function_test(x: int) -> str:
+            return f"{app.g.user}-{app.current_request is mock_request}"
+
+        mock_request = Mock()
+        mock_request.json = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            "calls": [[i] for i in range(8)],
+        }
+        mock_request.headers = {}
+
+        assert json.loads(app(mock_request, None))["replies"] == ["user-True"] * 8
+
+    def test_call_bqremotefunction_async(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+        running = []
+
+        @app.bqremotefunction(dataset_id="blogs", concurrency=5)
+        async def function_test(x: int) -> int:
+            running.append(x)
+            assert len(running) <= 5
+            await asyncio.sleep(0.1)
+            running.remove(x)
+            return x * 2
+
+        body = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            "calls": [[i] for i in range(20)],
+        }
+
+        mock_request = Mock()
+        mock_request.json = body
+        mock_request.headers = {}
+
+        start = time.monotonic()
+        result = json.loads(app(mock_request, None))
+
+        assert time.monotonic() - start < 1.5
+        assert result["replies"] == [i * 2 for i in range(20)]
+
+    def test_call_bqremotefunction_timeout(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+
+        @app.bqremotefunction(dataset_id="blogs", concurrency=2, timeout=0.2)
+        def function_test(x: float) -> float:
+            time.sleep(x)
+            return x
+
+        mock_request = Mock()
+        mock_request.json = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            # rows queued behind the first two still get the full timeout
+            "calls": [[0.1], [0.1], [0.1], [0.1]],
+        }
+        mock_request.headers = {}
+
+        assert json.loads(app(mock_request, None))["replies"] == [0.1] * 4
+
+        mock_request.json["calls"] = [[0.1], [1]]
+        with pytest.raises(TimeoutError):
+            app(mock_request, None)
+
+        # rows that timed out keep their workers, so later batches run on a new pool
+        mock_request.json["calls"] = [[1], [1]]
+        with pytest.raises(TimeoutError):
+            app(mock_request, None)
+        mock_request.json["calls"] = [[0.1], [0.1]]
+        start = time.monotonic()
+        assert json.loads(app(mock_request, None))["replies"] == [0.1] * 2
+        assert time.monotonic() - start < 0.5
+
+    def test_row_executor_shared(self):
+        cloud_method = {
+            "routine_name": "routine",
+            "concurrency": 2,
+            "executor": None,
+            "executor_lock": threading.Lock(),
+        }
+        barrier = threading.Barrier(8)
+        executors = []
+
+        def get():
+            barrier.wait()
+            executors.append(BigQueryRemoteFunction._row_executor(cloud_method))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert all(e is cloud_method["executor"] for e in executors)
+        cloud_method["executor"].shutdown()
+
+    def test_call_rows_threaded_replaced_executor(self, monkeypatch):
+        cloud_method = {
+            "routine_name": "routine",
+            "func": lambda x: x,
+            "concurrency": 2,
+            "timeout": None,
+            "executor": None,
+            "executor_lock": threading.Lock(),
+        }
+        # a pool shut down by a timeout in another batch after this batch picked it
+        stale = ThreadPoolExecutor(max_workers=1)
+        stale.shutdown()
+        row_executor = BigQueryRemoteFunction._row_executor
+        executors = iter([stale])
+        monkeypatch.setattr(
+            BigQueryRemoteFunction,
+            "_row_executor",
+            staticmethod(lambda cm: next(executors, None) or row_executor(cm)),
+        )
+
+        assert BigQueryRemoteFunction._call_rows_threaded(
+            cloud_method, [(1,), (2,)]
+        ) == [1, 2]
+        assert cloud_method["executor"] not in (None, stale)
+        cloud_method["executor"].shutdown()
+
+    def test_call_bqremotefunction_cache(self, monkeypatch, caplog):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+        calls = []
+
+        @app.bqremotefunction(dataset_id="blogs", vectorize_func=True, cache=True)
+        def function_test(x: List[int]) -> List[int]:
+            calls.append(x)
+            return [i * 2 for i in x]
+
+        mock_request = Mock()
+        mock_request.json = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            "calls": [[1], [2], [1], [1]],
+        }
+        mock_request.headers = {}
+
+        assert json.loads(app(mock_request, None))["replies"] == [2, 4, 2, 2]
+        mock_request.json["calls"] = [[2], [3]]
+        with caplog.at_level("INFO", logger="goblet.deployer"):
+            assert json.loads(app(mock_request, None))["replies"] == [4, 6]
+        assert not [r for r in caplog.records if "cache served" in r.getMessage()]
+
+        assert calls == [[1, 2], [3]]
+        assert app.handlers["bqremotefunction"].cache_stats() == {
+            "bqremotefunction_test_function_test": {
+                "rows": 6,
+                "hits": 1,
+                "redis_hits": 0,
+                "computed": 3,
+                "hit_ratio": 0.5,
+            }
+        }
+
+    def test_call_bqremotefunction_streams_large_batches(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        monkeypatch.setattr("goblet.handlers.bq_remote_function.STREAM_REPLIES_ROWS", 3)
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+
+        @app.bqremotefunction(dataset_id="blogs")
+        def function_test(x: int) -> int:
+            return x * 2
+
+        mock_request = Mock()
+        mock_request.json = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            "calls": [[1], [2]],
+        }
+        mock_request.headers = {}
+
+        assert json.loads(app(mock_request, None))["replies"] == [2, 4]
+
+        mock_request.json["calls"] = [[1], [2], [3]]
+        response = app(mock_request, None)
+        body = b"".join(response({}, Mock()))
+        assert response.headers["Content-Type"] == "application/json"
+        assert json.loads(body)["replies"] == [2, 4, 6]
+
+    def test_call_bqremotefunction_logs_batch(self, monkeypatch, caplog):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        test_name = "bqremotefunction_test"
+        app = Goblet(function_name=test_name)
+
+        @app.bqremotefunction(dataset_id="blogs")
+        def function_test(x: int) -> int:
+            return x
+
+        mock_request = Mock()
+        mock_request.json = {
+            "userDefinedContext": {
+                "X-Goblet-Name": "bqremotefunction_test_function_test"
+            },
+            "calls": [[1], [2]],
+        }
+        mock_request.headers = {"Content-Length": "120"}
+
+        def batches():
+            return [r for r in caplog.records if hasattr(r, "json_fields")]
+
+        with caplog.at_level("INFO", logger="goblet.deployer"):
+            monkeypatch.setattr("random.random", lambda: 0.5)
+            app(mock_request, None)
+            assert batches() == []
+
+            monkeypatch.setattr("random.random", lambda: 0.01)
+            app(mock_request, None)
+
+        fields = batches()[-1].json_fields["bqremotefunction_batch"]
+        assert fields["routine"] == "bqremotefunction_test_function_test"
+        assert (fields["rows"], fields["bytes"]) == (2, 120)
+
+        with caplog.at_level("DEBUG", logger="goblet.deployer"):
+            monkeypatch.setattr("random.random", lambda: 0.5)
+            app(mock_request, None)
+        assert batches()[-1].levelname == "DEBUG"
+
+    def test_recommend_max_batching_rows(self):
+        recommend = BigQueryRemoteFunction.recommend_max_batching_rows
+
+        def samples(overhead, per_row, bytes_per_row=100):
+            return [
+                (rows, rows * bytes_per_row, overhead + rows * per_row)
+                for rows in range(100, 2100, 100)
+            ]
+
+        # more rows barely add throughput past 19 times the overhead
+        assert recommend(samples(0.5, 0.001), timeout=60) == 9500
+        # limited to half the timeout
+        assert recommend(samples(0, 0.01), timeout=60) == 3000
+        # limited by the request size
+        assert recommend(samples(0, 0.0001, bytes_per_row=10000), timeout=60) == 830
+        assert recommend(samples(0.5, 0.001)[:5], timeout=60) is None
+
+    def test_tune_bqremotefunction(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "TEST_PROJECT")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+
+        app = Goblet(
+            function_name="bqremotefunction_test",
+            config={
+                "bqremotefunction": {
+                    "max_batching_rows": {"bqremotefunction_test_tuned": 9500}
+                }
+            },
+        )
+
+        @app.bqremotefunction(dataset_id="blogs", max_batching_rows=50)
+        def slow(x: int) -> int:
+            return x
+
+        @app.bqremotefunction(dataset_id="blogs")
+        def tuned(x: int) -> int:
+            return x
+
+        @app.bqremotefunction(dataset_id="blogs")
+        def unused(x: int) -> int:
+            return x
+
+        handler = app.handlers["bqremotefunction"]
+        assert (
+            handler.max_batching_rows(handler.resources["bqremotefunction_test_slow"])
+            == 50
+        )
+        assert (
+            handler.max_batching_rows(handler.resources["bqremotefunction_test_tuned"])
+            == 9500
+        )
+
+        entries = [
+            {
+                "jsonPayload": {
+                    "bqremotefunction_batch": {
+                        "routine": routine,
+                        "rows": rows,
+                        "bytes": rows * 100,
+                        "seconds": 0.5 + rows * 0.001,
+                    }
+                }
+            }
+            for routine in ["bqremotefunction_test_slow", "bqremotefunction_test_tuned"]
+            for rows in range(100, 2100, 100)
+        ]
+        handler.versioned_clients = Mock()
+        handler.versioned_clients.logging_entries.execute.side_effect = [
+            {"entries": entries[:25], "nextPageToken": "token"},
+            {"entries": entries[25:]},
+        ]
+        handler.versioned_clients.bigquery_routines.execute.side_effect = [
+            {"remoteFunctionOptions": {"maxBatchingRows": "50"}},
+            {},
+        ]
+
+        results = handler.tune(apply=True)
+
+        assert [(r[0], r[1], r[3], r[4]) for r in results] == [
+            ("bqremotefunction_test_slow", 20, 50, 9500),
+            ("bqremotefunction_test_tuned", 20, 9500, 9500),
+            ("bqremotefunction_test_unused", 0, 0, None),
+        ]
+        # only the routine whose setting changed is updated
+        calls = handler.versioned_clients.bigquery_routines.execute.call_args_list
+        assert [c.args[0] for c in calls] == ["get", "update"]
+        assert calls[1].kwargs["params"]["routineId"] == "bqremotefunction_test_slow"
+        assert calls[1].kwargs["params"]["body"]["remoteFunctionOptions"] == {
+            "maxBatchingRows": "9500"
+        }
+
+    def test_result_cache_lru_ttl(self, monkeypatch):
+        now = [0]
+        monkeypatch.setattr(
+            "goblet.handlers.bq_remote_function.time.monotonic", lambda: now[0]
+        )
+        cache = ResultCache("function_test", maxsize=2, ttl=10)
+
+        cache.set_many({"a": 1, "b": 2})
+        assert cache.get_many(["a"]) == {"a": 1}
+        cache.set_many({"c": 3})
+        assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+        now[0] = 10
+        assert cache.get_many(["a", "c"]) == {}
+        assert not cache.entries
+
+    def test_result_cache_redis(self, monkeypatch):
+        store = {}
+
+        class FakeRedisError(Exception):
+            pass
+
+        class FakePipeline:
+            def __init__(self):
+                self.commands = []
+
+            def set(self, key, value, px=None):
+                self.commands.append((key, value, px))
+
+            def execute(self):
+                for key, value, px in self.commands:
+                    store[key] = (value.encode(), px)
+
+        class FakeRedis:
+            def __init__(self, host, port):
+                assert (host, port) == ("10.0.0.1", 6379)
+
+            def mget(self, keys):
+                return [store[key][0] if key in store else None for key in keys]
+
+            def pipeline(self, transaction=True):
+                return FakePipeline()
+
+        monkeypatch.setitem(
+            sys.modules,
+            "redis",
+            Mock(Redis=FakeRedis, RedisError=FakeRedisError),
+        )
+        monkeypatch.setenv("REDIS_HOST", "10.0.0.1")
+        monkeypatch.setenv("REDIS_PORT", "6379")
+        computed = []
+
+        def compute(rows):
+            computed.extend(rows)
+            return [row[0] * 2 for row in rows]
+
+        cache = ResultCache("function_test", ttl=60, redis=True)
+        assert cache.replies([[1], [2]], compute) == [2, 4]
+        assert [px for _, px in store.values()] == [60000, 60000]
+
+        # another instance shares the redis tier
+        cache = ResultCache("function_test", ttl=60, redis=True)
+        assert cache.replies([[1], [3]], compute) == [2, 6]
+        assert computed == [[1], [2], [3]]
+        assert cache.stats["redis_hits"] == 1
+
     def test_deploy_bqremotefunction(self, monkeypatch):
         test_deploy_name = "bqremotefunction-deploy"
         monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
@@ -0,0 +1,111 @@
+import threading
+from unittest.mock import Mock
+
+from goblet_gcp_client import client as gcp_client
+
+from goblet import client
+from goblet.client import ClientCache, VersionedClients, client_cache
+
+
+class TestClientCache:
+    def test_cache_hit(self, monkeypatch):
+        monkeypatch.delenv("G_HTTP_TEST", raising=False)
+        monkeypatch.setenv("G_MOCK_CREDENTIALS", "True")
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        client_cache.invalidate()
+
+        stats = client_cache.stats()
+        clients = [VersionedClients().pubsub_topic for _ in range(100)]
+        after = client_cache.stats()
+
+        assert all(c is clients[0] for c in clients)
+        assert after["misses"] - stats["misses"] == 1
+        assert after["hits"] - stats["hits"] == 99
+        assert VersionedClients().pubsub is not clients[0]
+
+        client_cache.invalidate("pubsub")
+        assert VersionedClients().pubsub_topic is not clients[0]
+        client_cache.invalidate()
+
+    def test_cache_per_project_and_location(self, monkeypatch):
+        monkeypatch.delenv("G_HTTP_TEST", raising=False)
+        monkeypatch.setenv("G_MOCK_CREDENTIALS", "True")
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        cache = ClientCache()
+
+        client = cache.get("run", "v2", regional=True)
+        assert cache.get("run", "v2", regional=True) is client
+
+        monkeypatch.setenv("GOOGLE_LOCATION", "europe-west1")
+        regional = cache.get("run", "v2", regional=True)
+        assert regional is not client
+        assert regional.location_id == "europe-west1"
+
+        monkeypatch.setenv("GOOGLE_PROJECT", "other")
+        assert cache.get("run", "v2", regional=True).project_id == "other"
+
+    def test_cache_per_thread(self, monkeypatch):
+        monkeypatch.delenv("G_HTTP_TEST", raising=False)
+        monkeypatch.setenv("G_MOCK_CREDENTIALS", "True")
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        cache = ClientCache()
+
+        main_client = cache.get("pubsub", "v1", calls="projects.topics")
+        thread_clients = []
+        thread = threading.Thread(
+            target=lambda: thread_clients.append(
+                cache.get("pubsub", "v1", calls="projects.topics")
+            )
+        )
+        thread.start()
+        thread.join()
+
+        assert thread_clients[0] is not main_client
+        assert thread_clients[0]._credentials is main_client._credentials
+
+    def test_cache_counters_threaded(self, monkeypatch):
+        monkeypatch.delenv("G_HTTP_TEST", raising=False)
+        monkeypatch.setenv("G_MOCK_CREDENTIALS", "True")
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        cache = ClientCache()
+
+        def get_many():
+            for _ in range(500):
+                cache.get("pubsub", "v1", calls="projects.topics")
+
+        threads = [threading.Thread(target=get_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        # a finished thread's ident can be reused, so threads may share a client
+        assert 1 <= stats["misses"] <= 8
+        assert stats["hits"] + stats["misses"] == 8 * 500
+
+    def test_cache_disabled_in_tests(self, monkeypatch):
+        monkeypatch.setenv("G_HTTP_TEST", "REPLAY")
+        cache = ClientCache()
+
+        assert cache.get("pubsub", "v1") is not cache.get("pubsub", "v1")
+        assert cache.stats() == {"hits": 0, "misses": 0, "size": 0}
+
+
+class TestDefaults:
+    def test_default_location_memoized(self, monkeypatch):
+        lookup = Mock(return_value="us-east1")
+        monkeypatch.setattr(gcp_client, "get_default_location", lookup)
+        monkeypatch.setattr(client, "_defaults", {})
+        for k in client.LOCATION_ENV_VARS:
+            monkeypatch.delenv(k, raising=False)
+
+        assert [client.get_default_location() for _ in range(10)] == ["us-east1"] * 10
+        lookup.assert_called_once()
+
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        assert client.get_default_location() == "us-central1"
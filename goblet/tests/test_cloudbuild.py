@@ -1,5 +1,8 @@
+import sys
+
 from goblet import Goblet
 from goblet.backends import CloudRun
+from goblet.write_files import write_dockerfile
 
 
 class TestCloudBuild:
@@ -43,6 +46,13 @@ class TestCloudBuild:
         assert ["-t", "registry:tag1"] in steps[1]["args"]
         assert ["-t", "registry:tag2"] in steps[1]["args"]
 
+    def test_cloudbuild_steps_docker_cache_buildkit(self):
+        steps = self.cloudbuild_steps(
+            config={"deploy": {"cloudbuild_cache": "DOCKER_LATEST"}}
+        )
+        assert steps[1]["env"] == ["DOCKER_BUILDKIT=1"]
+        assert ["--build-arg", "BUILDKIT_INLINE_CACHE=1"] in steps[1]["args"]
+
     def test_cloudbuild_steps_kaniko_cache_single_tag(self):
         steps = self.cloudbuild_steps(config={"deploy": {"cloudbuild_cache": "KANIKO"}})
         assert steps[0]["name"] == "gcr.io/kaniko-project/executor:latest"
@@ -75,3 +85,71 @@ class TestCloudBuild:
         steps = self.cloudbuild_steps(config={"deploy": {"cloudbuild_cache": "KANIKO"}})
         assert ["--build-arg", "BUILD_ARG01=arg01"] in steps[0]["args"]
         assert ["--build-arg", "BUILD_ARG02=arg02"] in steps[0]["args"]
+
+    def test_cloudbuild_steps_builder_stage_cache(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        write_dockerfile()
+        steps = self.cloudbuild_steps(
+            config={"deploy": {"cloudbuild_cache": "DOCKER_LATEST"}},
+            images=["registry:latest", "registry:tag1"],
+        )
+
+        # the builder stage is built from and pushed to its own cache image, so dependency layers are reused
+        assert len(steps) == 4
+        builder_args = steps[1]["args"]
+        assert builder_args[builder_args.index("--target") + 1] == "builder"
+        assert ["-t", "registry:builder-cache"] in builder_args
+        assert builder_args[builder_args.index("--cache-from") + 1] == (
+            "registry:builder-cache"
+        )
+        args = steps[2]["args"]
+        assert "--target" not in args
+        assert ["-t", "registry:tag1"] in args
+        assert [args[i + 1] for i, arg in enumerate(args) if arg == "--cache-from"] == [
+            "registry:builder-cache",
+            "registry:latest",
+        ]
+        assert steps[3]["args"] == ["push", "registry:builder-cache"]
+
+    def test_cloudbuild_steps_single_stage(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "Dockerfile").write_text("FROM python:3.11-slim\n")
+        steps = self.cloudbuild_steps(
+            config={"deploy": {"cloudbuild_cache": "DOCKER_LATEST"}}
+        )
+        assert len(steps) == 2
+        assert "--target" not in steps[1]["args"]
+
+    def test_default_dockerfile(self, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        write_dockerfile(
+            build_packages=["gcc", "libpq-dev"], system_packages=["libpq5"]
+        )
+        dockerfile = (tmp_path / "Dockerfile").read_text()
+
+        builder, runtime = dockerfile.split("\nFROM python:${PYTHON_VERSION}-slim\n")
+        version = f"{sys.version_info.major}.{sys.version_info.minor}"
+        assert f"ARG PYTHON_VERSION={version}" in builder
+        assert "AS builder" in builder
+        assert 'ARG BUILD_PACKAGES="gcc libpq-dev"' in builder
+        assert "--mount=type=cache,target=/root/.cache/pip" in builder
+        assert "pip wheel --wheel-dir /wheels" in builder
+        assert 'ARG SYSTEM_PACKAGES="libpq5"' in runtime
+        assert "COPY --from=builder /install /usr/local" in runtime
+        assert "pip" not in runtime
+
+        write_dockerfile(python_version="3.9", cache_mounts=False)
+        dockerfile = (tmp_path / "Dockerfile").read_text()
+        assert "ARG PYTHON_VERSION=3.9" in dockerfile
+        assert 'ARG BUILD_PACKAGES=""' in dockerfile
+        assert "--mount" not in dockerfile
+        assert "compileall" not in dockerfile
+
+        write_dockerfile(precompile=True)
+        assert "RUN python -m compileall" in (tmp_path / "Dockerfile").read_text()
+
+    def test_default_dockerfile_python_version(self):
+        assert CloudRun(Goblet(config={"runtime": "python310"}))._python_version() == (
+            "3.10"
+        )
+        assert CloudRun(Goblet())._python_version() is None
@@ -1,10 +1,12 @@
 import pytest
+from googleapiclient.errors import HttpError
+from httplib2 import Response as HttpResponse
 
 from goblet import Goblet, Response
 from goblet_gcp_client import get_response
 
 from goblet.infrastructures.cloudtask import CloudTaskClient
-from unittest.mock import Mock
+from unittest.mock import Mock, PropertyMock
 
 
 class TestCloudTasks:
@@ -136,6 +138,60 @@ class TestCloudTasks:
             == "eyJtZXNzYWdlIjogeyJ0aXRsZSI6ICJlbnF1ZXVlIn19"
         )
 
+    def test_enqueue_many(self, monkeypatch):
+        backend = Mock()
+        http_endpoint = PropertyMock(return_value="http_endpoint")
+        type(backend).http_endpoint = http_endpoint
+        attempts = {}
+
+        def create(api, parent_schema, params):
+            task = params["body"]["task"]
+            name = task["name"]
+            attempts[name] = attempts.get(name, 0) + 1
+            if name.endswith("throttled") and attempts[name] == 1:
+                raise HttpError(HttpResponse({"status": 429}), b"")
+            if name.endswith("invalid"):
+                raise HttpError(HttpResponse({"status": 400}), b"")
+            if name.endswith("lost"):
+                # created on the first attempt but the response was a 503
+                raise HttpError(
+                    HttpResponse({"status": 503 if attempts[name] == 1 else 409}), b""
+                )
+            if name.endswith("duplicate"):
+                raise HttpError(HttpResponse({"status": 409}), b"")
+            return {"name": name, "url": task["httpRequest"]["url"]}
+
+        versioned_clients = Mock()
+        versioned_clients.return_value.cloudtask.execute.side_effect = create
+        monkeypatch.setattr(
+            "goblet.infrastructures.cloudtask.VersionedClients", versioned_clients
+        )
+
+        client = CloudTaskClient("service_account", "queue", backend)
+        tasks = [
+            {"target": "target", "payload": {"i": i}, "task_name": str(i)}
+            for i in range(20)
+        ]
+        tasks[3]["task_name"] = "throttled"
+        tasks[5]["task_name"] = "invalid"
+        tasks[7]["task_name"] = "lost"
+        tasks[9]["task_name"] = "duplicate"
+        result = client.enqueue_many(tasks, max_workers=4, backoff=0)
+
+        assert http_endpoint.call_count == 1
+        assert len(result.responses) == 20
+        assert result.responses[0] == {"name": "queue/tasks/0", "url": "http_endpoint"}
+        assert result.responses[3]["name"] == "queue/tasks/throttled"
+        assert result.responses[5] is None
+        assert result.responses[7]["name"] == "queue/tasks/lost"
+        assert attempts["queue/tasks/lost"] == 2
+        assert [index for index, _ in result.failures] == [5, 9]
+        assert attempts["queue/tasks/invalid"] == 1
+        stats = result.stats()
+        assert stats["enqueued"] == 18
+        assert stats["failed"] == 2
+        assert stats["retries"] == 2
+
     def test_duplicate_targets(self):
         app = Goblet(function_name="goblet_example")
 
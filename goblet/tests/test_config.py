@@ -112,3 +112,32 @@ class TestGConfig:
         assert json.dumps(config.cloudfunction, sort_keys=True) == json.dumps(
             test_config["cloudfunction"], sort_keys=True
         )
+
+    def test_resolved_once(self, monkeypatch):
+        config = GConfig(test_config)
+        cloudfunction = config.cloudfunction
+        assert config.cloudfunction is cloudfunction
+
+        monkeypatch.setenv("cloudfunction", "env")
+        assert config.cloudfunction is cloudfunction
+        config.invalidate()
+        assert config.cloudfunction == "env"
+
+    def test_writes_invalidate(self):
+        config = GConfig(test_config)
+        cloudfunction = config.cloudfunction
+        config.update_g_config(values={"cloudfunction": {"timeout": 60}})
+        assert config.cloudfunction is not cloudfunction
+        assert config.cloudfunction.timeout == 60
+
+        config["deploy"] = {"concurrency": 2}
+        assert config.deploy.concurrency == 2
+        config.deploy.concurrency = 4
+        assert config.deploy.concurrency == 4
+        assert config.get("get") is None
+
+    def test_missing_section_not_cached(self):
+        config = GConfig(test_config)
+        config.missing.key = 1
+        assert not config.missing.key
+        assert "missing" not in config.config
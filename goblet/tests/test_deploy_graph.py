@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from goblet import Goblet
+from goblet.deploy_graph import DeployGraph
+from goblet.errors import GobletDeployError
+
+
+class TestDeployGraph:
+    def test_dependencies_run_in_order(self):
+        order = []
+        graph = DeployGraph(concurrency=4)
+        graph.add("infra1", lambda: order.append("infra1"))
+        graph.add("infra2", lambda: order.append("infra2"))
+        graph.add("backend", lambda: order.append("backend"), ["infra1", "infra2"])
+        graph.add("handler", lambda: order.append("handler"), ["backend"])
+
+        report = graph.run()
+
+        assert order.index("backend") > order.index("infra1")
+        assert order.index("backend") > order.index("infra2")
+        assert order[-1] == "handler"
+        assert [(name, status) for name, status, _ in report] == [
+            ("infra1", "success"),
+            ("infra2", "success"),
+            ("backend", "success"),
+            ("handler", "success"),
+        ]
+
+    def test_independent_steps_run_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+        graph = DeployGraph(concurrency=3)
+        for i in range(3):
+            graph.add(f"infra{i}", barrier.wait)
+
+        start = time.monotonic()
+        graph.run()
+        assert time.monotonic() - start < 5
+
+    def test_failed_dependency_skips_dependents(self):
+        ran = []
+        graph = DeployGraph(concurrency=2)
+
+        def fail():
+            raise ValueError("failed")
+
+        graph.add("infra1", fail)
+        graph.add("infra2", lambda: ran.append("infra2"))
+        graph.add("backend", lambda: ran.append("backend"), ["infra1"])
+
+        with pytest.raises(ValueError):
+            graph.run()
+        assert ran == ["infra2"]
+        assert [status for _, status, _ in graph.report()] == [
+            "failed",
+            "success",
+            "skipped",
+        ]
+
+    def test_errors_are_aggregated(self):
+        graph = DeployGraph(concurrency=2)
+
+        def fail():
+            raise ValueError("failed")
+
+        graph.add("infra1", fail)
+        graph.add("infra2", fail)
+
+        with pytest.raises(GobletDeployError) as e:
+            graph.run()
+        assert set(e.value.errors) == {"infra1", "infra2"}
+
+    def test_unknown_dependency(self):
+        graph = DeployGraph()
+        with pytest.raises(ValueError):
+            graph.add("backend", lambda: None, ["infra"])
+
+    def test_deploy_concurrency_config(self):
+        app = Goblet(function_name="goblet_example")
+        assert app.get_deploy_concurrency() == 1
+
+        app = Goblet(
+            function_name="goblet_example", config={"deploy": {"concurrency": 8}}
+        )
+        assert app.get_deploy_concurrency() == 8
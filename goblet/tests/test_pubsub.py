@@ -1,5 +1,11 @@
+import threading
+import time
+from base64 import b64decode, b64encode
+from collections import deque
+from unittest.mock import Mock
+
 from goblet import Goblet
-from goblet.infrastructures.pubsub import PubSubClient
+from goblet.infrastructures.pubsub import PubSubClient, PubSubMessage, PullSubscriber
 from goblet_gcp_client import (
     get_response,
     get_replay_count,
@@ -7,6 +13,55 @@ from goblet_gcp_client import (
 )
 
 
+class FakeSubscriptionClient:
+    """In memory pull subscription recording acknowledge and modifyAckDeadline requests"""
+
+    def __init__(self, count):
+        self.messages = deque(
+            {
+                "ackId": str(i),
+                "message": {"data": b64encode(str(i).encode()).decode()},
+            }
+            for i in range(count)
+        )
+        self.pulls = []
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def execute(self, method, parent_key, parent_schema, params):
+        body = params["body"]
+        with self.lock:
+            if method != "pull":
+                self.requests.append((method, body))
+                return {}
+            self.pulls.append(body["maxMessages"])
+            received = []
+            while self.messages and len(received) < body["maxMessages"]:
+                received.append(self.messages.popleft())
+        if not received:
+            time.sleep(0.01)
+        return {"receivedMessages": received}
+
+    def ack_ids(self, method, **body):
+        return sorted(
+            (
+                ack_id
+                for m, b in self.requests
+                if m == method
+                for ack_id in b["ackIds"]
+                if all(b.get(k) == v for k, v in body.items())
+            ),
+            key=int,
+        )
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
 class TestPubSub:
     def test_add_pubsub_topics(self):
         app = Goblet(function_name="goblet_example")
@@ -135,3 +190,233 @@ class TestPubSub:
         assert pubsub_topic.resources["test"]["id"] == "test"
         assert pubsub_topic.supports_local is True
         assert get_replay_count() == 1
+
+    def test_publish_many(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        monkeypatch.setenv("G_TEST_NAME", "pubsub-publish")
+        monkeypatch.setenv("G_HTTP_TEST", "REPLAY")
+
+        app = Goblet(function_name="goblet_example")
+        client = app.pubsub_topic(name="test")
+
+        message_ids = client.publish_many(
+            [{"key": "value"}, PubSubMessage(b"raw", attributes={"a": "b"})]
+        )
+
+        assert message_ids == ["1", "2"]
+
+    def test_publish_many_batches(self, monkeypatch):
+        client = PubSubClient("projects/goblet/topics/test")
+        batches = []
+
+        def publish_payloads(payloads):
+            batches.append(payloads)
+            return {"messageIds": [str(i) for i in range(len(payloads))]}
+
+        monkeypatch.setattr(client, "_publish_payloads", publish_payloads)
+
+        message_ids = client.publish_many(
+            [
+                PubSubMessage(i, attributes={"i": str(i)}, ordering_key="key")
+                for i in range(5)
+            ],
+            max_messages=2,
+        )
+        assert len(message_ids) == 5
+        assert [len(b) for b in batches] == [2, 2, 1]
+        assert batches[0][1] == {
+            "data": "MQ==",
+            "attributes": {"i": "1"},
+            "orderingKey": "key",
+        }
+
+        batches.clear()
+        client.publish_many([b"x" * 100] * 3, max_bytes=300)
+        assert [len(b) for b in batches] == [2, 1]
+
+        # capped at the publish request limit
+        batches.clear()
+        client.publish_many([b"x"] * 1500, max_messages=5000)
+        assert [len(b) for b in batches] == [1000, 500]
+
+    def test_batch_publisher(self, monkeypatch):
+        client = PubSubClient("projects/goblet/topics/test")
+        mock = Mock(
+            side_effect=lambda payloads: {
+                "messageIds": [b64decode(p["data"]).decode() for p in payloads]
+            }
+        )
+        monkeypatch.setattr(client, "_publish_payloads", mock)
+
+        with client.batch(max_messages=10, max_latency=60) as publisher:
+            futures = [publisher.publish(i) for i in range(25)]
+        assert [f.result() for f in futures] == [str(i) for i in range(25)]
+        assert [len(c.args[0]) for c in mock.call_args_list] == [10, 10, 5]
+
+        publisher = client.batch(max_messages=10, max_latency=0.01)
+        future = publisher.publish("latency")
+        assert future.result(timeout=5) == '"latency"'
+        publisher.close()
+
+    def test_batch_publisher_latency_follows_oldest(self, monkeypatch):
+        client = PubSubClient("projects/goblet/topics/test")
+        release = threading.Event()
+
+        def publish(payloads):
+            release.wait(5)
+            return {"messageIds": [p["data"] for p in payloads]}
+
+        monkeypatch.setattr(client, "_publish_payloads", publish)
+
+        publisher = client.batch(max_messages=2, max_latency=0.5)
+        publisher.publish("a")
+        publisher.publish("b")
+        # buffered while the first batch is still publishing
+        futures = [publisher.publish(m) for m in "cde"]
+        time.sleep(0.6)
+        release.set()
+        start = time.monotonic()
+        # e waited past its deadline behind the first batch, so it is not held for another max_latency
+        futures[-1].result(timeout=5)
+        assert time.monotonic() - start < 0.3
+        publisher.close()
+
+    def test_batch_publisher_error(self, monkeypatch):
+        client = PubSubClient("projects/goblet/topics/test")
+        monkeypatch.setattr(
+            client, "_publish_payloads", Mock(side_effect=ValueError("failed"))
+        )
+
+        publisher = client.batch()
+        future = publisher.publish("message")
+        publisher.flush()
+        assert isinstance(future.exception(), ValueError)
+        publisher.close()
+
+    def test_pull_subscriber(self):
+        client = FakeSubscriptionClient(25)
+        received = []
+
+        with PullSubscriber(
+            "projects/goblet/subscriptions/test",
+            lambda message: received.append(b64decode(message["data"]).decode()),
+            max_messages=10,
+            client=client,
+        ) as subscriber:
+            wait_for(lambda: len(received) == 25)
+
+        assert sorted(received, key=int) == [str(i) for i in range(25)]
+        assert client.ack_ids("acknowledge") == [str(i) for i in range(25)]
+        assert len(client.requests) < 25
+        assert max(client.pulls) == 10
+        assert subscriber.stats == {"received": 25, "acked": 25, "nacked": 0}
+
+    def test_pull_subscriber_nack(self):
+        client = FakeSubscriptionClient(4)
+
+        def callback(message):
+            if int(b64decode(message["data"])) % 2:
+                raise ValueError("failed")
+
+        with PullSubscriber(
+            "projects/goblet/subscriptions/test", callback, client=client
+        ) as subscriber:
+            wait_for(lambda: subscriber.stats["received"] == 4)
+
+        assert client.ack_ids("acknowledge") == ["0", "2"]
+        assert client.ack_ids("modifyAckDeadline", ackDeadlineSeconds=0) == ["1", "3"]
+        assert subscriber.stats == {"received": 4, "acked": 2, "nacked": 2}
+
+    def test_pull_subscriber_flow_control(self):
+        client = FakeSubscriptionClient(10)
+        release = threading.Event()
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def callback(message):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            release.wait(5)
+            with lock:
+                running[0] -= 1
+
+        with PullSubscriber(
+            "projects/goblet/subscriptions/test",
+            callback,
+            max_outstanding_messages=3,
+            client=client,
+        ) as subscriber:
+            wait_for(lambda: running[0] == 3)
+            time.sleep(0.1)
+            assert subscriber.stats["received"] == 3
+            release.set()
+            wait_for(lambda: subscriber.stats["received"] == 10)
+
+        assert running[1] == 3
+        assert max(client.pulls) == 3
+        assert client.ack_ids("acknowledge") == [str(i) for i in range(10)]
+
+    def test_pull_subscriber_lease_extension(self):
+        client = FakeSubscriptionClient(1)
+        release = threading.Event()
+
+        with PullSubscriber(
+            "projects/goblet/subscriptions/test",
+            lambda message: release.wait(5),
+            ack_deadline=0.2,
+            ack_latency=0.01,
+            client=client,
+        ):
+            wait_for(
+                lambda: len(client.ack_ids("modifyAckDeadline", ackDeadlineSeconds=0.2))
+                >= 3
+            )
+            release.set()
+
+        assert client.ack_ids("acknowledge") == ["0"]
+
+    def test_pull_subscriber_lease_on_receipt(self):
+        client = FakeSubscriptionClient(1)
+        release = threading.Event()
+
+        with PullSubscriber(
+            "projects/goblet/subscriptions/test",
+            lambda message: release.wait(5),
+            client=client,
+        ):
+            # leased when received, not ack_deadline / 2 after the subscriber started
+            wait_for(
+                lambda: client.ack_ids("modifyAckDeadline", ackDeadlineSeconds=60),
+                timeout=1,
+            )
+            release.set()
+
+        assert client.ack_ids("acknowledge") == ["0"]
+
+    def test_pull_subscriber_client_per_thread(self, monkeypatch):
+        client = FakeSubscriptionClient(1)
+        threads = set()
+
+        class Clients:
+            @property
+            def pubsub(self):
+                threads.add(threading.current_thread().name)
+                return client
+
+        monkeypatch.setattr("goblet.infrastructures.pubsub.VersionedClients", Clients)
+        subscriber = PullSubscriber("projects/goblet/subscriptions/test", Mock())
+        assert not threads
+        with subscriber:
+            wait_for(lambda: client.ack_ids("acknowledge"))
+
+        assert threading.current_thread().name not in threads
+        assert len(threads) == 2
+
+    def test_pull_subscriber_stop_before_start(self):
+        PullSubscriber(
+            "projects/goblet/subscriptions/test",
+            Mock(),
+            client=FakeSubscriptionClient(0),
+        ).stop()
@@ -1,9 +1,13 @@
 import base64
+import threading
 from unittest.mock import Mock
 
 import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
 
 from goblet import Goblet, Response
+from goblet.errors import GobletHandlerError
 from goblet.handlers.pubsub import PubSub
 from goblet.test_utils import (
     dummy_function,
@@ -142,6 +146,104 @@ class TestPubSubSubscription:
         with pytest.raises(Exception):
             app(event3, mock_context)
 
+    def test_call_indexed_attributes(self):
+        app = Goblet(function_name="goblet_example")
+        called = []
+
+        def consumer(name):
+            def func(data):
+                called.append(name)
+
+            func.__name__ = name
+            return func
+
+        app.pubsub_subscription("test")(consumer("all"))
+        for i in range(50):
+            app.pubsub_subscription("test", attributes={"type": f"t{i}"})(
+                consumer(f"type{i}")
+            )
+        app.pubsub_subscription("test", attributes={"type": "t3", "region": "eu"})(
+            consumer("type3_eu")
+        )
+        app.pubsub_subscription("test", attributes={"region": "eu", "type": "t4"})(
+            consumer("eu_type4")
+        )
+
+        mock_context = Mock()
+        mock_context.resource = "projects/GOOGLE_PROJECT/topics/test"
+        mock_context.event_type = "providers/cloud.pubsub/eventTypes/topic.publish"
+        data = base64.b64encode("test".encode())
+
+        app({"data": data, "attributes": {"type": "t3", "region": "eu"}}, mock_context)
+        assert called == ["all", "type3", "type3_eu"]
+
+        called.clear()
+        app({"data": data, "attributes": {"type": "t3"}}, mock_context)
+        assert called == ["all", "type3"]
+
+        index = app.handlers["pubsub"].attribute_index["test"]
+        assert len(index.by_attribute) == 51
+
+        # the index is rebuilt after registering
+        app.pubsub_subscription("test", attributes={"type": "t3"})(consumer("late"))
+        called.clear()
+        app({"data": data, "attributes": {"type": "t3"}}, mock_context)
+        assert called == ["all", "type3", "late"]
+
+    def test_call_fanout(self):
+        app = Goblet(function_name="goblet_example")
+        barrier = threading.Barrier(2, timeout=5)
+
+        @app.pubsub_subscription("test", fanout=True)
+        def first(data):
+            barrier.wait()
+            return "first"
+
+        @app.pubsub_subscription("test", fanout=True)
+        def second(data):
+            barrier.wait()
+            return Response("second", status_code=202)
+
+        @app.pubsub_subscription("test", attributes={"t": "1"}, fanout=True)
+        def filtered(data):
+            raise AssertionError("filtered out")
+
+        mock_context = Mock()
+        mock_context.resource = "projects/GOOGLE_PROJECT/topics/test"
+        mock_context.event_type = "providers/cloud.pubsub/eventTypes/topic.publish"
+        event = {"data": base64.b64encode("test".encode())}
+
+        # both functions wait for each other, so they must run concurrently
+        assert app(event, mock_context).status_code == 202
+
+    def test_call_fanout_errors(self):
+        app = Goblet(function_name="goblet_example")
+        ran = []
+
+        @app.pubsub_subscription("test", fanout=True)
+        def first(data):
+            raise ValueError("first")
+
+        @app.pubsub_subscription("test", fanout=True)
+        def second(data):
+            ran.append("second")
+
+        @app.pubsub_subscription("test", attributes={"t": "1"}, fanout=True)
+        def third(data):
+            raise KeyError("third")
+
+        mock_context = Mock()
+        mock_context.resource = "projects/GOOGLE_PROJECT/topics/test"
+        mock_context.event_type = "providers/cloud.pubsub/eventTypes/topic.publish"
+        data = base64.b64encode("test".encode())
+
+        with pytest.raises(ValueError):
+            app({"data": data}, mock_context)
+        with pytest.raises(GobletHandlerError) as e:
+            app({"data": data, "attributes": {"t": "1"}}, mock_context)
+        assert set(e.value.errors) == {"first", "third"}
+        assert ran == ["second", "second"]
+
     def test_call_subscription(self):
         app = Goblet(function_name="goblet_example")
 
@@ -187,6 +289,181 @@ class TestPubSubSubscription:
 
         assert mock.call_count == 1
 
+    def test_call_subscription_no_wrapper(self):
+        app = Goblet(function_name="goblet_example")
+        received = []
+
+        @app.pubsub_subscription(
+            "test", attributes={"t": "1"}, no_wrapper=True, data_type=bytes
+        )
+        def binary(data):
+            received.append(data)
+
+        @app.pubsub_subscription("test", attributes={"t": "2"}, data_type=bytes)
+        def other(data):
+            raise AssertionError("filtered out")
+
+        payload = b"\x00\xff" * 1024
+        request = Request(
+            EnvironBuilder(
+                path="/",
+                method="POST",
+                data=payload,
+                content_type="application/octet-stream",
+                headers={
+                    "X-Goog-Pubsub-Subscription-Name": "projects/goblet/subscriptions/goblet_example-test",
+                    "X-Goog-Pubsub-Message-Id": "1",
+                    "t": "1",
+                },
+            ).get_environ()
+        )
+
+        assert app(request, None) == "success"
+        assert received == [payload]
+        assert app.handlers["pubsub"].resources["test"]["subscription"]["binary"][
+            "no_wrapper"
+        ]
+
+    def test_call_data_types(self):
+        app = Goblet(function_name="goblet_example")
+        received = {}
+
+        def consumer(name, data_type):
+            def func(data):
+                received[name] = data
+
+            func.__name__ = name
+            app.pubsub_subscription("test", data_type=data_type)(func)
+
+        consumer("text", str)
+        consumer("bytes1", bytes)
+        consumer("bytes2", bytes)
+        consumer("view", memoryview)
+
+        mock_context = Mock()
+        mock_context.resource = "projects/GOOGLE_PROJECT/topics/test"
+        mock_context.event_type = "providers/cloud.pubsub/eventTypes/topic.publish"
+        app({"data": base64.b64encode("tést".encode())}, mock_context)
+
+        assert received["text"] == "tést"
+        assert received["bytes1"] == "tést".encode()
+        # converted once per data type
+        assert received["bytes1"] is received["bytes2"]
+        assert isinstance(received["view"], memoryview)
+        assert received["view"].obj is received["bytes1"]
+
+        with pytest.raises(ValueError):
+            app.pubsub_subscription("test", data_type=list)(dummy_function)
+
+    def test_deploy_subscription_no_wrapper(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        create_subscription = Mock()
+        monkeypatch.setattr(
+            "goblet.handlers.pubsub.create_pubsub_subscription", create_subscription
+        )
+
+        app = Goblet(
+            function_name="goblet_example",
+            config={
+                "pubsub": {"serviceAccountEmail": "sa@goblet.iam.gserviceaccount.com"}
+            },
+        )
+        app.pubsub_subscription("test", no_wrapper=True)(dummy_function)
+        pubsub = app.handlers["pubsub"]
+        topic = pubsub.resources["test"]["subscription"]["dummy_function"]
+
+        pubsub._deploy_subscription("test", topic)
+
+        push_config = create_subscription.call_args.kwargs["req_body"]["pushConfig"]
+        assert push_config["noWrapper"] == {"writeMetadata": True}
+
+    def test_pull(self, monkeypatch):
+        app = Goblet(function_name="goblet_example")
+        received = []
+
+        @app.pubsub_subscription("test", mode="pull", attributes={"t": "a"})
+        def first(data):
+            received.append(("first", data))
+
+        @app.pubsub_subscription("test", mode="pull", data_type=bytes)
+        async def second(data):
+            received.append(("second", data))
+
+        pubsub = app.handlers["pubsub"]
+        assert list(pubsub.resources["test"]["pull"]) == ["first", "second"]
+        assert not pubsub.is_http()
+
+        subscribers = {}
+
+        class Subscriber:
+            def __init__(self, subscription, callback, **kwargs):
+                subscribers[subscription] = (callback, kwargs)
+
+            def start(self):
+                return self
+
+            def wait(self, timeout):
+                return True
+
+            stop = Mock()
+
+        monkeypatch.setattr("goblet.handlers.pubsub.PullSubscriber", Subscriber)
+        pubsub.pull(max_workers=2)
+
+        callback, kwargs = subscribers[
+            "projects/{project_id}/subscriptions/goblet_example-test-pull"
+        ]
+        assert kwargs == {"ack_deadline": 60, "max_workers": 2}
+        assert Subscriber.stop.call_count == 1
+        callback({"data": base64.b64encode(b"one").decode()})
+        callback({"data": base64.b64encode(b"two").decode(), "attributes": {"t": "a"}})
+        assert received == [
+            ("second", b"one"),
+            ("first", "two"),
+            ("second", b"two"),
+        ]
+        with pytest.raises(ValueError):
+            pubsub.pull(topics=["missing"])
+
+    def test_deploy_pull_subscription(self, monkeypatch):
+        monkeypatch.setenv("GOOGLE_PROJECT", "goblet")
+        monkeypatch.setenv("GOOGLE_LOCATION", "us-central1")
+        create_subscription = Mock()
+        destroy_subscription = Mock()
+        monkeypatch.setattr(
+            "goblet.handlers.pubsub.create_pubsub_subscription", create_subscription
+        )
+        monkeypatch.setattr(
+            "goblet.handlers.pubsub.destroy_pubsub_subscription", destroy_subscription
+        )
+
+        app = Goblet(function_name="goblet_example")
+        app.pubsub_subscription(
+            "test",
+            mode="pull",
+            attributes={"t": "a"},
+            config={"ackDeadlineSeconds": 120},
+        )(dummy_function)
+        app.pubsub_subscription("test", mode="pull", filter='attributes.t = "b"')(
+            mock_dummy_function
+        )
+        pubsub = app.handlers["pubsub"]
+
+        pubsub._deploy()
+        pubsub.destroy()
+
+        kwargs = create_subscription.call_args.kwargs
+        assert create_subscription.call_count == 1
+        assert kwargs["sub_name"] == "goblet_example-test-pull"
+        assert kwargs["req_body"]["topic"] == "projects/goblet/topics/test"
+        assert kwargs["req_body"]["filter"] == (
+            '(attributes.t = "a") OR (attributes.t = "b")'
+        )
+        assert kwargs["req_body"]["ackDeadlineSeconds"] == 120
+        assert "pushConfig" not in kwargs["req_body"]
+        assert destroy_subscription.call_args.args[1] == "goblet_example-test-pull"
+
     def test_context(self):
         app = Goblet(function_name="goblet_example")
 
@@ -183,6 +183,60 @@ class TestRoutes:
         app(mock_event1, None)
         assert mock.call_count == 1
 
+    def test_call_route_static_priority(self):
+        app = Goblet(function_name="goblet_example")
+
+        @app.route("/home/{home_id}")
+        def home_param(home_id):
+            return f"param {home_id}"
+
+        @app.route("/home/latest")
+        def home_static():
+            return "static"
+
+        @app.route("/home/{home_id}/rooms/{room_id}", methods=["POST"])
+        def room(home_id, room_id):
+            return f"{home_id} {room_id}"
+
+        mock_event = Mock()
+        mock_event.headers = {}
+        mock_event.json = {}
+
+        mock_event.method = "GET"
+        mock_event.path = "/home/latest"
+        assert app(mock_event, None) == "static"
+        mock_event.path = "/home/5"
+        assert app(mock_event, None) == "param 5"
+
+        mock_event.method = "POST"
+        mock_event.path = "/home/latest/rooms/2"
+        assert app(mock_event, None) == "latest 2"
+
+        mock_event.method = "GET"
+        mock_event.path = "/home/5/rooms/2"
+        resp = app(mock_event, None)
+        assert resp.status_code == 404
+
+    def test_route_trie_match(self):
+        gw = Routes("goblet_example", backend=CloudFunctionV1(Goblet()))
+        for i in range(300):
+            gw.register(
+                f"f{i}",
+                dummy_function,
+                {
+                    "path": f"/resource{i}/{{item_id}}/sub/{{sub_id}}",
+                    "methods": ["GET"],
+                    "kwargs": {},
+                },
+            )
+
+        entry, view_args = gw.route_trie.match("/resource150/a/sub/b", "GET")
+        assert entry.function_name == "f150"
+        assert view_args == {"item_id": "a", "sub_id": "b"}
+        assert gw.route_trie.match("/resource150/a/sub", "GET") == (None, None)
+        assert gw.route_trie.match("/resource150//sub/b", "GET") == (None, None)
+        assert gw.route_trie.match("/resource150/a/sub/b", "POST") == (None, None)
+
     def test_cors(self):
         app = Goblet(function_name="goblet_cors")
         app2 = Goblet(
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from goblet import serialization
+
+
+@pytest.fixture(params=serialization.JSON_BACKENDS)
+def backend(request):
+    try:
+        yield serialization.set_backend(request.param)
+    except ImportError:
+        pytest.skip(f"{request.param} is not installed")
+    finally:
+        serialization.set_backend()
+
+
+class TestSerialization:
+    def test_round_trip(self, backend):
+        value = {"replies": [1, 2.5, "é", None, True, [1, {"a": "b"}]]}
+
+        assert serialization.get_backend() == backend
+        assert json.loads(serialization.dumps(value)) == value
+        assert serialization.loads(serialization.dumps_bytes(value)) == value
+        assert serialization.loads(json.dumps(value).encode()) == value
+
+    def test_unsupported_values_fall_back_to_json(self, backend):
+        assert serialization.dumps([2**70]) == "[1180591620717411303424]"
+
+    def test_non_finite_floats_match_json(self, backend):
+        value = {"replies": [1.5, float("nan"), float("inf"), -float("inf"), None]}
+
+        assert serialization.dumps(value) == json.dumps(value)
+        assert serialization.dumps([None]) == "[null]"
+
+    def test_iter_object_array(self, backend):
+        for count in [0, 1, 3, 4, 7]:
+            chunks = list(
+                serialization.iter_object_array("replies", range(count), chunk_size=3)
+            )
+            assert json.loads(b"".join(chunks)) == {"replies": list(range(count))}
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            serialization.set_backend("simplejson")
@@ -1,5 +1,6 @@
 import os
 import importlib.util
+import inspect
 import collections.abc
 from contextlib import contextmanager
 import sys
@@ -29,6 +30,23 @@ def checksum(fh, hasher, blocksize=65536):
     return hasher.digest()
 
 
+def then(result, func):
+    """Applies func to a handler result. Awaitable results from async handlers are wrapped in a coroutine that applies
+    func once the result is awaited"""
+    if inspect.isawaitable(result):
+
+        async def _then():
+            return func(await result)
+
+        return _then()
+    return func(result)
+
+
+async def gather_results(results):
+    """Awaits any awaitable results in order"""
+    return [await r if inspect.isawaitable(r) else r for r in results]
+
+
 def get_app_from_module(m):
     from goblet import Goblet
 
@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 
 from goblet.utils import get_g_dir, get_dir
 from goblet.__version__ import __version__
@@ -60,27 +61,74 @@ To check out goblet documentation go to [docs](https://goblet.github.io/goblet/b
         )
 
 
-def write_dockerfile():
+def write_dockerfile(
+    python_version=None,
+    build_packages=(),
+    system_packages=(),
+    cache_mounts=True,
+    precompile=False,
+):
+    """Writes a multi-stage Dockerfile. Wheels for requirements.txt are built and installed in a builder stage with
+    build_packages, and only the installed packages are copied to a slim runtime stage with system_packages. The
+    python version defaults to the local version. Both package lists can be overridden with the BUILD_PACKAGES and
+    SYSTEM_PACKAGES build args. cache_mounts keeps the pip cache in a BuildKit cache mount between builds, and
+    precompile compiles the app to bytecode when the image is built
+    """
+    python_version = (
+        python_version or f"{sys.version_info.major}.{sys.version_info.minor}"
+    )
+    if cache_mounts:
+        pip = "RUN --mount=type=cache,target=/root/.cache/pip \\\n    pip"
+    else:
+        pip = "RUN pip --no-cache-dir"
+    compile_app = ""
+    if precompile:
+        compile_app = (
+            "\n# Precompile the app, so modules are not compiled on cold start.\n"
+            "RUN python -m compileall -q -j 0 --invalidation-mode unchecked-hash .\n"
+        )
     with open(f"{get_dir()}/Dockerfile", "w") as f:
         f.write(
-            """\
+            f"""\
+# syntax=docker/dockerfile:1
 # https://hub.docker.com/_/python
-FROM python:3.10-slim
+ARG PYTHON_VERSION={python_version}
 
-# setup environment
-ENV APP_HOME /app
-WORKDIR $APP_HOME
+FROM python:${{PYTHON_VERSION}}-slim AS builder
+
+# system packages needed to build wheels, such as gcc or libpq-dev
+ARG BUILD_PACKAGES="{' '.join(build_packages)}"
+RUN if [ -n "$BUILD_PACKAGES" ]; then \\
+    apt-get update && apt-get install -y --no-install-recommends $BUILD_PACKAGES; fi
 
 # install keyring backend to handle artifact registry authentication
 # RUN pip install keyrings.google-artifactregistry-auth==1.1.1
 
-# Install dependencies.
+# Build wheels for all dependencies and install them to /install.
 COPY requirements.txt .
-RUN pip install -r requirements.txt
+{pip} wheel --wheel-dir /wheels -r requirements.txt
+RUN pip install --no-cache-dir --no-index --find-links /wheels --prefix /install \\
+    -r requirements.txt
+
+FROM python:${{PYTHON_VERSION}}-slim
+
+# system packages needed at runtime, such as libpq5
+ARG SYSTEM_PACKAGES="{' '.join(system_packages)}"
+RUN if [ -n "$SYSTEM_PACKAGES" ]; then \\
+    apt-get update && apt-get install -y --no-install-recommends $SYSTEM_PACKAGES \\
+    && rm -rf /var/lib/apt/lists/*; fi
+
+# setup environment
+ENV APP_HOME /app
+ENV PYTHONUNBUFFERED 1
+WORKDIR $APP_HOME
+
+# Copy only the installed dependencies from the builder.
+COPY --from=builder /install /usr/local
 
 # Copy local code to the container image.
 COPY . .
-
+{compile_app}
 # Run the web service on container startup.
 CMD exec functions-framework --target=goblet_entrypoint
 """